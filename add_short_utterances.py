@@ -3,7 +3,7 @@
 
 import os
 import uuid
-from pinecone import Pinecone
+from vector_store import get_vector_store
 from nemo.collections.asr.models import EncDecSpeakerLabelModel
 import numpy as np
 import torch
@@ -13,9 +13,8 @@ os.environ["TRANSFORMERS_CACHE"] = os.path.join(os.getcwd(), "hf_cache")
 os.environ["HF_HOME"] = os.path.join(os.getcwd(), "hf_cache")
 os.makedirs(os.path.join(os.getcwd(), "hf_cache"), exist_ok=True)
 
-# Initialize Pinecone
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pc.Index("speaker-embeddings")
+# Shared Pinecone client
+index = get_vector_store()
 
 # Short utterances for Mike Shaffer
 mike_short_files = [
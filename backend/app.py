@@ -1,20 +1,55 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
+from flask_sock import Sock
+from simple_websocket import ConnectionClosed
+import io
 import os
 import sys
 import json
 import uuid
+import hashlib
+import shutil
 from datetime import datetime
 import logging
 
+from pydub import AudioSegment
+
 # Setup path for importing from parent directory
 sys.path.append(os.path.abspath(os.path.dirname(__file__)))
 
 # Import existing scripts
-from utils.process_manager import start_processing, get_processing_status
-from speaker_id_testing import process_conversation
+from utils.process_manager import (
+    start_processing,
+    start_reidentification,
+    start_relabel,
+    record_duplicate_upload,
+    get_processing_status,
+)
+from utils.stream_manager import StreamingSession
+from utils.response_cache import get_cached_response, invalidate_conversation
+from utils.upload_manager import (
+    UploadError,
+    create_upload,
+    write_chunk,
+    get_upload_status,
+    complete_upload,
+    discard_upload,
+)
+from speaker_id_testing import processing_config
 from update_speaker_db_verified import update_speaker_database
-from rename_speaker import rename_speaker_in_conversation
+from rename_speaker import rename_speaker_across_archive
+from export_conversations import iter_export_records, iter_ndjson, parse_date_bound
+from transcript_search import search_utterances
+from voice_search import search_by_clip, request_voice_index_sync
+from segment_store import get_segment_wav
+from conversation_index import (
+    index_log_path,
+    load_index,
+    remove_conversation,
+    get_speaker_stats,
+    find_conversation_by_hash,
+)
+from utterance_log import UTTERANCE_LOG_FILE, read_utterance_log, compact_records
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
@@ -34,13 +69,24 @@ CORS(app, resources={
     }
 })
 
+# WebSocket support for live streaming identification
+sock = Sock(app)
+
 # Configuration
 UPLOAD_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'uploads'))
 CONVERSATIONS_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'processed_conversations'))
 
+# How often the streaming endpoint checks for labels while no audio arrives
+STREAM_POLL_SECONDS = 0.1
+
 # Create upload directory if it doesn't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+def get_voice_index():
+    """Get the Pinecone index holding the speaker embeddings"""
+    from speaker_id_testing import index
+    return index
+
 # Simple health check endpoint
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -51,6 +97,41 @@ def health_check():
         "service": "speaker-id-api"
     })
 
+def format_segment(utterance):
+    """Format an utterance as a transcript segment for the frontend"""
+    return {
+        'id': utterance.get('id', ''),
+        'start': utterance.get('start_ms', 0) / 1000,  # Convert to seconds
+        'end': utterance.get('end_ms', 0) / 1000,      # Convert to seconds
+        'text': utterance.get('text', ''),
+        'speaker': {
+            'speakerId': utterance.get('embedding_id', ''),
+            'speakerName': utterance.get('speaker', 'Unknown'),
+            'confidence': utterance.get('confidence', 0) * 100,  # Convert to percentage
+            'isUnknown': utterance.get('speaker', '').lower() == 'unknown'
+        }
+    }
+
+def cached_json_response(entry):
+    """Send a cached JSON body, honouring If-None-Match and Accept-Encoding"""
+    if entry['etag'] in request.if_none_match:
+        response = Response(status=304)
+    else:
+        accepted = request.accept_encodings
+        if entry['br'] is not None and accepted['br']:
+            response = Response(entry['br'], mimetype='application/json')
+            response.headers['Content-Encoding'] = 'br'
+        elif entry['gzip'] is not None and accepted['gzip']:
+            response = Response(entry['gzip'], mimetype='application/json')
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = Response(entry['identity'], mimetype='application/json')
+    
+    response.headers['ETag'] = entry['etag']
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/api/conversations', methods=['GET'])
 def get_conversations():
     """Get all processed conversations"""
@@ -87,19 +168,7 @@ def get_conversations():
                         
                         # Add utterances as segments
                         for utterance in metadata.get('utterances', []):
-                            segment = {
-                                'id': utterance.get('id', ''),
-                                'start': utterance.get('start_ms', 0) / 1000,  # Convert to seconds
-                                'end': utterance.get('end_ms', 0) / 1000,      # Convert to seconds
-                                'text': utterance.get('text', ''),
-                                'speaker': {
-                                    'speakerId': utterance.get('embedding_id', ''),
-                                    'speakerName': utterance.get('speaker', 'Unknown'),
-                                    'confidence': utterance.get('confidence', 0) * 100,  # Convert to percentage
-                                    'isUnknown': utterance.get('speaker', '').lower() == 'unknown'
-                                }
-                            }
-                            conversation_summary['segments'].append(segment)
+                            conversation_summary['segments'].append(format_segment(utterance))
                         
                         conversations.append(conversation_summary)
                     except Exception as e:
@@ -122,10 +191,22 @@ def get_conversation(conversation_id):
         return jsonify({"error": "Conversation not found"}), 404
     
     metadata_path = os.path.join(conversation_path, 'metadata.json')
+    log_path = os.path.join(conversation_path, UTTERANCE_LOG_FILE)
     if not os.path.exists(metadata_path):
+        if os.path.exists(log_path):
+            # Still processing - serve the utterances finished so far
+            records, _ = read_utterance_log(log_path)
+            return jsonify({
+                'id': conversation_id,
+                'filename': 'Unknown',
+                'duration': 0,
+                'created': datetime.now().isoformat(),
+                'partial': True,
+                'segments': [format_segment(u) for u in compact_records(records)]
+            })
         return jsonify({"error": "Conversation metadata not found"}), 404
     
-    try:
+    def build_body():
         with open(metadata_path, 'r') as f:
             metadata = json.load(f)
         
@@ -140,77 +221,264 @@ def get_conversation(conversation_id):
         
         # Add utterances as segments
         for utterance in metadata.get('utterances', []):
-            segment = {
-                'id': utterance.get('id', ''),
-                'start': utterance.get('start_ms', 0) / 1000,
-                'end': utterance.get('end_ms', 0) / 1000,
-                'text': utterance.get('text', ''),
-                'speaker': {
-                    'speakerId': utterance.get('embedding_id', ''),
-                    'speakerName': utterance.get('speaker', 'Unknown'),
-                    'confidence': utterance.get('confidence', 0) * 100,
-                    'isUnknown': utterance.get('speaker', '').lower() == 'unknown'
-                }
-            }
-            conversation['segments'].append(segment)
+            conversation['segments'].append(format_segment(utterance))
         
-        return jsonify(conversation)
+        return json.dumps(conversation).encode('utf-8')
+    
+    try:
+        # Repeated opens are served from the cache until metadata.json changes
+        return cached_json_response(get_cached_response(metadata_path, build_body))
     except Exception as e:
         logger.error(f"Error retrieving conversation {conversation_id}: {str(e)}")
         return jsonify({"error": f"Error retrieving conversation: {str(e)}"}), 500
 
+@app.route('/api/conversations/<conversation_id>', methods=['DELETE'])
+def delete_conversation(conversation_id):
+    """Delete a processed conversation and remove it from the speaker statistics"""
+    conversation_path = os.path.join(CONVERSATIONS_FOLDER, conversation_id)
+    if os.path.dirname(os.path.abspath(conversation_path)) != CONVERSATIONS_FOLDER or not os.path.isdir(conversation_path):
+        return jsonify({"error": "Conversation not found"}), 404
+    
+    try:
+        shutil.rmtree(conversation_path)
+        remove_conversation(CONVERSATIONS_FOLDER, conversation_id)
+        invalidate_conversation(conversation_path)
+        request_voice_index_sync(CONVERSATIONS_FOLDER)
+        return jsonify({"success": True, "id": conversation_id})
+    except Exception as e:
+        logger.error(f"Error deleting conversation {conversation_id}: {str(e)}")
+        return jsonify({"error": f"Error deleting conversation: {str(e)}"}), 500
+
+@app.route('/api/conversations/<conversation_id>/utterances', methods=['GET'])
+def tail_conversation_utterances(conversation_id):
+    """
+    Tail the utterances of a conversation that is still being processed.
+    
+    Pass the returned offset back as ?offset= to receive only the utterances
+    finished since the previous call. Once processing has finished, complete
+    is true and the final result is available from /api/conversations/<id>.
+    """
+    conversation_path = os.path.join(CONVERSATIONS_FOLDER, conversation_id)
+    if not os.path.isdir(conversation_path):
+        return jsonify({"error": "Conversation not found"}), 404
+    
+    offset = request.args.get('offset', 0, type=int)
+    log_path = os.path.join(conversation_path, UTTERANCE_LOG_FILE)
+    if os.path.exists(log_path):
+        records, next_offset = read_utterance_log(log_path, offset)
+        return jsonify({
+            "segments": [format_segment(u) for u in records],
+            "offset": next_offset,
+            "complete": False
+        })
+    
+    return jsonify({"segments": [], "offset": offset, "complete": True})
+
+@app.route('/api/conversations/reidentify', methods=['POST'])
+def reidentify_conversations_endpoint():
+    """Re-identify speakers in stored conversations against the current speaker database"""
+    data = request.json or {}
+    
+    # Default to the whole archive
+    conversation_ids = data.get('conversationIds')
+    if conversation_ids:
+        conversation_paths = [os.path.join(CONVERSATIONS_FOLDER, cid) for cid in conversation_ids]
+        missing = [cid for cid, path in zip(conversation_ids, conversation_paths) if not os.path.isdir(path)]
+        if missing:
+            return jsonify({"error": f"Conversations not found: {', '.join(missing)}"}), 404
+    else:
+        conversation_paths = [
+            os.path.join(CONVERSATIONS_FOLDER, d) for d in sorted(os.listdir(CONVERSATIONS_FOLDER))
+        ]
+    
+    min_confidence = data.get('minConfidence', 50) / 100  # Convert from percentage
+    
+    try:
+        process_id = f"reidentify_{str(uuid.uuid4())[:8]}"
+        status = start_reidentification(conversation_paths, process_id, min_confidence)
+        
+        return jsonify({
+            "id": process_id,
+            "status": status['status'],
+            "progress": status['progress']
+        })
+    except Exception as e:
+        logger.error(f"Error starting re-identification: {str(e)}")
+        return jsonify({"error": f"Error starting re-identification: {str(e)}"}), 500
+
+@app.route('/api/export', methods=['GET'])
+def export_conversations():
+    """
+    Stream the archive as newline-delimited JSON.
+    
+    Query parameters: level (utterance or conversation), from, to (ISO dates),
+    speaker (repeatable) and minConfidence (percentage). Records are written
+    as they are read, so memory use does not grow with the archive.
+    """
+    level = request.args.get('level', 'utterance')
+    if level not in ('utterance', 'conversation'):
+        return jsonify({"error": "level must be 'utterance' or 'conversation'"}), 400
+    
+    try:
+        date_from = parse_date_bound(request.args.get('from'))
+        date_to = parse_date_bound(request.args.get('to'), end=True)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid date: {str(e)}"}), 400
+    
+    min_confidence = request.args.get('minConfidence', type=float)
+    if min_confidence is not None:
+        min_confidence /= 100  # Convert from percentage
+    
+    records = iter_export_records(
+        CONVERSATIONS_FOLDER,
+        level=level,
+        date_from=date_from,
+        date_to=date_to,
+        speakers=request.args.getlist('speaker'),
+        min_confidence=min_confidence
+    )
+    
+    return Response(
+        stream_with_context(iter_ndjson(records)),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename=export_{level}s.ndjson'}
+    )
+
+@app.route('/api/search', methods=['GET'])
+def search_transcripts():
+    """
+    Full-text search over all utterances, best matches first.
+    
+    Query parameters: q, speaker and conversation (repeatable), from and to
+    (ISO dates the conversation was processed), startTime and endTime
+    (seconds within the conversation), limit and offset.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Missing search query"}), 400
+    
+    try:
+        date_from = parse_date_bound(request.args.get('from'))
+        date_to = parse_date_bound(request.args.get('to'), end=True)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid date: {str(e)}"}), 400
+    
+    start_time = request.args.get('startTime', type=float)
+    end_time = request.args.get('endTime', type=float)
+    
+    try:
+        results = search_utterances(
+            query,
+            CONVERSATIONS_FOLDER,
+            speakers=request.args.getlist('speaker'),
+            conversation_ids=request.args.getlist('conversation'),
+            date_from=date_from,
+            date_to=date_to,
+            start_ms=int(start_time * 1000) if start_time is not None else None,  # Convert to milliseconds
+            end_ms=int(end_time * 1000) if end_time is not None else None,
+            limit=min(request.args.get('limit', 50, type=int), 500),
+            offset=request.args.get('offset', 0, type=int)
+        )
+    except Exception as e:
+        logger.error(f"Error searching transcripts for '{query}': {str(e)}")
+        return jsonify({"error": f"Error searching transcripts: {str(e)}"}), 500
+    
+    return jsonify([
+        {
+            'conversationId': result['conversation_id'],
+            'segmentId': result['utterance_id'],
+            'start': result['start_ms'] / 1000,  # Convert to seconds
+            'end': result['end_ms'] / 1000,      # Convert to seconds
+            'speakerName': result['speaker'],
+            'confidence': result['confidence'] * 100,  # Convert to percentage
+            'text': result['text'],
+            'snippet': result['snippet'],
+            'score': result['score']
+        }
+        for result in results
+    ])
+
+@app.route('/api/search/voice', methods=['POST'])
+def search_by_voice():
+    """
+    Find the processed utterances that sound like an uploaded clip.
+    
+    Form fields: file (audio clip), topK, nprobe and minSimilarity (percentage).
+    """
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({"error": "No file part"}), 400
+    
+    file = request.files['file']
+    file_path = os.path.join(UPLOAD_FOLDER, f"voice_query_{str(uuid.uuid4())[:8]}_{file.filename}")
+    
+    min_similarity = request.form.get('minSimilarity', type=float)
+    if min_similarity is not None:
+        min_similarity /= 100  # Convert from percentage
+    
+    try:
+        file.save(file_path)
+        results = search_by_clip(
+            AudioSegment.from_file(file_path),
+            CONVERSATIONS_FOLDER,
+            top_k=min(request.form.get('topK', 20, type=int), 500),
+            nprobe=request.form.get('nprobe', 16, type=int),
+            min_similarity=min_similarity
+        )
+    except Exception as e:
+        logger.error(f"Error searching by voice: {str(e)}")
+        return jsonify({"error": f"Error searching by voice: {str(e)}"}), 500
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    
+    return jsonify([
+        {
+            'conversationId': result['conversation_id'],
+            'segmentId': result['utterance_id'],
+            'start': result['start_ms'] / 1000,  # Convert to seconds
+            'end': result['end_ms'] / 1000,      # Convert to seconds
+            'speakerName': result['speaker'],
+            'text': result['text'],
+            'similarity': result['similarity'] * 100  # Convert to percentage
+        }
+        for result in results
+    ])
+
 @app.route('/api/speakers', methods=['GET'])
 def get_speakers():
     """Get all speakers from processed conversations"""
-    speakers = {}
+    # Statistics are maintained in the conversation index as conversations
+    # are processed, renamed, re-identified or deleted. Every change is
+    # appended to the index log, so the cached body is keyed on the log
+    stats_path = index_log_path(CONVERSATIONS_FOLDER)
+    if not os.path.exists(stats_path):
+        load_index(CONVERSATIONS_FOLDER)
     
-    # Walk through all conversations to collect speakers
-    for conversation_dir in os.listdir(CONVERSATIONS_FOLDER):
-        conversation_path = os.path.join(CONVERSATIONS_FOLDER, conversation_dir)
+    def build_body():
+        speakers_list = []
+        for speaker_name, stats in get_speaker_stats(CONVERSATIONS_FOLDER).items():
+            speakers_list.append({
+                'id': speaker_name.lower().replace(' ', '_'),
+                'name': speaker_name,
+                'isUnknown': speaker_name.lower() == 'unknown',
+                'confidence': stats['max_confidence'] * 100,  # Convert to percentage
+                'averageConfidence': stats['average_confidence'] * 100,
+                'confidenceHistogram': stats['confidence_histogram'],
+                'appearances': stats['conversations'],
+                'utterances': stats['utterances'],
+                'talkTime': stats['talk_time_ms'] / 1000,  # Convert to seconds
+                'lastSeen': stats['last_seen']
+            })
         
-        # Only include directories
-        if os.path.isdir(conversation_path):
-            # Check for metadata.json
-            metadata_path = os.path.join(conversation_path, 'metadata.json')
-            if os.path.exists(metadata_path):
-                try:
-                    with open(metadata_path, 'r') as f:
-                        metadata = json.load(f)
-                    
-                    # Process utterances to collect speakers
-                    for utterance in metadata.get('utterances', []):
-                        speaker_name = utterance.get('speaker', 'Unknown')
-                        speaker_id = utterance.get('embedding_id', '')
-                        confidence = utterance.get('confidence', 0)
-                        
-                        if speaker_id and speaker_name:
-                            # Generate a consistent ID for the speaker
-                            speaker_key = speaker_name.lower().replace(' ', '_')
-                            
-                            if speaker_key not in speakers:
-                                speakers[speaker_key] = {
-                                    'id': speaker_key,
-                                    'name': speaker_name,
-                                    'isUnknown': speaker_name.lower() == 'unknown',
-                                    'confidence': confidence * 100,  # Convert to percentage
-                                    'appearances': 1
-                                }
-                            else:
-                                # Update existing speaker
-                                speakers[speaker_key]['appearances'] += 1
-                                # Update confidence with the max value
-                                speakers[speaker_key]['confidence'] = max(
-                                    speakers[speaker_key]['confidence'],
-                                    confidence * 100
-                                )
-                except Exception as e:
-                    logger.error(f"Error processing speakers in conversation {conversation_dir}: {str(e)}")
-    
-    # Convert to list and sort by name
-    speakers_list = list(speakers.values())
-    speakers_list.sort(key=lambda x: x['name'])
-    
-    return jsonify(speakers_list)
+        # Sort by name
+        speakers_list.sort(key=lambda x: x['name'])
+        return json.dumps(speakers_list).encode('utf-8')
+    
+    try:
+        return cached_json_response(get_cached_response(stats_path, build_body))
+    except Exception as e:
+        logger.error(f"Error loading speaker statistics: {str(e)}")
+        return jsonify({"error": f"Error loading speakers: {str(e)}"}), 500
 
 @app.route('/api/speakers/rename', methods=['POST'])
 def rename_speaker():
@@ -223,44 +491,77 @@ def rename_speaker():
     original_name = data['originalName']
     new_name = data['newName']
     update_all = data.get('updateAllInstances', True)
-    min_confidence = data.get('minConfidence', 70) / 100  # Convert from percentage
     
     try:
-        updated_count = 0
-        
-        # Walk through all conversations
-        for conversation_dir in os.listdir(CONVERSATIONS_FOLDER):
-            conversation_path = os.path.join(CONVERSATIONS_FOLDER, conversation_dir)
-            
-            # Only process directories
-            if os.path.isdir(conversation_path):
-                # Check if speaker exists in this conversation
-                speaker_dir = os.path.join(conversation_path, 'speakers', original_name)
-                if os.path.exists(speaker_dir):
-                    # Call the rename_speaker function from the existing script
-                    result = rename_speaker_in_conversation(
-                        conversation_path=conversation_path,
-                        old_speaker=original_name,
-                        new_speaker=new_name,
-                        confidence_threshold=min_confidence
-                    )
-                    
-                    if result:
-                        updated_count += 1
+        # Find the affected conversations through the index and update them in parallel
+        summary = rename_speaker_across_archive(CONVERSATIONS_FOLDER, original_name, new_name)
+        updated_count = summary['updated']
+        for conversation_id in summary['updated_ids']:
+            invalidate_conversation(os.path.join(CONVERSATIONS_FOLDER, conversation_id))
         
-        # Update the speaker database if requested
-        if update_all and updated_count > 0:
-            # This would need to be implemented based on your existing scripts
-            pass
+        # Update the speaker database if requested, so future matches use the
+        # new name (a background job; poll /api/process/<id> for "relabeled")
+        relabel_job_id = None
+        if update_all:
+            relabel_job_id = f"relabel_{str(uuid.uuid4())[:8]}"
+            start_relabel(get_voice_index(), original_name, new_name, relabel_job_id)
         
         return jsonify({
             "success": True,
-            "updated": updated_count
+            "updated": updated_count,
+            "relabelJobId": relabel_job_id,
+            "summary": summary
         })
     except Exception as e:
         logger.error(f"Error renaming speaker {original_name} to {new_name}: {str(e)}")
         return jsonify({"error": f"Error renaming speaker: {str(e)}"}), 500
 
+def save_upload(stream, file_path, chunk_size=1024 * 1024):
+    """Write an uploaded file to disk in chunks and return its SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'wb') as f:
+        for chunk in iter(lambda: stream.read(chunk_size), b''):
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+def duplicate_upload_response(process_id, filename, conversation_id, cluster):
+    """
+    Answer an upload whose recording was already processed
+    
+    The existing conversation is returned right away. If it was processed
+    with different settings, it is identified again in the requested mode
+    from its stored transcript and embeddings (which updates its
+    processing_config) instead of processing the recording again.
+    
+    Returns None if the conversation can't be read, so the upload is
+    processed normally.
+    """
+    logger.info(f"Upload {filename} matches conversation {conversation_id}")
+    conversation_path = os.path.join(CONVERSATIONS_FOLDER, conversation_id)
+    
+    try:
+        with open(os.path.join(conversation_path, 'metadata.json'), 'r') as f:
+            metadata = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Conversation {conversation_id} can't be read ({e}), processing {filename} again")
+        return None
+    
+    if metadata.get('processing_config', processing_config()) != processing_config(cluster):
+        status = start_reidentification([conversation_path], process_id, min_confidence=1.0,
+                                        cluster=cluster, conversation_id=conversation_id)
+    else:
+        status = record_duplicate_upload(process_id, filename, conversation_id)
+    
+    return jsonify({
+        "id": process_id,
+        "filename": filename,
+        "status": status['status'],
+        "progress": status['progress'],
+        "conversationId": conversation_id,
+        "duplicate": True
+    })
+
 @app.route('/api/process', methods=['POST'])
 def process_audio():
     """Upload and process a new audio file"""
@@ -276,13 +577,28 @@ def process_audio():
         # Generate a unique ID for the processing job
         process_id = f"process_{str(uuid.uuid4())[:8]}"
         
-        # Save the uploaded file
+        # Save the uploaded file, hashing it while it streams to disk
         filename = f"{process_id}_{file.filename}"
         file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
+        content_hash = save_upload(file.stream, file_path)
+        
+        # Optional clustering mode (one database lookup per voice)
+        cluster = request.form.get('cluster', 'false').lower() == 'true'
+        
+        # Optional trace of the run (trace.json next to the conversation's metadata.json)
+        profile = request.form.get('profile', 'false').lower() == 'true'
+        
+        # Re-uploads of a processed recording reuse the existing conversation
+        existing_id = find_conversation_by_hash(CONVERSATIONS_FOLDER, content_hash)
+        if existing_id:
+            response = duplicate_upload_response(process_id, file.filename, existing_id, cluster)
+            if response is not None:
+                os.remove(file_path)
+                return response
         
         # Start processing in a background thread
-        status = start_processing(file_path, process_id)
+        status = start_processing(file_path, process_id, cluster=cluster, content_hash=content_hash,
+                                  profile=profile)
         
         return jsonify({
             "id": process_id,
@@ -294,6 +610,93 @@ def process_audio():
         logger.error(f"Error processing audio file: {str(e)}")
         return jsonify({"error": f"Error processing audio file: {str(e)}"}), 500
 
+def upload_error_response(error):
+    """Format an UploadError, telling the client where to resume if known"""
+    body = {"error": str(error)}
+    if error.offset is not None:
+        body["offset"] = error.offset
+    return jsonify(body), error.status_code
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload_endpoint():
+    """
+    Start a resumable chunked upload (body: filename, size, optional sha256).
+    
+    Chunks are sent with PUT /api/uploads/<id>?offset=N, progress can be
+    checked with GET /api/uploads/<id> after a dropped connection, and
+    POST /api/uploads/<id>/complete starts processing.
+    """
+    data = request.json or {}
+    if 'filename' not in data or 'size' not in data:
+        return jsonify({"error": "Missing required fields"}), 400
+    
+    try:
+        return jsonify(create_upload(data['filename'], int(data['size']), data.get('sha256')))
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Append a chunk (raw request body) at ?offset=N, optionally verified by an X-Chunk-SHA256 header"""
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({"error": "Missing offset"}), 400
+    
+    try:
+        return jsonify(write_chunk(upload_id, offset, request.stream, request.headers.get('X-Chunk-SHA256')))
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload_status_endpoint(upload_id):
+    """Get the offset to resume an upload from"""
+    try:
+        return jsonify(get_upload_status(upload_id))
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def discard_upload_endpoint(upload_id):
+    """Abort an upload and delete the received data"""
+    discard_upload(upload_id)
+    return jsonify({"success": True})
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload_endpoint(upload_id):
+    """Verify a finished upload and process it like /api/process (body: optional sha256, cluster)"""
+    data = request.json or {}
+    
+    try:
+        file_path, filename, content_hash = complete_upload(upload_id, UPLOAD_FOLDER, data.get('sha256'))
+    except UploadError as e:
+        return upload_error_response(e)
+    
+    try:
+        process_id = f"process_{str(uuid.uuid4())[:8]}"
+        cluster = bool(data.get('cluster', False))
+        profile = bool(data.get('profile', False))
+        
+        # Re-uploads of a processed recording reuse the existing conversation
+        existing_id = find_conversation_by_hash(CONVERSATIONS_FOLDER, content_hash)
+        if existing_id:
+            response = duplicate_upload_response(process_id, filename, existing_id, cluster)
+            if response is not None:
+                os.remove(file_path)
+                return response
+        
+        status = start_processing(file_path, process_id, cluster=cluster, content_hash=content_hash,
+                                  profile=profile)
+        
+        return jsonify({
+            "id": process_id,
+            "filename": filename,
+            "status": status['status'],
+            "progress": status['progress']
+        })
+    except Exception as e:
+        logger.error(f"Error processing upload {upload_id}: {str(e)}")
+        return jsonify({"error": f"Error processing audio file: {str(e)}"}), 500
+
 @app.route('/api/process/<process_id>', methods=['GET'])
 def get_processing_status_endpoint(process_id):
     """Get the status of a processing job"""
@@ -308,9 +711,61 @@ def get_processing_status_endpoint(process_id):
         "progress": status['progress'],
         "stage": status['stage'],
         "error": status['error'],
-        "conversation_id": status.get('conversation_id')
+        "conversation_id": status.get('conversation_id'),
+        "traceFile": status.get('trace_file'),
+        "relabeled": status.get('relabeled')
     })
 
+@sock.route('/api/stream')
+def stream_audio(ws):
+    """
+    Identify speakers in a live call.
+
+    The client sends binary messages of 16 kHz, 16-bit mono PCM and a text
+    message {"type": "end"} when the call is over. Each closed segment is
+    answered with a {"type": "segment", ...} label message, and the final
+    {"type": "complete", "conversation_id": ...} message is sent once the
+    stream has been saved as a conversation.
+    """
+    session = StreamingSession()
+    logger.info(f"Started streaming session {session.session_id} from {request.remote_addr}")
+    ws.send(json.dumps({"type": "started", "id": session.session_id}))
+    
+    connected = True
+    try:
+        while True:
+            # Wake up regularly to send labels identified in the background
+            message = ws.receive(timeout=STREAM_POLL_SECONDS)
+            if message is None:
+                for event in session.poll_events():
+                    ws.send(json.dumps(event))
+                continue
+            
+            # Control messages are JSON text, audio is binary
+            if isinstance(message, str):
+                if json.loads(message).get("type") == "end":
+                    break
+                continue
+            
+            for event in session.feed(message):
+                ws.send(json.dumps(event))
+    except ConnectionClosed:
+        connected = False
+        logger.info(f"Streaming session {session.session_id} disconnected")
+    except Exception as e:
+        logger.error(f"Error in streaming session {session.session_id}: {str(e)}")
+    finally:
+        # Always store what was captured in the normal conversation layout
+        conversation_id = session.finalize()
+        if conversation_id:
+            request_voice_index_sync(CONVERSATIONS_FOLDER)
+    
+    if connected:
+        # Labels of the segments identified while finalizing
+        for event in session.poll_events():
+            ws.send(json.dumps(event))
+        ws.send(json.dumps({"type": "complete", "conversation_id": conversation_id}))
+
 @app.route('/api/audio/<conversation_id>', methods=['GET'])
 def get_audio(conversation_id):
     """Get the full audio file for a conversation"""
@@ -321,7 +776,7 @@ def get_audio(conversation_id):
     
     # Look for the original audio file
     for file in os.listdir(conversation_path):
-        if file.endswith(('.wav', '.mp3', '.m4a')):
+        if file.startswith('original_audio') and file.endswith(('.wav', '.mp3', '.m4a', '.flac')):
             audio_path = os.path.join(conversation_path, file)
             return send_file(audio_path)
     
@@ -340,6 +795,11 @@ def get_segment_audio(conversation_id, segment_id):
     if os.path.exists(utterance_path):
         return send_file(utterance_path)
     
+    # Packed conversations cut the segment out of their compressed stream
+    wav = get_segment_wav(conversation_path, segment_id)
+    if wav is not None:
+        return send_file(io.BytesIO(wav), mimetype='audio/wav')
+    
     return jsonify({"error": "Segment audio not found"}), 404
 
 @app.errorhandler(404)
@@ -355,4 +815,6 @@ if __name__ == '__main__':
     logger.info(f"CORS configured for origins: http://localhost:3000, http://127.0.0.1:3000")
     logger.info(f"Conversations folder: {CONVERSATIONS_FOLDER}")
     logger.info(f"Upload folder: {UPLOAD_FOLDER}")
+    # Pick up conversations processed from the command line
+    request_voice_index_sync(CONVERSATIONS_FOLDER)
     app.run(debug=True, port=5000) 
\ No newline at end of file
@@ -12,6 +12,10 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.
 
 # Import the conversation processing function
 from speaker_id_testing import process_conversation
+from reidentify import reidentify_conversations
+from manage_voice_db import relabel_speaker, IncompleteRelabelError
+from utils.response_cache import invalidate_conversation
+from voice_search import request_voice_index_sync
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
@@ -21,13 +25,16 @@ logger = logging.getLogger(__name__)
 # Store processing jobs
 processing_jobs = {}
 
-def process_audio_file(file_path, process_id):
+def process_audio_file(file_path, process_id, cluster=False, content_hash=None, profile=False):
     """
     Process an audio file in the background
     
     Args:
         file_path: Path to the audio file
         process_id: Unique ID for this processing job
+        cluster: Identify speakers once per cluster of utterances
+        content_hash: SHA-256 of the file, if already computed
+        profile: Write a trace of the run next to the conversation's metadata.json
     """
     try:
         # Update status to processing
@@ -49,7 +56,10 @@ def process_audio_file(file_path, process_id):
         processing_jobs[process_id]['stage'] = 'Transcribing audio...'
         
         # Call the actual processing function
-        result = process_conversation(file_path)
+        conversation_dir, metadata = process_conversation(file_path, cluster=cluster, content_hash=content_hash,
+                                                          profile=profile)
+        invalidate_conversation(conversation_dir)
+        request_voice_index_sync(os.path.dirname(conversation_dir))
         
         # Update progress
         processing_jobs[process_id]['progress'] = 80
@@ -60,7 +70,9 @@ def process_audio_file(file_path, process_id):
         processing_jobs[process_id]['progress'] = 100
         processing_jobs[process_id]['stage'] = 'Processing complete'
         processing_jobs[process_id]['completion_time'] = datetime.now().isoformat()
-        processing_jobs[process_id]['conversation_id'] = result.get('conversation_id')
+        processing_jobs[process_id]['conversation_id'] = metadata.get('conversation_id')
+        if metadata.get('trace_file'):
+            processing_jobs[process_id]['trace_file'] = os.path.join(conversation_dir, metadata['trace_file'])
         
         logger.info(f"Processing completed for: {file_path}")
         
@@ -77,13 +89,16 @@ def process_audio_file(file_path, process_id):
         processing_jobs[process_id]['status'] = 'failed'
         processing_jobs[process_id]['error'] = str(e)
 
-def start_processing(file_path, process_id):
+def start_processing(file_path, process_id, cluster=False, content_hash=None, profile=False):
     """
     Start processing an audio file in a background thread
     
     Args:
         file_path: Path to the audio file
         process_id: Unique ID for this processing job
+        cluster: Identify speakers once per cluster of utterances
+        content_hash: SHA-256 of the file, if already computed
+        profile: Write a trace of the run next to the conversation's metadata.json
         
     Returns:
         dict: Initial status of the processing job
@@ -102,13 +117,176 @@ def start_processing(file_path, process_id):
     # Start processing in a background thread
     thread = threading.Thread(
         target=process_audio_file,
-        args=(file_path, process_id)
+        args=(file_path, process_id, cluster, content_hash, profile)
     )
     thread.daemon = True
     thread.start()
     
     return processing_jobs[process_id]
 
+def reidentify_job(conversation_paths, process_id, min_confidence, cluster=None):
+    """
+    Re-identify speakers in stored conversations in the background
+    
+    Args:
+        conversation_paths: Conversation directories to check
+        process_id: Unique ID for this job
+        min_confidence: Utterances below this confidence are re-scored
+        cluster: Identification mode to apply (None keeps each conversation's own)
+    """
+    try:
+        processing_jobs[process_id]['status'] = 'processing'
+        processing_jobs[process_id]['progress'] = 10
+        processing_jobs[process_id]['stage'] = 'Re-identifying speakers...'
+        
+        summaries = reidentify_conversations(conversation_paths, min_confidence=min_confidence, cluster=cluster)
+        
+        # Drop cached responses of the conversations that changed
+        paths_by_id = {os.path.basename(os.path.abspath(p)): p for p in conversation_paths}
+        for summary in summaries:
+            if summary.get('updated'):
+                invalidate_conversation(paths_by_id[summary['conversation_id']])
+        
+        processing_jobs[process_id]['status'] = 'completed'
+        processing_jobs[process_id]['progress'] = 100
+        processing_jobs[process_id]['stage'] = 'Re-identification complete'
+        processing_jobs[process_id]['completion_time'] = datetime.now().isoformat()
+        processing_jobs[process_id]['results'] = summaries
+        
+        logger.info(f"Re-identification completed for {len(summaries)} conversation(s)")
+    
+    except Exception as e:
+        logger.error(f"Error re-identifying conversations: {str(e)}")
+        processing_jobs[process_id]['status'] = 'failed'
+        processing_jobs[process_id]['error'] = str(e)
+
+def start_reidentification(conversation_paths, process_id, min_confidence, cluster=None, conversation_id=None):
+    """
+    Start re-identifying stored conversations in a background thread
+    
+    Args:
+        conversation_paths: Conversation directories to check
+        process_id: Unique ID for this job
+        min_confidence: Utterances below this confidence are re-scored
+        cluster: Identification mode to apply (None keeps each conversation's own)
+        conversation_id: Conversation reported in the job status (for re-uploads)
+        
+    Returns:
+        dict: Initial status of the job
+    """
+    processing_jobs[process_id] = {
+        'status': 'queued',
+        'progress': 0,
+        'stage': 'Queued for re-identification',
+        'start_time': datetime.now().isoformat(),
+        'conversation_id': conversation_id,
+        'error': None
+    }
+    
+    thread = threading.Thread(
+        target=reidentify_job,
+        args=(conversation_paths, process_id, min_confidence, cluster)
+    )
+    thread.daemon = True
+    thread.start()
+    
+    return processing_jobs[process_id]
+
+def relabel_job(index, original_name, new_name, process_id):
+    """
+    Relabel a speaker's embeddings in the speaker database in the background
+    
+    Args:
+        index: Speaker database
+        original_name: Current speaker name on the embeddings
+        new_name: Speaker name to assign
+        process_id: Unique ID for this job
+    """
+    try:
+        processing_jobs[process_id]['status'] = 'processing'
+        processing_jobs[process_id]['progress'] = 10
+        processing_jobs[process_id]['stage'] = 'Relabeling speaker embeddings...'
+        
+        relabeled = relabel_speaker(index, original_name, new_name)
+        
+        processing_jobs[process_id]['status'] = 'completed'
+        processing_jobs[process_id]['progress'] = 100
+        processing_jobs[process_id]['stage'] = 'Relabel complete'
+        processing_jobs[process_id]['completion_time'] = datetime.now().isoformat()
+        processing_jobs[process_id]['relabeled'] = relabeled
+        
+        logger.info(f"Relabeled {relabeled} embeddings from {original_name} to {new_name}")
+    
+    except IncompleteRelabelError as e:
+        logger.error(str(e))
+        processing_jobs[process_id]['status'] = 'failed'
+        processing_jobs[process_id]['error'] = str(e)
+        processing_jobs[process_id]['relabeled'] = e.relabeled
+    except Exception as e:
+        logger.error(f"Error relabeling {original_name} to {new_name}: {str(e)}")
+        processing_jobs[process_id]['status'] = 'failed'
+        processing_jobs[process_id]['error'] = str(e)
+
+def start_relabel(index, original_name, new_name, process_id):
+    """
+    Start relabeling a speaker's embeddings in a background thread
+    
+    Args:
+        index: Speaker database
+        original_name: Current speaker name on the embeddings
+        new_name: Speaker name to assign
+        process_id: Unique ID for this job
+        
+    Returns:
+        dict: Initial status of the job
+    """
+    processing_jobs[process_id] = {
+        'status': 'queued',
+        'progress': 0,
+        'stage': 'Queued for relabeling',
+        'start_time': datetime.now().isoformat(),
+        'relabeled': 0,
+        'error': None
+    }
+    
+    thread = threading.Thread(
+        target=relabel_job,
+        args=(index, original_name, new_name, process_id)
+    )
+    thread.daemon = True
+    thread.start()
+    
+    return processing_jobs[process_id]
+
+def record_duplicate_upload(process_id, filename, conversation_id):
+    """
+    Record a job for an upload that matched an existing conversation
+    
+    The job is completed immediately so clients polling its status are
+    pointed at the existing conversation.
+    
+    Args:
+        process_id: Unique ID for this job
+        filename: Name of the uploaded file
+        conversation_id: ID of the matching conversation
+        
+    Returns:
+        dict: Status of the job
+    """
+    now = datetime.now().isoformat()
+    processing_jobs[process_id] = {
+        'status': 'completed',
+        'progress': 100,
+        'stage': 'Already processed',
+        'start_time': now,
+        'completion_time': now,
+        'filename': filename,
+        'conversation_id': conversation_id,
+        'duplicate': True,
+        'error': None
+    }
+    return processing_jobs[process_id]
+
 def get_processing_status(process_id):
     """
     Get the status of a processing job
@@ -0,0 +1,92 @@
+import os
+import gzip
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # Optional - gzip is always available
+    brotli = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Number of formatted responses kept in memory
+MAX_CACHE_ENTRIES = 256
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+
+# Cached responses keyed by source file path (least recently used first)
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _build_entry(body, source_stat):
+    """Create a cache entry with the body, its ETag and compressed variants"""
+    entry = {
+        'mtime': source_stat.st_mtime_ns,
+        'size': source_stat.st_size,
+        'etag': '"' + hashlib.sha1(body).hexdigest()[:20] + '"',
+        'identity': body,
+        'gzip': None,
+        'br': None
+    }
+    if len(body) >= MIN_COMPRESS_BYTES:
+        entry['gzip'] = gzip.compress(body, compresslevel=6)
+        if brotli is not None:
+            entry['br'] = brotli.compress(body, quality=5)
+    return entry
+
+def get_cached_response(source_path, build_body):
+    """
+    Get the formatted response body for a source file from the cache
+
+    The entry is rebuilt when the file's mtime or size changed since it was
+    cached, so edits made outside this process are picked up too.
+
+    Args:
+        source_path: File the response is built from (e.g. metadata.json)
+        build_body: Callable returning the response body as bytes
+
+    Returns:
+        dict: Cache entry with 'etag', 'identity', 'gzip' and 'br' bodies
+    """
+    source_stat = os.stat(source_path)
+
+    with _cache_lock:
+        entry = _cache.get(source_path)
+        if entry and entry['mtime'] == source_stat.st_mtime_ns and entry['size'] == source_stat.st_size:
+            _cache.move_to_end(source_path)
+            return entry
+
+    # Build outside the lock so slow parses don't block other requests
+    entry = _build_entry(build_body(), source_stat)
+
+    with _cache_lock:
+        _cache[source_path] = entry
+        _cache.move_to_end(source_path)
+        while len(_cache) > MAX_CACHE_ENTRIES:
+            _cache.popitem(last=False)
+
+    return entry
+
+def invalidate_path(source_path):
+    """Drop the cached response for a source file"""
+    with _cache_lock:
+        _cache.pop(source_path, None)
+
+def invalidate_conversation(conversation_path):
+    """Drop every cached response built from files of a conversation"""
+    prefix = os.path.abspath(conversation_path) + os.sep
+    with _cache_lock:
+        for key in [k for k in _cache if os.path.abspath(k).startswith(prefix)]:
+            del _cache[key]
+
+def clear_cache():
+    """Drop all cached responses"""
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,343 @@
+import os
+import sys
+import uuid
+import wave
+import queue
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+from pydub import AudioSegment
+
+# Setup path for importing from parent directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from speaker_id_testing import (
+    load_speaker_model,
+    test_voice_segment,
+    embedding_to_numpy,
+    create_conversation_dir,
+    save_utterance,
+    save_utterance_legacy,
+    save_conversation_embeddings,
+    write_transcript,
+    format_time,
+    processing_config,
+    PROCESSED_DIR,
+    UTTERANCES_DIR,
+    OUTPUT_PROFILES,
+    DEFAULT_OUTPUT_PROFILE,
+)
+from conversation_index import atomic_write_json, update_conversation, hash_file
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Audio format accepted by the streaming endpoint (16 kHz, 16-bit, mono PCM)
+STREAM_SAMPLE_RATE = 16000
+STREAM_SAMPLE_WIDTH = 2
+
+# Segmentation settings
+FRAME_MS = 30                # Energy analysis frame
+SILENCE_TO_CLOSE_MS = 600    # Silence that closes a segment
+MAX_SEGMENT_MS = 8000        # Segments are force-closed after this (bounds latency)
+MIN_SEGMENT_MS = 400         # Shorter segments are dropped as noise
+THRESHOLD_DB = 12.0          # Energy above the noise floor counted as speech
+MIN_ENERGY_DBFS = -55.0      # Absolute floor for speech frames
+NOISE_HISTORY_FRAMES = 500   # Frames used to track the noise floor (~15s)
+
+# Unknown voices closer than this to an earlier unknown voice share a label
+UNKNOWN_SIMILARITY_THRESHOLD = 0.60
+
+# Label of segments whose identification failed (kept so no speech is lost)
+UNIDENTIFIED_SPEAKER = "Unknown_unidentified"
+
+STREAM_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'uploads', 'streams'))
+
+class StreamingSession:
+    """
+    Incremental speaker identification over a live 16 kHz PCM stream.
+
+    Audio is spooled to disk as it arrives while a small rolling buffer holds
+    the currently open segment. Segments are closed on silence (or when they
+    reach MAX_SEGMENT_MS) and handed to a worker thread that embeds them,
+    matches them against the voice bank and queues their speaker labels, so
+    feeding audio never waits for the model or the database.
+
+    output_profile selects the optional files finalize() writes, as for
+    uploaded conversations (see OUTPUT_PROFILES in speaker_id_testing.py).
+    """
+
+    def __init__(self, session_id=None, output_profile=None):
+        self.output_profile = output_profile or DEFAULT_OUTPUT_PROFILE
+        if self.output_profile not in OUTPUT_PROFILES:
+            raise ValueError(f"Unknown output profile: {self.output_profile} "
+                             f"(expected one of {', '.join(OUTPUT_PROFILES)})")
+        self.session_id = session_id or f"stream_{str(uuid.uuid4())[:8]}"
+        self.speaker_model = load_speaker_model()
+
+        # Spool the whole call to disk so finalization can build a conversation
+        os.makedirs(STREAM_FOLDER, exist_ok=True)
+        self.wav_path = os.path.join(STREAM_FOLDER, f"{self.session_id}.wav")
+        self.wav_writer = wave.open(self.wav_path, 'wb')
+        self.wav_writer.setnchannels(1)
+        self.wav_writer.setsampwidth(STREAM_SAMPLE_WIDTH)
+        self.wav_writer.setframerate(STREAM_SAMPLE_RATE)
+
+        self.frame_samples = STREAM_SAMPLE_RATE * FRAME_MS // 1000
+        self.pending = b''              # Bytes not yet forming a full frame
+        self.total_frames = 0           # Frames analysed so far
+        self.noise_history = deque(maxlen=NOISE_HISTORY_FRAMES)  # Recent frame energies (dB)
+
+        # Currently open segment
+        self.segment_frames = []
+        self.segment_start_frame = None
+        self.silent_run = 0
+
+        # Closed segments and unknown voice clusters (owned by the worker)
+        self.segments = []
+        self.embeddings = []
+        self.unknown_centroids = []
+        self.started = datetime.now()
+        self.finalized = False
+
+        # Closed segments waiting for identification, and finished label events
+        self.identify_queue = queue.Queue()
+        self.events = queue.Queue()
+        self.worker = threading.Thread(target=self._identify_worker, name=f"{self.session_id}-identify",
+                                       daemon=True)
+        self.worker.start()
+
+    def feed(self, pcm_bytes):
+        """
+        Add a chunk of PCM audio to the session
+
+        Args:
+            pcm_bytes: Raw 16-bit little-endian mono PCM at 16 kHz
+
+        Returns:
+            list: Label events of segments identified since the last call
+        """
+        self.wav_writer.writeframes(pcm_bytes)
+        data = self.pending + pcm_bytes
+        frame_bytes = self.frame_samples * STREAM_SAMPLE_WIDTH
+
+        offset = 0
+        while offset + frame_bytes <= len(data):
+            frame = data[offset:offset + frame_bytes]
+            offset += frame_bytes
+            self._process_frame(frame)
+
+        self.pending = data[offset:]
+        return self.poll_events()
+
+    def poll_events(self):
+        """Label events of segments identified since the last call (never blocks)"""
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def _is_speech(self, frame):
+        """Classify one frame as speech using an adaptive energy threshold"""
+        samples = np.frombuffer(frame, dtype=np.int16).astype(np.float32) / 32768.0
+        energy_db = 20 * np.log10(np.sqrt(np.mean(samples ** 2) + 1e-12))
+
+        self.noise_history.append(energy_db)
+        noise_floor = np.percentile(self.noise_history, 10)
+        return energy_db >= max(noise_floor + THRESHOLD_DB, MIN_ENERGY_DBFS)
+
+    def _process_frame(self, frame):
+        """Run incremental segmentation on one frame"""
+        frame_index = self.total_frames
+        self.total_frames += 1
+        is_speech = self._is_speech(frame)
+
+        if self.segment_start_frame is None:
+            if not is_speech:
+                return
+            # Speech starts a new segment
+            self.segment_start_frame = frame_index
+            self.segment_frames = []
+            self.silent_run = 0
+
+        self.segment_frames.append(frame)
+        self.silent_run = 0 if is_speech else self.silent_run + 1
+
+        segment_ms = len(self.segment_frames) * FRAME_MS
+        if self.silent_run * FRAME_MS >= SILENCE_TO_CLOSE_MS or segment_ms >= MAX_SEGMENT_MS:
+            self._close_segment()
+
+    def _close_segment(self):
+        """Hand the open segment to the identification worker"""
+        # Drop the trailing silence that closed the segment
+        voiced_frames = self.segment_frames[:len(self.segment_frames) - self.silent_run]
+        start_ms = self.segment_start_frame * FRAME_MS
+        end_ms = start_ms + len(voiced_frames) * FRAME_MS
+
+        self.segment_start_frame = None
+        self.segment_frames = []
+        self.silent_run = 0
+
+        if end_ms - start_ms < MIN_SEGMENT_MS:
+            return
+
+        self.identify_queue.put((b''.join(voiced_frames), start_ms, end_ms))
+
+    def _identify_worker(self):
+        """Identify closed segments in order until finalize() sends None"""
+        while True:
+            item = self.identify_queue.get()
+            if item is None:
+                return
+            pcm_bytes, start_ms, end_ms = item
+            try:
+                self.events.put(self._identify_segment(pcm_bytes, start_ms, end_ms))
+            except Exception as e:
+                logger.error(f"Error identifying a segment of stream {self.session_id}: {str(e)}")
+                self.events.put(self._add_segment(start_ms, end_ms, UNIDENTIFIED_SPEAKER, 0.0, None, None))
+
+    def _identify_segment(self, pcm_bytes, start_ms, end_ms):
+        """Embed and identify one closed segment"""
+        audio = AudioSegment(
+            data=pcm_bytes,
+            sample_width=STREAM_SAMPLE_WIDTH,
+            frame_rate=STREAM_SAMPLE_RATE,
+            channels=1
+        )
+
+        speaker_name, confidence, embedding_id, embedding = test_voice_segment(audio, self.speaker_model)
+        if not speaker_name:
+            speaker_name = self._label_unknown(embedding)
+        return self._add_segment(start_ms, end_ms, speaker_name, confidence, embedding_id, embedding)
+
+    def _add_segment(self, start_ms, end_ms, speaker_name, confidence, embedding_id, embedding):
+        """Record a closed segment and return its label event"""
+        segment = {
+            "id": f"utterance_{len(self.segments):03d}",
+            "start": start_ms,
+            "end": end_ms,
+            "speaker": speaker_name,
+            "text": "",
+            "confidence": float(confidence),
+            "embedding_id": embedding_id
+        }
+        self.segments.append(segment)
+        self.embeddings.append(embedding)
+
+        return {
+            "type": "segment",
+            "id": segment["id"],
+            "start": start_ms / 1000,
+            "end": end_ms / 1000,
+            "speaker": speaker_name,
+            "confidence": float(confidence) * 100,
+            "isUnknown": speaker_name.startswith("Unknown_")
+        }
+
+    def _label_unknown(self, embedding):
+        """Give unknown voices stable labels within the session"""
+        vector = embedding_to_numpy(embedding)
+        vector = vector / (np.linalg.norm(vector) + 1e-12)
+
+        best_index, best_score = None, UNKNOWN_SIMILARITY_THRESHOLD
+        for i, (centroid, count) in enumerate(self.unknown_centroids):
+            score = float(np.dot(vector, centroid / (np.linalg.norm(centroid) + 1e-12)))
+            if score >= best_score:
+                best_index, best_score = i, score
+
+        if best_index is None:
+            self.unknown_centroids.append((vector, 1))
+            best_index = len(self.unknown_centroids) - 1
+        else:
+            centroid, count = self.unknown_centroids[best_index]
+            self.unknown_centroids[best_index] = (centroid + vector, count + 1)
+
+        return f"Unknown_speaker_{best_index}"
+
+    def finalize(self):
+        """
+        Close the stream and store it in the processed_conversations layout
+
+        Returns:
+            str: ID of the created conversation, or None if nothing was captured
+        """
+        if self.finalized:
+            return None
+        self.finalized = True
+
+        # Flush any segment that was still open and wait for the worker
+        if self.segment_start_frame is not None:
+            self.silent_run = 0
+            self._close_segment()
+        self.identify_queue.put(None)
+        self.worker.join()
+        self.wav_writer.close()
+
+        try:
+            if not self.segments:
+                logger.info(f"Stream {self.session_id} ended without speech")
+                return None
+
+            output_views = OUTPUT_PROFILES[self.output_profile]
+            conversation_info = create_conversation_dir(self.wav_path, speaker_links="speakers" in output_views)
+            content_hash = hash_file(self.wav_path)
+            full_audio = AudioSegment.from_wav(self.wav_path)
+            conversation_name = os.path.basename(self.wav_path)
+
+            if "legacy_utterances" in output_views:
+                os.makedirs(UTTERANCES_DIR, exist_ok=True)
+            utterance_metadata = []
+            for i, segment in enumerate(self.segments):
+                audio = full_audio[segment["start"]:segment["end"]]
+                utterance_metadata.append(save_utterance(audio, segment, conversation_info, i,
+                                                         speaker_link="speakers" in output_views))
+                if "legacy_utterances" in output_views:
+                    save_utterance_legacy(audio, segment["speaker"], conversation_name, segment["text"], i)
+
+            legacy_transcript = None
+            if "legacy_transcript" in output_views:
+                legacy_transcript = f"transcript_{conversation_info['id'][len('conversation_'):]}.txt"
+
+            metadata = {
+                "conversation_id": conversation_info["id"],
+                "original_audio": os.path.basename(conversation_info["original_audio"]),
+                "date_processed": datetime.now().isoformat(),
+                "duration_seconds": len(full_audio) / 1000,
+                "speakers": list(set(u["speaker"] for u in utterance_metadata)),
+                "utterances": utterance_metadata,
+                "embeddings": save_conversation_embeddings(conversation_info["dir"], self.embeddings),
+                "legacy_transcript": legacy_transcript,
+                "audio_name": conversation_name,
+                "output_profile": self.output_profile,
+                "generated_views": sorted(output_views),
+                "content_hash": content_hash,
+                "processing_config": processing_config(),
+                "source": "stream",
+                "stream_started": self.started.isoformat()
+            }
+
+            atomic_write_json(os.path.join(conversation_info["dir"], "metadata.json"), metadata)
+            update_conversation(PROCESSED_DIR, conversation_info["id"], metadata)
+
+            transcript_title = f"Live stream {self.session_id} ({format_time(len(full_audio))})"
+            write_transcript(os.path.join(conversation_info["dir"], "transcript.txt"), transcript_title,
+                             utterance_metadata)
+            if legacy_transcript:
+                with open(legacy_transcript, "w") as f:
+                    f.write(f"Conversation Transcript: {transcript_title}\n")
+                    f.write("=====================\n\n")
+                    for utterance in utterance_metadata:
+                        f.write(f"{utterance['speaker']}: {utterance['text']}\n\n")
+
+            logger.info(f"Stream {self.session_id} saved as {conversation_info['id']}")
+            return conversation_info["id"]
+        finally:
+            if os.path.exists(self.wav_path):
+                os.remove(self.wav_path)
@@ -0,0 +1,230 @@
+import os
+import re
+import json
+import uuid
+import hashlib
+import threading
+import logging
+import shutil
+from datetime import datetime
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+UPLOAD_SESSIONS_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'uploads', 'sessions'))
+
+# Suggested chunk size for clients and the read size when copying request bodies
+CHUNK_SIZE = 8 * 1024 * 1024
+READ_SIZE = 1024 * 1024
+
+UPLOAD_ID_PATTERN = re.compile(r'^upload_[0-9a-f]{12}$')
+
+# Active upload sessions (upload_id -> state); the running hash only lives in memory
+upload_sessions = {}
+_sessions_lock = threading.Lock()
+
+class UploadError(Exception):
+    """Raised when a chunk or upload can't be accepted"""
+
+    def __init__(self, message, status_code=400, offset=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.offset = offset
+
+def _session_dir(upload_id):
+    return os.path.join(UPLOAD_SESSIONS_FOLDER, upload_id)
+
+def _data_path(upload_id):
+    return os.path.join(_session_dir(upload_id), 'data.part')
+
+def _save_session(session):
+    """Persist the session (without the hash object) so uploads survive restarts"""
+    state = {k: v for k, v in session.items() if k not in ('hasher', 'lock')}
+    path = os.path.join(_session_dir(session['upload_id']), 'session.json')
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(temp_path, path)
+
+def _get_session(upload_id):
+    """Get an upload session, reloading it from disk after a restart"""
+    with _sessions_lock:
+        session = upload_sessions.get(upload_id)
+        if session:
+            return session
+
+        session_path = os.path.join(_session_dir(upload_id), 'session.json')
+        if not UPLOAD_ID_PATTERN.match(upload_id) or not os.path.exists(session_path):
+            raise UploadError("Upload not found", 404)
+
+        with open(session_path, 'r') as f:
+            session = json.load(f)
+
+        # Trust only what actually reached the disk
+        session['received'] = min(session['received'], os.path.getsize(_data_path(upload_id)))
+        session['hasher'] = None  # Recomputed from the file when the upload completes
+        session['lock'] = threading.Lock()
+        upload_sessions[upload_id] = session
+        return session
+
+def create_upload(filename, size, sha256=None):
+    """
+    Start a chunked upload
+
+    Args:
+        filename: Original name of the file
+        size: Total size in bytes
+        sha256: Expected SHA-256 of the whole file (optional, checked on completion)
+
+    Returns:
+        dict: Status of the new upload
+    """
+    if size is None or size <= 0:
+        raise UploadError("Upload size must be positive")
+
+    upload_id = f"upload_{uuid.uuid4().hex[:12]}"
+    os.makedirs(_session_dir(upload_id), exist_ok=True)
+    open(_data_path(upload_id), 'wb').close()
+
+    session = {
+        'upload_id': upload_id,
+        'filename': os.path.basename(filename),
+        'size': size,
+        'sha256': sha256.lower() if sha256 else None,
+        'received': 0,
+        'created': datetime.now().isoformat(),
+        'hasher': hashlib.sha256(),
+        'lock': threading.Lock()
+    }
+    with _sessions_lock:
+        upload_sessions[upload_id] = session
+    _save_session(session)
+
+    logger.info(f"Started upload {upload_id} for {filename} ({size} bytes)")
+    return get_upload_status(upload_id)
+
+def write_chunk(upload_id, offset, stream, chunk_sha256=None):
+    """
+    Append a chunk to an upload
+
+    Chunks must arrive in order: offset has to match the bytes received so
+    far. After a dropped connection the client asks for the status and
+    resumes from the returned offset.
+
+    Args:
+        upload_id: ID of the upload
+        offset: Byte offset of the chunk
+        stream: File-like object with the chunk data
+        chunk_sha256: Expected SHA-256 of the chunk (optional)
+
+    Returns:
+        dict: Updated upload status
+    """
+    session = _get_session(upload_id)
+
+    with session['lock']:
+        if offset != session['received']:
+            raise UploadError("Chunk offset does not match the received size", 409, session['received'])
+
+        # Hash the chunk on its own (to verify it) and as a continuation of
+        # the upload, so the whole-file hash is ready when the upload completes
+        chunk_hasher = hashlib.sha256()
+        upload_hasher = session['hasher'].copy() if session['hasher'] is not None else None
+        temp_path = f"{_data_path(upload_id)}.chunk"
+        written = 0
+        with open(temp_path, 'wb') as f:
+            for data in iter(lambda: stream.read(READ_SIZE), b''):
+                written += len(data)
+                if offset + written > session['size']:
+                    f.close()
+                    os.remove(temp_path)
+                    raise UploadError("Chunk goes past the declared upload size", 413, session['received'])
+                chunk_hasher.update(data)
+                if upload_hasher is not None:
+                    upload_hasher.update(data)
+                f.write(data)
+
+        if chunk_sha256 and chunk_hasher.hexdigest() != chunk_sha256.lower():
+            os.remove(temp_path)
+            raise UploadError("Chunk checksum mismatch", 422, session['received'])
+
+        # Only verified chunks are appended to the upload
+        with open(_data_path(upload_id), 'r+b') as data_file, open(temp_path, 'rb') as chunk_file:
+            data_file.seek(offset)
+            data_file.truncate()
+            shutil.copyfileobj(chunk_file, data_file, READ_SIZE)
+            data_file.flush()
+            os.fsync(data_file.fileno())
+        os.remove(temp_path)
+
+        session['hasher'] = upload_hasher
+        session['received'] = offset + written
+        _save_session(session)
+
+    return get_upload_status(upload_id)
+
+def get_upload_status(upload_id):
+    """
+    Get the progress of an upload
+
+    Returns:
+        dict: Upload ID, filename, size, received offset and completeness
+    """
+    session = _get_session(upload_id)
+    return {
+        'uploadId': session['upload_id'],
+        'filename': session['filename'],
+        'size': session['size'],
+        'offset': session['received'],
+        'chunkSize': CHUNK_SIZE,
+        'complete': session['received'] == session['size']
+    }
+
+def complete_upload(upload_id, destination_folder, sha256=None):
+    """
+    Verify a finished upload and move it out of the session folder
+
+    Args:
+        upload_id: ID of the upload
+        destination_folder: Folder the assembled file is moved to
+        sha256: Expected SHA-256 (overrides the one given at creation)
+
+    Returns:
+        tuple: (path of the assembled file, original filename, SHA-256 of the content)
+    """
+    session = _get_session(upload_id)
+
+    with session['lock']:
+        if session['received'] != session['size']:
+            raise UploadError("Upload is incomplete", 409, session['received'])
+
+        if session['hasher'] is not None:
+            content_hash = session['hasher'].hexdigest()
+        else:
+            # Running hash was lost in a restart - hash the assembled file
+            hasher = hashlib.sha256()
+            with open(_data_path(upload_id), 'rb') as f:
+                for data in iter(lambda: f.read(READ_SIZE), b''):
+                    hasher.update(data)
+            content_hash = hasher.hexdigest()
+
+        expected = (sha256 or session['sha256'] or '').lower()
+        if expected and expected != content_hash:
+            raise UploadError("Upload checksum mismatch", 422)
+
+        os.makedirs(destination_folder, exist_ok=True)
+        file_path = os.path.join(destination_folder, f"{upload_id}_{session['filename']}")
+        os.replace(_data_path(upload_id), file_path)
+
+    discard_upload(upload_id)
+    logger.info(f"Completed upload {upload_id} ({session['size']} bytes)")
+    return file_path, session['filename'], content_hash
+
+def discard_upload(upload_id):
+    """Forget an upload and delete its session folder"""
+    with _sessions_lock:
+        upload_sessions.pop(upload_id, None)
+    if UPLOAD_ID_PATTERN.match(upload_id):
+        shutil.rmtree(_session_dir(upload_id), ignore_errors=True)
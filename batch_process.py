@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Script to process many conversation recordings in one run.
+
+Inputs can be audio files, directories (searched recursively), glob
+patterns, or manifest files listing one path or glob per line:
+
+    python batch_process.py recordings/ "archive/2024-*/*.m4a" --manifest backfill.txt --workers 4
+
+All conversations share one loaded speaker model and database connection.
+Several files are decoded and processed concurrently.
+
+Progress is recorded in a state file after every file, so an interrupted
+run can simply be started again: files that were already processed (same
+path, size and modification time) are skipped, and so are recordings
+whose content matches a conversation already in the archive. A JSON report
+of the run is written at the end.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from speaker_id_testing import (
+    PROCESSED_DIR,
+    OUTPUT_PROFILES,
+    DEFAULT_OUTPUT_PROFILE,
+    load_speaker_model,
+    convert_to_wav,
+    process_conversation,
+)
+from conversation_index import atomic_write_json, hash_file, find_conversation_by_hash
+
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".m4a", ".flac", ".ogg", ".aac", ".wma", ".mp4", ".webm"}
+
+BATCH_STATE_FILE = os.path.join(PROCESSED_DIR, "batch_state.json")
+DEFAULT_WORKERS = 4
+
+def find_audio_files(inputs, manifests=None):
+    """
+    Expand files, directories, globs and manifests into a list of audio files
+
+    Args:
+        inputs: Files, directories or glob patterns
+        manifests: Text files with one file, directory or glob per line
+
+    Returns:
+        list: Absolute paths of the audio files, without duplicates, in input order
+    """
+    patterns = list(inputs or [])
+    for manifest in manifests or []:
+        with open(manifest, 'r') as f:
+            patterns.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for match in matches:
+            if os.path.isdir(match):
+                for root, _, names in os.walk(match):
+                    for name in sorted(names):
+                        if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+                            files.append(os.path.join(root, name))
+            elif os.path.isfile(match):
+                files.append(match)
+            else:
+                print(f"Warning: {match} does not exist")
+
+    seen = set()
+    unique_files = []
+    for path in files:
+        path = os.path.abspath(path)
+        if path not in seen:
+            seen.add(path)
+            unique_files.append(path)
+    return unique_files
+
+def file_fingerprint(path):
+    """Identify a file version by its size and modification time"""
+    stat = os.stat(path)
+    return f"{stat.st_size}:{int(stat.st_mtime)}"
+
+class BatchState:
+    """Per-file results of batch runs, saved after every update"""
+
+    def __init__(self, path=BATCH_STATE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.files = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.files = json.load(f).get("files", {})
+
+    def is_done(self, audio_file):
+        entry = self.files.get(audio_file)
+        return bool(entry and entry["status"] == "completed" and entry["fingerprint"] == file_fingerprint(audio_file))
+
+    def record(self, audio_file, result):
+        with self.lock:
+            self.files[audio_file] = result
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            atomic_write_json(self.path, {"updated": datetime.now().isoformat(), "files": self.files})
+
+def process_file(audio_file, state, cluster=False, output_profile=None):
+    """Decode and process one recording, recording the outcome in the state file"""
+    result = {
+        "fingerprint": file_fingerprint(audio_file),
+        "started": datetime.now().isoformat()
+    }
+    start = time.time()
+    wav_file = None
+    try:
+        # Recordings already in the archive (e.g. copies) are not processed again
+        content_hash = hash_file(audio_file)
+        existing_id = find_conversation_by_hash(PROCESSED_DIR, content_hash)
+        if existing_id:
+            result.update({"status": "completed", "conversation_id": existing_id, "duplicate": True,
+                           "duration_seconds": 0, "elapsed_seconds": round(time.time() - start, 2)})
+            state.record(audio_file, result)
+            return result
+
+        wav_file = convert_to_wav(audio_file)
+        conversation_dir, metadata = process_conversation(audio_file, cluster=cluster, wav_file=wav_file,
+                                                          content_hash=content_hash, output_profile=output_profile)
+        result.update({
+            "status": "completed",
+            "conversation_id": metadata["conversation_id"],
+            "duration_seconds": metadata.get("duration_seconds", 0),
+            "utterances": len(metadata.get("utterances", [])),
+            "speakers": metadata.get("speakers", [])
+        })
+    except Exception as e:
+        result.update({"status": "failed", "error": str(e)})
+    finally:
+        if wav_file and wav_file != audio_file and os.path.exists(wav_file):
+            os.remove(wav_file)
+
+    result["elapsed_seconds"] = round(time.time() - start, 2)
+    state.record(audio_file, result)
+    return result
+
+def run_batch(audio_files, workers=DEFAULT_WORKERS, cluster=False, state_file=BATCH_STATE_FILE, retry_failed=True,
+              output_profile=None):
+    """
+    Process a list of recordings concurrently
+
+    Args:
+        audio_files: Audio files to process
+        workers: Number of recordings processed at the same time
+        cluster: Identify speakers once per voice cluster
+        state_file: Where progress is recorded for resuming
+        retry_failed: Also process files that failed in an earlier run
+        output_profile: Output profile of the conversations (see speaker_id_testing.OUTPUT_PROFILES)
+
+    Returns:
+        dict: Summary report of the run
+    """
+    state = BatchState(state_file)
+    report = {
+        "started": datetime.now().isoformat(),
+        "files": len(audio_files),
+        "skipped": 0,
+        "completed": 0,
+        "failed": 0,
+        "audio_seconds": 0.0,
+        "results": {}
+    }
+
+    pending = []
+    for audio_file in audio_files:
+        previous = state.files.get(audio_file)
+        if state.is_done(audio_file) or (not retry_failed and previous and previous["status"] == "failed"):
+            report["skipped"] += 1
+            report["results"][audio_file] = dict(previous, skipped=True)
+        else:
+            pending.append(audio_file)
+
+    print(f"{len(audio_files)} file(s) found, {report['skipped']} already processed, {len(pending)} to process")
+    if not pending:
+        report["finished"] = datetime.now().isoformat()
+        return report
+
+    # Warm the shared model before the workers start
+    load_speaker_model()
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_file, audio_file, state, cluster, output_profile): audio_file for audio_file in pending}
+        for done, future in enumerate(as_completed(futures), 1):
+            audio_file = futures[future]
+            result = future.result()
+            report["results"][audio_file] = result
+            if result["status"] == "completed":
+                report["completed"] += 1
+                report["audio_seconds"] += result["duration_seconds"] or 0
+                print(f"[{done}/{len(pending)}] {audio_file} -> {result['conversation_id']} ({result['elapsed_seconds']}s)")
+            else:
+                report["failed"] += 1
+                print(f"[{done}/{len(pending)}] {audio_file} failed: {result['error']}")
+
+    report["elapsed_seconds"] = round(time.time() - start, 2)
+    report["finished"] = datetime.now().isoformat()
+    return report
+
+def main():
+    """Process command line arguments and run the batch"""
+    parser = argparse.ArgumentParser(description="Process many conversation recordings.")
+    parser.add_argument("inputs", nargs="*", help="Audio files, directories or glob patterns")
+    parser.add_argument("--manifest", action="append", help="File listing one path or glob per line (repeatable)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Recordings processed concurrently")
+    parser.add_argument("--cluster", action="store_true", help="Identify speakers once per voice cluster")
+    parser.add_argument("--state-file", default=BATCH_STATE_FILE, help="Progress file used to resume")
+    parser.add_argument("--skip-failed", action="store_true", help="Don't retry files that failed in an earlier run")
+    parser.add_argument("--output-profile", choices=sorted(OUTPUT_PROFILES), default=DEFAULT_OUTPUT_PROFILE,
+                        help="minimal skips the speakers/ links and legacy copies (see generate_views.py)")
+    parser.add_argument("--report", help="Report path (default: batch_report_<timestamp>.json)")
+
+    args = parser.parse_args()
+
+    audio_files = find_audio_files(args.inputs, args.manifest)
+    if not audio_files:
+        print("No audio files found")
+        sys.exit(1)
+
+    report = run_batch(audio_files, args.workers, args.cluster, args.state_file, retry_failed=not args.skip_failed,
+                       output_profile=args.output_profile)
+
+    report_path = args.report or f"batch_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    atomic_write_json(report_path, report)
+
+    print(f"\nBatch completed:")
+    print(f"  Processed: {report['completed']}")
+    print(f"  Skipped (already processed): {report['skipped']}")
+    print(f"  Failed: {report['failed']}")
+    print(f"  Audio processed: {report['audio_seconds'] / 3600:.2f}h")
+    print(f"Report saved to: {report_path}")
+
+    if report["failed"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+"""
+Index of processed conversations.
+
+Keeps a small JSON file in the processed conversations folder that maps each
+speaker to the conversations they appear in, so archive-wide operations such
+as renaming a speaker only need to open the conversations that are actually
+affected. It also keeps per-speaker statistics (talk time, utterance and
+conversation counts, confidence distribution, last seen) that are updated
+incrementally as conversations are added, changed or removed, and maps
+the content hash of each original recording to its conversation so
+re-uploads can be recognised. The index is
+rebuilt from the metadata.json files whenever it is missing or outdated.
+
+Updates don't rewrite the index: each changed conversation entry is
+appended as one line to conversation_index.log, and readers replay the log
+on top of the conversation_index.json snapshot. Each process keeps the
+replayed index in memory and only reads log lines appended since its last
+load. The snapshot is rewritten and the log emptied once the log holds
+INDEX_LOG_COMPACT_ENTRIES entries.
+
+The transcript search database (see transcript_search.py) is updated
+alongside it.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from transcript_search import index_conversations, remove_conversation_from_search
+
+INDEX_FILENAME = "conversation_index.json"
+INDEX_LOG_FILENAME = "conversation_index.log"
+INDEX_VERSION = 3
+
+# Log entries after which the snapshot is rewritten and the log emptied
+INDEX_LOG_COMPACT_ENTRIES = 500
+
+# Read size when hashing audio files
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Number of equal-width confidence buckets in the speaker statistics
+CONFIDENCE_BUCKETS = 10
+
+# Serializes index updates from concurrent jobs in this process
+_index_lock = threading.RLock()
+
+# Replayed index per processed folder: snapshot identity, log position and entries
+_loaded = {}
+
+def _atomic_write(path, write):
+    """
+    Replace a file atomically with what write(f) puts in a temporary file
+
+    The temporary file has a unique name in the same folder, so concurrent
+    writers (threads or processes) never write into each other's file.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=f".{os.path.basename(path)}.",
+                                     suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            write(f)
+        # mkstemp creates the file private; keep the permissions of the file it replaces
+        os.chmod(temp_path, os.stat(path).st_mode & 0o777 if os.path.exists(path) else 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def atomic_write_json(path, data, indent=2):
+    """Write JSON to a file by replacing it atomically"""
+    _atomic_write(path, lambda f: json.dump(data, f, indent=indent))
+
+def atomic_write_text(path, content):
+    """Write text to a file by replacing it atomically"""
+    _atomic_write(path, lambda f: f.write(content))
+
+def hash_file(path):
+    """SHA-256 of a file's content, used to recognise re-uploaded recordings"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def index_path(processed_dir):
+    """Path of the conversation index file"""
+    return os.path.join(processed_dir, INDEX_FILENAME)
+
+def index_log_path(processed_dir):
+    """Path of the conversation index update log"""
+    return os.path.join(processed_dir, INDEX_LOG_FILENAME)
+
+class _LogLock:
+    """
+    Cross-process lock on the index log (no-op without fcntl)
+
+    Appends and compaction hold it exclusively, loads shared, so a reader
+    never sees the snapshot and the log halfway through a compaction.
+    """
+
+    def __init__(self, processed_dir, exclusive):
+        self.path = index_log_path(processed_dir)
+        self.exclusive = exclusive
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+        return self.file
+
+    def __exit__(self, *exc):
+        self.file.close()  # Closing releases the lock
+
+def _snapshot_key(processed_dir):
+    """Identity of the snapshot file, which changes whenever it is replaced"""
+    try:
+        stat = os.stat(index_path(processed_dir))
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+def _speaker_contributions(utterances):
+    """Per-speaker totals for one conversation"""
+    contributions = {}
+    for utterance in utterances:
+        stats = contributions.setdefault(utterance["speaker"], {
+            "talk_time_ms": 0,
+            "utterances": 0,
+            "confidence_sum": 0.0,
+            "max_confidence": 0.0,
+            "confidence_histogram": [0] * CONFIDENCE_BUCKETS
+        })
+        confidence = utterance.get("confidence", 0.0)
+        bucket = min(max(int(confidence * CONFIDENCE_BUCKETS), 0), CONFIDENCE_BUCKETS - 1)
+
+        stats["talk_time_ms"] += max(utterance.get("end_ms", 0) - utterance.get("start_ms", 0), 0)
+        stats["utterances"] += 1
+        stats["confidence_sum"] += confidence
+        stats["max_confidence"] = max(stats["max_confidence"], confidence)
+        stats["confidence_histogram"][bucket] += 1
+    return contributions
+
+def _conversation_entry(metadata):
+    """Build the index entry for a conversation from its metadata"""
+    contributions = _speaker_contributions(metadata.get("utterances", []))
+    return {
+        "speakers": sorted(contributions),
+        "date_processed": metadata.get("date_processed"),
+        "legacy_transcript": metadata.get("legacy_transcript"),
+        "content_hash": metadata.get("content_hash"),
+        "speaker_stats": contributions
+    }
+
+def _speaker_map(conversations):
+    """Derive the speaker -> conversations mapping"""
+    speakers = {}
+    for conversation_id, entry in conversations.items():
+        for speaker in entry["speakers"]:
+            speakers.setdefault(speaker, []).append(conversation_id)
+    for conversation_ids in speakers.values():
+        conversation_ids.sort()
+    return speakers
+
+def _aggregate_speaker(index, speaker_name):
+    """Combine a speaker's per-conversation totals into their statistics"""
+    stats = {
+        "talk_time_ms": 0,
+        "utterances": 0,
+        "conversations": 0,
+        "average_confidence": 0.0,
+        "max_confidence": 0.0,
+        "confidence_histogram": [0] * CONFIDENCE_BUCKETS,
+        "last_seen": None
+    }
+    confidence_sum = 0.0
+    for conversation_id in index["speakers"].get(speaker_name, []):
+        entry = index["conversations"][conversation_id]
+        contribution = entry["speaker_stats"][speaker_name]
+        stats["talk_time_ms"] += contribution["talk_time_ms"]
+        stats["utterances"] += contribution["utterances"]
+        stats["conversations"] += 1
+        stats["max_confidence"] = max(stats["max_confidence"], contribution["max_confidence"])
+        for bucket, count in enumerate(contribution["confidence_histogram"]):
+            stats["confidence_histogram"][bucket] += count
+        confidence_sum += contribution["confidence_sum"]
+        if entry["date_processed"] and (stats["last_seen"] is None or entry["date_processed"] > stats["last_seen"]):
+            stats["last_seen"] = entry["date_processed"]
+
+    if stats["utterances"]:
+        stats["average_confidence"] = round(confidence_sum / stats["utterances"], 4)
+    return stats
+
+def _set_conversation(index, conversation_id, entry):
+    """
+    Replace (or with entry None, remove) a conversation in the index
+
+    Only the speakers of the old and new entry have their conversation
+    lists and statistics recomputed.
+    """
+    affected = set()
+    old_entry = index["conversations"].pop(conversation_id, None)
+    if old_entry and index["hashes"].get(old_entry.get("content_hash")) == conversation_id:
+        del index["hashes"][old_entry["content_hash"]]
+    if old_entry:
+        for speaker in old_entry["speakers"]:
+            affected.add(speaker)
+            conversation_ids = index["speakers"].get(speaker, [])
+            if conversation_id in conversation_ids:
+                conversation_ids.remove(conversation_id)
+            if not conversation_ids:
+                index["speakers"].pop(speaker, None)
+
+    if entry is not None:
+        index["conversations"][conversation_id] = entry
+        if entry.get("content_hash"):
+            index["hashes"][entry["content_hash"]] = conversation_id
+        for speaker in entry["speakers"]:
+            affected.add(speaker)
+            conversation_ids = index["speakers"].setdefault(speaker, [])
+            conversation_ids.append(conversation_id)
+            conversation_ids.sort()
+
+    for speaker in affected:
+        if speaker in index["speakers"]:
+            index["speaker_stats"][speaker] = _aggregate_speaker(index, speaker)
+        else:
+            index["speaker_stats"].pop(speaker, None)
+
+def _write_snapshot(processed_dir, index):
+    """Write the index as the new snapshot and empty the log (caller holds the exclusive log lock)"""
+    atomic_write_json(index_path(processed_dir), index)
+    with open(index_log_path(processed_dir), 'w'):
+        pass
+    _loaded[processed_dir] = {"snapshot": _snapshot_key(processed_dir), "offset": 0, "entries": 0,
+                              "index": index}
+
+def rebuild_index(processed_dir):
+    """
+    Rebuild the conversation index by scanning every metadata.json
+
+    Args:
+        processed_dir: Path to the processed conversations folder
+
+    Returns:
+        dict: The rebuilt index
+    """
+    with _index_lock:
+        conversations = {}
+        if os.path.isdir(processed_dir):
+            for conversation_id in sorted(os.listdir(processed_dir)):
+                metadata_path = os.path.join(processed_dir, conversation_id, "metadata.json")
+                if not os.path.exists(metadata_path):
+                    continue
+                try:
+                    with open(metadata_path, 'r') as f:
+                        metadata = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"Skipping {conversation_id} in index: {e}")
+                    continue
+                conversations[conversation_id] = _conversation_entry(metadata)
+
+        index = {
+            "version": INDEX_VERSION,
+            "conversations": conversations,
+            "speakers": _speaker_map(conversations)
+        }
+        index["speaker_stats"] = {speaker: _aggregate_speaker(index, speaker) for speaker in index["speakers"]}
+        index["hashes"] = {
+            entry["content_hash"]: conversation_id
+            for conversation_id, entry in conversations.items() if entry.get("content_hash")
+        }
+        os.makedirs(processed_dir, exist_ok=True)
+        with _LogLock(processed_dir, exclusive=True):
+            _write_snapshot(processed_dir, index)
+        return index
+
+def _replay(processed_dir, loaded):
+    """Apply the log lines appended since the last load"""
+    with open(index_log_path(processed_dir), 'rb') as f:
+        f.seek(loaded["offset"])
+        data = f.read()
+    # A line without its newline is still being written
+    complete = data[:data.rfind(b"\n") + 1]
+    for line in complete.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        _set_conversation(loaded["index"], record["conversation_id"], record["entry"])
+        loaded["entries"] += 1
+    loaded["offset"] += len(complete)
+
+def load_index(processed_dir):
+    """
+    Load the conversation index, rebuilding it if missing or outdated
+
+    The returned index is shared with later calls in this process; treat
+    it as read-only and change it through update_conversation(s) and
+    remove_conversation.
+    """
+    with _index_lock:
+        os.makedirs(processed_dir, exist_ok=True)
+        with _LogLock(processed_dir, exclusive=False):
+            loaded = _loaded.get(processed_dir)
+            snapshot = _snapshot_key(processed_dir)
+            log_size = os.path.getsize(index_log_path(processed_dir))
+            if loaded and (loaded["snapshot"] != snapshot or log_size < loaded["offset"]):
+                loaded = None  # Compacted or rebuilt by another process
+            if loaded is None and snapshot is not None:
+                try:
+                    with open(index_path(processed_dir), 'r') as f:
+                        index = json.load(f)
+                    if index.get("version") == INDEX_VERSION:
+                        loaded = {"snapshot": snapshot, "offset": 0, "entries": 0, "index": index}
+                except (OSError, ValueError):
+                    pass
+            if loaded is not None:
+                try:
+                    _replay(processed_dir, loaded)
+                    _loaded[processed_dir] = loaded
+                    return loaded["index"]
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Rebuilding conversation index: {e}")
+        return rebuild_index(processed_dir)
+
+def _append_entries(processed_dir, entries):
+    """
+    Log changed conversation entries (None removes the conversation)
+
+    The index is compacted into a new snapshot once the log holds
+    INDEX_LOG_COMPACT_ENTRIES entries.
+    """
+    load_index(processed_dir)
+    lines = "".join(json.dumps({"conversation_id": conversation_id, "entry": entry}) + "\n"
+                    for conversation_id, entry in entries.items())
+    with _LogLock(processed_dir, exclusive=True) as log:
+        log.write(lines)
+        log.flush()
+        os.fsync(log.fileno())
+
+    index = load_index(processed_dir)
+    loaded = _loaded[processed_dir]
+    if loaded["entries"] >= INDEX_LOG_COMPACT_ENTRIES:
+        with _LogLock(processed_dir, exclusive=True):
+            # Pick up entries appended by other processes before they're dropped with the log
+            if loaded["snapshot"] == _snapshot_key(processed_dir):
+                _replay(processed_dir, loaded)
+                _write_snapshot(processed_dir, index)
+    return index
+
+def _update_search(update, *args):
+    """Keep the transcript search database in step (it can always be rebuilt)"""
+    try:
+        update(*args)
+    except Exception as e:
+        print(f"Error updating search index: {e}")
+
+def update_conversation(processed_dir, conversation_id, metadata):
+    """Add or refresh a conversation's entry in the index"""
+    update_conversations(processed_dir, {conversation_id: metadata})
+
+def update_conversations(processed_dir, metadata_by_id):
+    """
+    Add or refresh several conversations
+
+    Only the changed entries are appended to the index log, so the cost
+    doesn't grow with the size of the archive.
+    """
+    if not metadata_by_id:
+        return
+    with _index_lock:
+        _append_entries(processed_dir, {
+            conversation_id: _conversation_entry(metadata)
+            for conversation_id, metadata in metadata_by_id.items()
+        })
+        _update_search(index_conversations, processed_dir, metadata_by_id)
+
+def remove_conversation(processed_dir, conversation_id):
+    """Remove a conversation from the index"""
+    with _index_lock:
+        if conversation_id in load_index(processed_dir)["conversations"]:
+            _append_entries(processed_dir, {conversation_id: None})
+        _update_search(remove_conversation_from_search, processed_dir, conversation_id)
+
+def get_speaker_conversations(processed_dir, speaker_name):
+    """Get the IDs of the conversations a speaker appears in"""
+    return list(load_index(processed_dir)["speakers"].get(speaker_name, []))
+
+def get_speaker_stats(processed_dir):
+    """Get the statistics of every speaker in the archive"""
+    return load_index(processed_dir)["speaker_stats"]
+
+def find_conversation_by_hash(processed_dir, content_hash):
+    """Get the ID of the conversation made from a recording with this content hash"""
+    return load_index(processed_dir)["hashes"].get(content_hash)
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Write-behind queue for embeddings auto-enrolled during processing.
+
+Processing used to check and upsert each accepted embedding in the middle
+of the identification loop. Now it only appends the embedding to the
+process's queue file in processed_conversations/ (one JSON line, fsynced).
+A background flusher then takes everything queued so far and:
+
+- Drops near-duplicates within the batch and against recently enrolled
+  vectors in one matrix product (the index is eventually consistent, so
+  fresh upserts may not be visible to queries yet)
+- Checks the survivors against the speaker database with concurrent queries
+- Upserts what is left in chunks
+
+Several processes (backend jobs, batch_process.py) share the folder, so
+each process writes its own enrollment_queue.<name>.jsonl and holds an
+exclusive lock on it while it runs. The offset of the last flushed record
+is saved next to the file. A queue file nobody holds a lock on belongs to a
+process that exited before flushing: the next queue opened in the folder
+adopts its unflushed records. IDs are assigned when a record is queued,
+which makes a replay idempotent. A batch that fails with a transient
+error (see vector_store) is retried as a whole; otherwise its records are
+written one by one, and those that still fail are moved to
+enrollment_dead_letter.jsonl instead of blocking the queue. Pending
+records can also be flushed by hand:
+
+    python enrollment_queue.py
+"""
+
+import os
+import glob
+import json
+import time
+import uuid
+import atexit
+import threading
+from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from vector_store import get_vector_store, _is_retryable
+from conversation_index import atomic_write_json
+
+# Queue files are locked by their process (advisory locks, POSIX only)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Queue files are enrollment_queue.<name>.jsonl, enrollment_queue.jsonl
+# is the shared file of older versions
+QUEUE_PREFIX = "enrollment_queue"
+QUEUE_SUFFIX = ".jsonl"
+OFFSET_SUFFIX = ".offset.json"
+
+# Records that can't be written (e.g. rejected by the index), with their error
+DEAD_LETTER_FILE = "enrollment_dead_letter.jsonl"
+
+# Defined here as well to avoid importing the model stack
+DUPLICATE_SIMILARITY_THRESHOLD = 0.98
+
+# The flusher waits this long for more records before writing a batch
+FLUSH_INTERVAL_SECONDS = 1.0
+MAX_BATCH_SIZE = 256
+UPSERT_CHUNK_SIZE = 100
+QUERY_THREADS = 8
+
+# Recently enrolled vectors kept in memory for the duplicate check
+RECENT_WINDOW = 4096
+
+# Outcomes ("added", "duplicate" or "failed") remembered for wait_for and when_done
+OUTCOME_WINDOW = 65536
+OUTCOMES = ("added", "duplicate", "failed")
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+def _try_lock(f):
+    """Take the exclusive lock of an open queue file (True without fcntl)"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+def _offset_path(queue_path):
+    return queue_path[:-len(QUEUE_SUFFIX)] + OFFSET_SUFFIX
+
+def _read_unflushed(queue_path):
+    """Complete records of a queue file after its saved offset"""
+    offset = 0
+    if os.path.exists(_offset_path(queue_path)):
+        with open(_offset_path(queue_path), 'r') as f:
+            offset = json.load(f).get("offset", 0)
+    records = []
+    with open(queue_path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # Torn write - the record never finished
+            if line.strip():
+                records.append(json.loads(line))
+    return records
+
+class RetryBatch(Exception):
+    """Part of a batch failed transiently and goes back to the front of the queue"""
+
+    def __init__(self, remaining):
+        super().__init__(f"{len(remaining)} record(s) left to write")
+        self.remaining = remaining
+
+class EnrollmentQueue:
+    """Durable queue of embeddings waiting to be added to the speaker database"""
+
+    def __init__(self, processed_dir, index=None, adopt_unlocked=None):
+        """
+        Args:
+            processed_dir: Processed conversations folder holding the queue files
+            index: Vector store to write to (default: the shared one)
+            adopt_unlocked: Adopt queue files without an owner; by default
+                only when their owner can be told apart (fcntl locks)
+        """
+        self.processed_dir = processed_dir
+        self.index = index or get_vector_store()
+        os.makedirs(processed_dir, exist_ok=True)
+
+        name = f"{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        self.queue_path = os.path.join(processed_dir, f"{QUEUE_PREFIX}.{name}{QUEUE_SUFFIX}")
+        self.offset_path = _offset_path(self.queue_path)
+        self.file = open(self.queue_path, 'ab')
+        _try_lock(self.file)
+
+        # pending: (end offset in the queue file, record) not yet flushed
+        self.pending = []
+        self.flushing = 0
+        self.flush_requested = False
+        self.condition = threading.Condition()
+        self.recent = np.zeros((0, 0), dtype=np.float32)
+        self.outcomes = OrderedDict()
+        self.watchers = []  # (IDs, callback) waiting for outcomes
+        self.stats = {"queued": 0, "upserted": 0, "duplicates_in_batch": 0, "duplicates_in_bank": 0, "failed": 0}
+        self.committed = 0
+
+        self._adopt_orphans(fcntl is not None if adopt_unlocked is None else adopt_unlocked)
+
+        flusher = threading.Thread(target=self._run_flusher, name="enrollment-flusher", daemon=True)
+        flusher.start()
+
+    def _adopt_orphans(self, adopt):
+        """Move the unflushed records of queue files whose process is gone into this queue"""
+        if not adopt:
+            return
+        adopted = 0
+        for path in sorted(glob.glob(os.path.join(self.processed_dir, f"{QUEUE_PREFIX}*{QUEUE_SUFFIX}"))):
+            if path == self.queue_path:
+                continue
+            try:
+                f = open(path, 'rb')
+            except FileNotFoundError:
+                continue
+            with f:
+                # Locked: its process is still running. No links left: another
+                # queue adopted it while we waited
+                if not _try_lock(f) or os.fstat(f.fileno()).st_nlink == 0:
+                    continue
+                records = _read_unflushed(path)
+                for record in records:
+                    self._append(record)
+                adopted += len(records)
+                if os.path.exists(_offset_path(path)):
+                    os.remove(_offset_path(path))
+                os.remove(path)
+        if adopted:
+            print(f"Recovered {adopted} queued enrollment(s)")
+
+    def _size(self):
+        return os.fstat(self.file.fileno()).st_size
+
+    def _append(self, record):
+        """Write a record to the queue file (fsynced) and mark it pending"""
+        line = (json.dumps(record) + "\n").encode()
+        with self.condition:
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending.append((self._size(), record))
+            self.stats["queued"] += 1
+            self.condition.notify_all()
+
+    def enqueue(self, embedding, speaker_name, source_file, is_short=False, duration_seconds=None):
+        """
+        Queue an embedding for the speaker database
+
+        Returns:
+            str: ID the embedding will have in the database
+        """
+        vector_id = f"speaker_{speaker_name.replace(' ', '_')}_{uuid.uuid4().hex[:8]}"
+        metadata = {
+            "speaker_name": speaker_name,
+            "source_file": os.path.basename(source_file),
+            "is_short_utterance": is_short
+        }
+        if duration_seconds is not None:
+            metadata["duration_seconds"] = duration_seconds
+
+        self._append({"id": vector_id, "values": np.asarray(embedding, dtype=np.float32).ravel().tolist(),
+                      "metadata": metadata})
+        return vector_id
+
+    def _run_flusher(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                # Let more records gather unless the batch is full or a flush was requested
+                self.condition.wait_for(lambda: len(self.pending) >= MAX_BATCH_SIZE or self.flush_requested,
+                                        timeout=FLUSH_INTERVAL_SECONDS)
+                batch = self.pending[:MAX_BATCH_SIZE]
+                del self.pending[:MAX_BATCH_SIZE]
+                if not self.pending:
+                    self.flush_requested = False
+                self.flushing += 1
+
+            try:
+                try:
+                    self._write_batch([record for _, record in batch])
+                    self._commit(batch[-1][0])
+                except Exception as e:
+                    if _is_retryable(e):
+                        raise
+                    # Find the records that can't be written instead of retrying them forever
+                    print(f"Enrollment flush failed, writing the batch record by record: {e}")
+                    remaining = self._write_one_by_one(batch)
+                    if remaining:
+                        raise RetryBatch(remaining)
+            except Exception as e:
+                remaining = e.remaining if isinstance(e, RetryBatch) else batch
+                print(f"Enrollment flush failed, will retry {len(remaining)} record(s): {e}")
+                with self.condition:
+                    self.pending[:0] = remaining
+                time.sleep(FLUSH_INTERVAL_SECONDS)
+            finally:
+                with self.condition:
+                    self.flushing -= 1
+                    self.condition.notify_all()
+
+    def _write_one_by_one(self, batch):
+        """
+        Write (offset, record) pairs separately, dead-lettering permanent failures
+
+        Returns:
+            list: The pairs from the first transient failure on (to retry later)
+        """
+        for position, (offset, record) in enumerate(batch):
+            try:
+                self._write_batch([record])
+            except Exception as e:
+                if _is_retryable(e):
+                    return batch[position:]
+                self._dead_letter(record, e)
+            self._commit(offset)
+        return []
+
+    def _dead_letter(self, record, error):
+        """Move a record that can't be written to the dead-letter file"""
+        print(f"Enrollment {record.get('id')} can't be written, moved to {DEAD_LETTER_FILE}: {error}")
+        line = json.dumps({"record": record, "error": f"{type(error).__name__}: {error}",
+                           "failed": datetime.now().isoformat()}) + "\n"
+        with open(os.path.join(self.processed_dir, DEAD_LETTER_FILE), 'a') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self.stats["failed"] += 1
+        self._record_outcomes({record.get("id"): "failed"})
+
+    def _write_batch(self, records):
+        """Dedupe a batch against itself, recent enrollments and the bank, then upsert it"""
+        vectors = np.array([r["values"] for r in records], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        # Within the batch: keep a record only if no earlier kept record is a near-duplicate
+        similarity = vectors @ vectors.T
+        keep = np.ones(len(records), dtype=bool)
+        for i in range(1, len(records)):
+            if (similarity[i, :i][keep[:i]] >= DUPLICATE_SIMILARITY_THRESHOLD).any():
+                keep[i] = False
+        if len(self.recent):
+            keep &= (vectors @ self.recent.T).max(axis=1) < DUPLICATE_SIMILARITY_THRESHOLD
+        self.stats["duplicates_in_batch"] += int((~keep).sum())
+
+        # Against the bank: one query per survivor, sent concurrently
+        candidates = np.flatnonzero(keep)
+        def is_in_bank(i):
+            results = self.index.query(vector=records[i]["values"], top_k=1)
+            matches = results["matches"]
+            return bool(matches) and matches[0]["score"] >= DUPLICATE_SIMILARITY_THRESHOLD
+        with ThreadPoolExecutor(max_workers=QUERY_THREADS) as executor:
+            in_bank = list(executor.map(is_in_bank, candidates))
+        for i, duplicate in zip(candidates, in_bank):
+            if duplicate:
+                keep[i] = False
+                self.stats["duplicates_in_bank"] += 1
+
+        accepted = [records[i] for i in np.flatnonzero(keep)]
+        for start in range(0, len(accepted), UPSERT_CHUNK_SIZE):
+            chunk = accepted[start:start + UPSERT_CHUNK_SIZE]
+            self.index.upsert(vectors=[(r["id"], r["values"], r["metadata"]) for r in chunk])
+        self.stats["upserted"] += len(accepted)
+
+        self._record_outcomes({record["id"]: "added" if kept else "duplicate" for record, kept in zip(records, keep)})
+
+        if len(accepted):
+            kept_vectors = vectors[keep]
+            self.recent = kept_vectors if not len(self.recent) else np.vstack([self.recent, kept_vectors])
+            self.recent = self.recent[-RECENT_WINDOW:]
+
+    def _record_outcomes(self, outcomes):
+        """Remember the outcome of written records and notify when_done callbacks"""
+        with self.condition:
+            self.outcomes.update(outcomes)
+            while len(self.outcomes) > OUTCOME_WINDOW:
+                self.outcomes.popitem(last=False)
+            ready = [w for w in self.watchers if all(i in self.outcomes for i in w[0])]
+            self.watchers = [w for w in self.watchers if w not in ready]
+            counts = [(callback, self._counts(ids)) for ids, callback in ready]
+            self.condition.notify_all()
+
+        for callback, outcome_counts in counts:
+            try:
+                callback(outcome_counts)
+            except Exception as e:
+                print(f"Error reporting enrollment outcomes: {e}")
+
+    def _counts(self, ids):
+        """Outcome counts of some IDs (caller holds the condition)"""
+        counts = dict.fromkeys(OUTCOMES + ("pending",), 0)
+        for vector_id in ids:
+            counts[self.outcomes.get(vector_id, "pending")] += 1
+        return counts
+
+    def _commit(self, offset):
+        """Record the flushed offset; reset the queue file once everything is flushed"""
+        with self.condition:
+            # Only this process writes the file, and appends hold the condition
+            if not self.pending and self.flushing == 1 and self._size() == offset:
+                self.file.truncate(0)
+                self.file.seek(0)
+                offset = 0
+            self.committed = offset
+            atomic_write_json(self.offset_path, {"offset": offset})
+
+    def wait_for(self, ids, timeout=5):
+        """
+        Wait (up to timeout, 0 to only look) for queued embeddings to be written or dropped
+
+        Returns:
+            dict: Counts of "added", "duplicate", "failed" and still "pending" IDs
+        """
+        with self.condition:
+            if timeout:
+                self.condition.wait_for(lambda: all(i in self.outcomes for i in ids), timeout=timeout)
+            return self._counts(ids)
+
+    def when_done(self, ids, callback):
+        """
+        Call callback(counts) once every ID has an outcome (see wait_for)
+
+        The callback runs on the flusher thread, or right away if the IDs
+        are already done, so processing never waits for the database.
+        """
+        ids = list(ids)
+        with self.condition:
+            done = all(i in self.outcomes for i in ids)
+            if done:
+                counts = self._counts(ids)
+            else:
+                self.watchers.append((ids, callback))
+        if done:
+            callback(counts)
+
+    def flush(self, timeout=60):
+        """Wait until every queued embedding has been written"""
+        with self.condition:
+            self.flush_requested = True
+            self.condition.notify_all()
+            self.condition.wait_for(lambda: not self.pending and not self.flushing, timeout=timeout)
+        if hasattr(self.index, "flush"):
+            self.index.flush()
+
+    def close(self, timeout=60):
+        """Flush, then remove the queue file if nothing is left in it"""
+        self.flush(timeout=timeout)
+        with self.condition:
+            if self.pending or self.flushing or self._size():
+                return  # Adopted by the next queue opened in the folder
+            self.file.close()
+            for path in (self.queue_path, self.offset_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+def get_enrollment_queue(processed_dir):
+    """Get the enrollment queue of a processed conversations folder (one per process)"""
+    key = os.path.abspath(processed_dir)
+    with _queues_lock:
+        if key not in _queues:
+            _queues[key] = EnrollmentQueue(processed_dir)
+            # Scripts often exit right after processing
+            atexit.register(_queues[key].close)
+        return _queues[key]
+
+def main():
+    """Flush embeddings left in the queue by an interrupted run"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Flush pending auto-enrollments to the speaker database.")
+    parser.add_argument("--processed-dir", default="processed_conversations",
+                        help="Processed conversations folder (default: processed_conversations)")
+    args = parser.parse_args()
+
+    # Without file locks, running processes can't be told apart from exited
+    # ones: only flush by hand while nothing else is processing
+    queue = EnrollmentQueue(args.processed_dir, adopt_unlocked=True)
+    pending = len(queue.pending)
+    queue.close()
+    print(f"Flushed {pending} queued enrollment(s): {queue.stats['upserted']} added, "
+          f"{queue.stats['duplicates_in_batch'] + queue.stats['duplicates_in_bank']} duplicates skipped, "
+          f"{queue.stats['failed']} failed (see {DEAD_LETTER_FILE})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Script to measure identification accuracy and speed under different settings.
+
+Processed conversations with known speakers are replayed from their stored
+embeddings (embeddings.npy), so no audio is decoded, no model is run and
+no external service is needed (clustering runs against the same local
+bank). The ground truth is one of:
+
+- A labels file (--labels): {"conversation_id": {"utterance_001": "Speaker", ...}}
+- By default, the utterances whose speaker was renamed by hand (verified)
+- With --baseline, the pipeline's own labels. That measures agreement with
+  the current pipeline, not accuracy, and is reported as such
+
+Conversations are split into folds. Each fold is identified against a
+speaker bank built from the labeled utterances of the other folds, so an
+utterance is never matched against its own embedding. Every configuration
+is reported in one table:
+
+- Accuracy (overall and for short utterances), unknown and false-accept rates
+- Equal error rate of the match scores (genuine vs. best impostor speaker)
+- Latency per utterance (p50/p95) and throughput
+
+A configuration sets the index backend (exact float32, int8 local bank,
+or the live Pinecone index), the query batch size, clustering, the match
+threshold and the short-utterance cutoff:
+
+    python evaluate_identification.py
+    python evaluate_identification.py --config "strict:match_threshold=0.5" \\
+        --config "int8-batched:backend=int8,batch_size=64" --output eval.json
+
+The pinecone backend queries the live database, which already contains
+embeddings enrolled from these conversations, so its accuracy is optimistic;
+use it for latency.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+from conversation_index import atomic_write_json
+from speaker_clustering import identify_clusters
+
+PROCESSED_DIR = "processed_conversations"
+EMBEDDINGS_FILE = "embeddings.npy"
+
+DEFAULT_FOLDS = 5
+
+# Candidates fetched per utterance to score the best impostor speaker for the EER
+SCORE_TOP_K = 50
+
+DEFAULT_CONFIG = {
+    "backend": "exact",       # exact | int8 | pinecone
+    "batch_size": 1,          # Utterances per query (exact backend only)
+    "cluster": False,         # Identify once per diarization cluster
+    "match_threshold": 0.40,  # Minimum score to accept a match
+    "short_seconds": 0.7      # Utterances shorter than this count as short
+}
+
+DEFAULT_CONFIGS = [
+    {"name": "baseline"},
+    {"name": "batched", "batch_size": 64},
+    {"name": "int8", "backend": "int8"},
+    {"name": "cluster", "cluster": True}
+]
+
+GROUND_TRUTHS = ("labels", "verified", "baseline")
+
+class ExactBank:
+    """Brute-force float32 speaker bank with the Pinecone query interface"""
+
+    def __init__(self, ids, vectors, speakers):
+        self.ids = ids
+        self.vectors = vectors
+        self.speakers = speakers
+
+    def query(self, vector, top_k=10, include_metadata=False, **kwargs):
+        rows, scores = self.query_batch(np.asarray(vector, dtype=np.float32)[None, :], top_k)[0]
+        matches = []
+        for row, score in zip(rows, scores):
+            match = {"id": self.ids[row], "score": float(score)}
+            if include_metadata:
+                match["metadata"] = {"speaker_name": self.speakers[row]}
+            matches.append(match)
+        return {"matches": matches}
+
+    def query_batch(self, queries, top_k):
+        """Best rows and scores for several normalized queries in one matrix product"""
+        scores = queries @ self.vectors.T
+        top_k = min(top_k, scores.shape[1])
+        if not top_k:
+            return [(np.array([], dtype=int), np.array([], dtype=np.float32))] * len(queries)
+        top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        results = []
+        for q in range(len(queries)):
+            order = top[q][np.argsort(-scores[q, top[q]])]
+            results.append((order, scores[q, order]))
+        return results
+
+def load_labeled_conversations(processed_dir=PROCESSED_DIR, ground_truth="verified", labels=None):
+    """
+    Load the labeled utterances and their stored embeddings
+
+    Args:
+        processed_dir: Processed conversations folder
+        ground_truth: "labels" (from labels), "verified" (renamed by hand)
+            or "baseline" (the pipeline's own named speakers)
+        labels: Ground truth speaker by conversation ID and utterance ID
+
+    Returns:
+        list: One dict per conversation with id, labels, diarization labels,
+        utterance times and normalized embedding rows
+    """
+    conversations = []
+    if not os.path.isdir(processed_dir):
+        return conversations
+
+    for conversation_id in sorted(os.listdir(processed_dir)):
+        conversation_dir = os.path.join(processed_dir, conversation_id)
+        metadata_path = os.path.join(conversation_dir, "metadata.json")
+        if not os.path.exists(metadata_path):
+            continue
+        with open(metadata_path, "r") as f:
+            metadata = json.load(f)
+
+        info = metadata.get("embeddings") or {}
+        embeddings_path = os.path.join(conversation_dir, info.get("file", EMBEDDINGS_FILE))
+        if not os.path.exists(embeddings_path):
+            continue
+        embeddings = np.load(embeddings_path, mmap_mode="r")
+        if embeddings.shape[0] != len(metadata.get("utterances", [])):
+            continue
+
+        rows, truth = [], []
+        for row, utterance in enumerate(metadata["utterances"]):
+            if not embeddings[row].any():
+                continue
+            if ground_truth == "labels":
+                speaker = (labels or {}).get(conversation_id, {}).get(utterance["id"])
+            elif ground_truth == "verified":
+                speaker = utterance["speaker"] if utterance.get("verified") else None
+            else:
+                speaker = utterance["speaker"]
+            if not speaker or speaker.startswith("Unknown_"):
+                continue
+            rows.append(row)
+            truth.append(speaker)
+        if not rows:
+            continue
+
+        vectors = np.asarray(embeddings[rows], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        utterances = [metadata["utterances"][row] for row in rows]
+        conversations.append({
+            "id": conversation_id,
+            "labels": truth,
+            # Older conversations don't record the diarization label; their clusters use the true label
+            "diarization": [u.get("diarization_speaker") or label for u, label in zip(utterances, truth)],
+            "oracle_diarization": any(not u.get("diarization_speaker") for u in utterances),
+            "start_ms": [u["start_ms"] for u in utterances],
+            "end_ms": [u["end_ms"] for u in utterances],
+            "vectors": vectors
+        })
+
+    return conversations
+
+def build_bank(conversations, backend):
+    """Build a speaker bank from the labeled utterances of some conversations"""
+    ids, vectors, speakers = [], [], []
+    for conversation in conversations:
+        for row, label in enumerate(conversation["labels"]):
+            ids.append(f"{conversation['id']}_{row}")
+            speakers.append(label)
+        vectors.append(conversation["vectors"])
+    matrix = np.concatenate(vectors) if vectors else np.zeros((0, 192), dtype=np.float32)
+
+    if backend == "exact":
+        return ExactBank(ids, matrix, speakers)
+    if backend == "int8":
+        from voice_bank import LocalVoiceBank
+        bank = LocalVoiceBank(capacity=max(len(ids), 1))
+        bank.upsert([(i, v, {"speaker_name": s}) for i, v, s in zip(ids, matrix, speakers)])
+        return bank
+    raise ValueError(f"Unknown backend: {backend}")
+
+def equal_error_rate(genuine, impostor):
+    """EER of genuine and impostor scores (the rate where false accepts equal false rejects)"""
+    genuine, impostor = np.asarray(genuine), np.asarray(impostor)
+    if not len(genuine) or not len(impostor):
+        return None
+    thresholds = np.unique(np.concatenate([genuine, impostor]))
+    far = np.array([(impostor >= t).mean() for t in thresholds])
+    frr = np.array([(genuine < t).mean() for t in thresholds])
+    best = int(np.argmin(np.abs(far - frr)))
+    return float((far[best] + frr[best]) / 2)
+
+def bank_matcher(bank):
+    """Match function for identify_clusters that looks centroids up in a bank"""
+    def match(vector, confidence_threshold):
+        matches = bank.query(vector=np.asarray(vector).tolist(), top_k=1, include_metadata=True)["matches"]
+        if matches and matches[0]["score"] >= confidence_threshold:
+            return matches[0]["metadata"]["speaker_name"], matches[0]["score"], matches[0]["id"]
+        return None, 0.0, None
+    return match
+
+def score_utterances(bank, vectors, labels, enrolled):
+    """Genuine and best-impostor scores of every utterance whose speaker is enrolled"""
+    genuine, impostor = [], []
+    for vector, label in zip(vectors, labels):
+        if label not in enrolled:
+            continue
+        best = {}
+        for match in bank.query(vector=vector.tolist(), top_k=SCORE_TOP_K, include_metadata=True)["matches"]:
+            speaker = match["metadata"]["speaker_name"]
+            best[speaker] = max(best.get(speaker, -1.0), match["score"])
+        genuine.append(best.get(label, -1.0))
+        impostor.append(max([s for name, s in best.items() if name != label], default=-1.0))
+    return genuine, impostor
+
+def identify(bank, conversation, config):
+    """
+    Identify a conversation's utterances the way processing does
+
+    Returns:
+        tuple: (predicted speaker or None per utterance, list of (seconds, utterances) timings)
+    """
+    vectors = conversation["vectors"]
+    threshold = config["match_threshold"]
+    predictions = [None] * len(vectors)
+    timings = []
+
+    pending = list(range(len(vectors)))
+    if config["cluster"]:
+        utterances = [{"speaker": d, "start": s, "end": e} for d, s, e in
+                      zip(conversation["diarization"], conversation["start_ms"], conversation["end_ms"])]
+        start = time.perf_counter()
+        assignments, _ = identify_clusters(utterances, list(vectors), bank_matcher(bank), threshold, verbose=False)
+        timings.append((time.perf_counter() - start, len(assignments)))
+        for row, assignment in assignments.items():
+            predictions[row] = assignment["speaker"]
+        pending = [row for row in pending if row not in assignments]  # Outliers are looked up alone
+
+    batch_size = config["batch_size"] if hasattr(bank, "query_batch") else 1
+    for offset in range(0, len(pending), batch_size):
+        rows = pending[offset:offset + batch_size]
+        start = time.perf_counter()
+        if batch_size > 1:
+            results = bank.query_batch(vectors[rows], 1)
+            best = [(bank.speakers[r[0]], s[0]) if len(r) else (None, 0.0) for r, s in results]
+        else:
+            matches = bank.query(vector=vectors[rows[0]].tolist(), top_k=1, include_metadata=True)["matches"]
+            best = [(matches[0]["metadata"]["speaker_name"], matches[0]["score"]) if matches else (None, 0.0)]
+        timings.append((time.perf_counter() - start, len(rows)))
+        for row, (speaker, score) in zip(rows, best):
+            predictions[row] = speaker if score >= threshold else None
+
+    return predictions, timings
+
+def evaluate_config(conversations, config, folds=DEFAULT_FOLDS, ground_truth="verified"):
+    """
+    Replay identification of all conversations under one configuration
+
+    Returns:
+        dict: Accuracy, EER, latency and throughput for the configuration
+        (with ground_truth "baseline", accuracy is agreement with the pipeline)
+    """
+    config = dict(DEFAULT_CONFIG, **config)
+    if config["backend"] == "pinecone":
+        # The live database: one "fold" containing everything
+        from vector_store import get_vector_store
+        splits = [(conversations, get_vector_store(), None)]
+    else:
+        splits = []
+        for fold in range(min(folds, len(conversations))):
+            test = conversations[fold::folds]
+            train = [c for i, c in enumerate(conversations) if i % folds != fold]
+            splits.append((test, build_bank(train, config["backend"]), {l for c in train for l in c["labels"]}))
+
+    counts = {"utterances": 0, "correct": 0, "short": 0, "short_correct": 0, "unknown": 0, "false_accepts": 0}
+    genuine, impostor, timings = [], [], []
+    for test, bank, enrolled in splits:
+        for conversation in test:
+            predictions, conversation_timings = identify(bank, conversation, config)
+            timings.extend(conversation_timings)
+
+            durations = (np.array(conversation["end_ms"]) - np.array(conversation["start_ms"])) / 1000.0
+            for label, predicted, duration in zip(conversation["labels"], predictions, durations):
+                known = enrolled is None or label in enrolled
+                # Speakers missing from the bank are correctly left unknown
+                correct = predicted == label if known else predicted is None
+                is_short = duration < config["short_seconds"]
+                counts["utterances"] += 1
+                counts["correct"] += correct
+                counts["short"] += is_short
+                counts["short_correct"] += is_short and correct
+                counts["unknown"] += predicted is None
+                counts["false_accepts"] += predicted is not None and predicted != label
+
+            g, i = score_utterances(bank, conversation["vectors"], conversation["labels"],
+                                    enrolled if enrolled is not None else set(conversation["labels"]))
+            genuine.extend(g)
+            impostor.extend(i)
+
+    per_utterance_ms = np.concatenate([np.full(n, 1000 * t / n) for t, n in timings if n]) if timings else np.zeros(1)
+    total_seconds = sum(t for t, _ in timings)
+    utterances = max(counts["utterances"], 1)
+    eer = equal_error_rate(genuine, impostor)
+
+    return {
+        "name": config.get("name", "config"),
+        "config": {k: config[k] for k in DEFAULT_CONFIG},
+        "ground_truth": ground_truth,
+        "utterances": counts["utterances"],
+        "accuracy": counts["correct"] / utterances,
+        "short_accuracy": counts["short_correct"] / counts["short"] if counts["short"] else None,
+        "unknown_rate": counts["unknown"] / utterances,
+        "false_accept_rate": counts["false_accepts"] / utterances,
+        "eer": eer,
+        "latency_p50_ms": float(np.percentile(per_utterance_ms, 50)),
+        "latency_p95_ms": float(np.percentile(per_utterance_ms, 95)),
+        "throughput": counts["utterances"] / total_seconds if total_seconds else None,
+        "oracle_diarization": config["cluster"] and any(c["oracle_diarization"] for c in conversations)
+    }
+
+def parse_config(spec):
+    """Parse "name:key=value,key=value" into a configuration dict"""
+    name, _, settings = spec.partition(":")
+    config = {"name": name}
+    for setting in filter(None, settings.split(",")):
+        key, _, value = setting.partition("=")
+        key = key.strip()
+        if key not in DEFAULT_CONFIG:
+            raise ValueError(f"Unknown setting '{key}' (expected one of {', '.join(DEFAULT_CONFIG)})")
+        try:
+            config[key] = json.loads(value)
+        except json.JSONDecodeError:
+            config[key] = value.strip()
+    return config
+
+def format_rate(value):
+    return "-" if value is None else f"{100 * value:.1f}%"
+
+def print_results(results):
+    """Print the results of all configurations as one table"""
+    baseline = any(r["ground_truth"] == "baseline" for r in results)
+    if baseline:
+        print("Ground truth: the pipeline's own labels. Acc, Short, FA and EER measure agreement")
+        print("with the current pipeline, not how often identification is correct.\n")
+    accuracy = "Agree" if baseline else "Acc"
+    header = f"{'Config':<18} {'Utts':>6} {accuracy:>7} {'Short':>7} {'Unk':>7} {'FA':>7} {'EER':>7} {'p50 ms':>8} {'p95 ms':>8} {'Utt/s':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        throughput = "-" if r["throughput"] is None else f"{r['throughput']:.0f}"
+        print(f"{r['name'][:18]:<18} {r['utterances']:>6} {format_rate(r['accuracy']):>7} "
+              f"{format_rate(r['short_accuracy']):>7} {format_rate(r['unknown_rate']):>7} "
+              f"{format_rate(r['false_accept_rate']):>7} {format_rate(r['eer']):>7} "
+              f"{r['latency_p50_ms']:>8.3f} {r['latency_p95_ms']:>8.3f} {throughput:>9}")
+    if any(r["oracle_diarization"] for r in results):
+        print("\nNote: some conversations predate stored diarization labels; their clusters were seeded with the true labels.")
+
+def main():
+    """Process command line arguments and run the evaluation"""
+    parser = argparse.ArgumentParser(description="Evaluate identification accuracy and speed on labeled conversations.")
+    parser.add_argument("--config", action="append",
+                        help='Configuration "name:key=value,..." (repeatable; keys: ' + ", ".join(DEFAULT_CONFIG) + ")")
+    parser.add_argument("--processed-dir", default=PROCESSED_DIR, help="Processed conversations folder")
+    truth = parser.add_mutually_exclusive_group()
+    truth.add_argument("--labels", help='Ground truth JSON file ({"conversation_id": {"utterance_001": "Speaker", ...}})')
+    truth.add_argument("--baseline", action="store_true",
+                       help="Use the pipeline's own labels (measures agreement with the pipeline, not accuracy)")
+    parser.add_argument("--folds", type=int, default=DEFAULT_FOLDS, help=f"Cross-validation folds (default: {DEFAULT_FOLDS})")
+    parser.add_argument("-o", "--output", help="Also write the results as JSON")
+
+    args = parser.parse_args()
+
+    try:
+        configs = [parse_config(spec) for spec in args.config] if args.config else DEFAULT_CONFIGS
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    labels = None
+    if args.labels:
+        ground_truth = "labels"
+        with open(args.labels, "r") as f:
+            labels = json.load(f)
+    else:
+        ground_truth = "baseline" if args.baseline else "verified"
+
+    conversations = load_labeled_conversations(args.processed_dir, ground_truth, labels)
+    if len(conversations) < 2:
+        print("Error: At least two conversations with ground truth labels are needed")
+        if ground_truth == "verified":
+            print("Rename speakers by hand to verify them, pass a labels file with --labels, "
+                  "or compare against the pipeline's own labels with --baseline")
+        sys.exit(1)
+    print(f"Evaluating {len(configs)} configuration(s) on {sum(len(c['labels']) for c in conversations)} "
+          f"utterances from {len(conversations)} conversations ({ground_truth} ground truth)\n")
+
+    results = [evaluate_config(conversations, config, max(args.folds, 2), ground_truth) for config in configs]
+    print_results(results)
+
+    if args.output:
+        atomic_write_json(args.output, {"conversations": len(conversations), "ground_truth": ground_truth,
+                                        "results": results})
+        print(f"\nResults saved to: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Script to export processed conversations as newline-delimited JSON.
+
+Conversations are read one at a time and written out as they are read, so
+memory use stays constant however large the archive is. Each output line is
+either one utterance (the default) or one conversation:
+
+    python export_conversations.py --from 2025-01-01 --speaker "John Doe" -o export.ndjson
+"""
+
+import os
+import sys
+import json
+import argparse
+from datetime import datetime, timedelta
+
+from conversation_index import load_index
+
+# Same folder as speaker_id_testing.PROCESSED_DIR (not imported to avoid loading the model stack)
+PROCESSED_DIR = "processed_conversations"
+
+def _local_naive(moment):
+    """Convert a datetime with a timezone to naive local time, like date_processed"""
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone().replace(tzinfo=None)
+
+def parse_date_bound(value, end=False):
+    """
+    Parse an ISO date or datetime used as an export bound
+
+    A plain date used as the end bound covers that whole day. Bounds with
+    a timezone (e.g. 2025-01-01T00:00:00Z) are converted to local time, as
+    processing dates are stored in local time without one.
+    """
+    if not value:
+        return None
+    bound = _local_naive(datetime.fromisoformat(value))
+    if end and len(value) == 10:
+        bound += timedelta(days=1)
+    return bound
+
+def _in_date_range(date_processed, date_from, date_to):
+    if date_from is None and date_to is None:
+        return True
+    if not date_processed:
+        return False
+    processed = _local_naive(datetime.fromisoformat(date_processed))
+    if date_from is not None and processed < date_from:
+        return False
+    if date_to is not None and processed >= date_to:
+        return False
+    return True
+
+def _utterance_matches(utterance, speakers, min_confidence):
+    if speakers and utterance.get("speaker") not in speakers:
+        return False
+    if min_confidence is not None and utterance.get("confidence", 0.0) < min_confidence:
+        return False
+    return True
+
+def iter_export_records(processed_dir=PROCESSED_DIR, level="utterance", date_from=None, date_to=None,
+                        speakers=None, min_confidence=None):
+    """
+    Yield export records for the conversations matching the filters
+
+    The conversation index is used to skip conversations outside the date
+    range or without the requested speakers before their metadata is read.
+
+    Args:
+        processed_dir: Path to the processed conversations folder
+        level: "utterance" for one record per utterance, "conversation" for one per conversation
+        date_from: Only conversations processed at or after this datetime
+        date_to: Only conversations processed before this datetime
+        speakers: Only utterances by these speakers
+        min_confidence: Only utterances with at least this confidence (0-1)
+
+    Yields:
+        dict: One utterance or conversation record
+    """
+    speakers = set(speakers) if speakers else None
+    index = load_index(processed_dir)
+
+    for conversation_id in sorted(index["conversations"]):
+        entry = index["conversations"][conversation_id]
+        if not _in_date_range(entry.get("date_processed"), date_from, date_to):
+            continue
+        if speakers and not speakers.intersection(entry["speakers"]):
+            continue
+
+        metadata_path = os.path.join(processed_dir, conversation_id, "metadata.json")
+        try:
+            with open(metadata_path, 'r') as f:
+                metadata = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Skipping {conversation_id}: {e}", file=sys.stderr)
+            continue
+
+        utterances = [u for u in metadata.get("utterances", []) if _utterance_matches(u, speakers, min_confidence)]
+
+        if level == "conversation":
+            if not utterances and (speakers or min_confidence is not None):
+                continue
+            yield {
+                "conversation_id": conversation_id,
+                "original_audio": metadata.get("original_audio"),
+                "date_processed": metadata.get("date_processed"),
+                "duration_seconds": metadata.get("duration_seconds"),
+                "speakers": metadata.get("speakers", []),
+                "utterances": utterances
+            }
+        else:
+            for utterance in utterances:
+                record = {
+                    "conversation_id": conversation_id,
+                    "date_processed": metadata.get("date_processed")
+                }
+                record.update(utterance)
+                yield record
+
+def iter_ndjson(records):
+    """Serialize records as newline-delimited JSON lines"""
+    for record in records:
+        yield json.dumps(record) + "\n"
+
+def main():
+    """Process command line arguments and write the export"""
+    parser = argparse.ArgumentParser(description="Export processed conversations as NDJSON.")
+    parser.add_argument("--level", choices=["utterance", "conversation"], default="utterance",
+                        help="One line per utterance (default) or per conversation")
+    parser.add_argument("--from", dest="date_from", help="Only conversations processed on or after this date")
+    parser.add_argument("--to", dest="date_to", help="Only conversations processed on or before this date")
+    parser.add_argument("--speaker", action="append", help="Only utterances by this speaker (repeatable)")
+    parser.add_argument("--min-confidence", type=float, help="Only utterances with at least this confidence (0-1)")
+    parser.add_argument("--processed-dir", default=PROCESSED_DIR, help="Processed conversations folder")
+    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+
+    args = parser.parse_args()
+
+    records = iter_export_records(
+        args.processed_dir,
+        level=args.level,
+        date_from=parse_date_bound(args.date_from),
+        date_to=parse_date_bound(args.date_to, end=True),
+        speakers=args.speaker,
+        min_confidence=args.min_confidence
+    )
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        count = 0
+        for line in iter_ndjson(records):
+            output.write(line)
+            count += 1
+    finally:
+        if args.output:
+            output.close()
+
+    print(f"Exported {count} {args.level} record(s)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Script to generate the derived views of processed conversations.
+
+The canonical output of a conversation is its utterance audio, metadata.json,
+transcript.txt and embeddings.npy. Everything else can be rebuilt from
+metadata.json:
+
+- speakers: the conversation's speakers/<speaker>/ folders of links to its utterances
+- legacy_utterances: copies in the shared speaker_utterances/<speaker>/ folders
+  (with a .txt per utterance), hard-linked to the canonical audio when possible
+- legacy_transcript: transcript_<timestamp>.txt in the project folder
+
+Conversations processed with the "full" output profile already have all
+views. With the "minimal" profile (see speaker_id_testing.py
+--output-profile), and for the speakers/ links that packing removes (see
+segment_store.py), they are generated on demand, by this script or by the
+consumers that need them. metadata.json lists the views a conversation
+has in generated_views:
+
+    python generate_views.py --all
+    python generate_views.py processed_conversations/conversation_20250312_101500 --views speakers
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+
+from conversation_index import atomic_write_json, atomic_write_text, update_conversation
+from segment_store import load_segments_index, load_utterance_audio
+
+PROCESSED_DIR = "processed_conversations"
+LEGACY_UTTERANCES_DIR = "speaker_utterances"
+VIEWS = ("speakers", "legacy_utterances", "legacy_transcript")
+
+def legacy_transcript_name(conversation_id):
+    """Name of a conversation's legacy transcript (transcript_<timestamp>.txt)"""
+    return f"transcript_{conversation_id[len('conversation_'):]}.txt"
+
+def _link_or_copy(source, target, symbolic=False):
+    """Link target to source (symbolic or hard), copying where links aren't supported"""
+    if os.path.lexists(target):
+        os.remove(target)
+    try:
+        if symbolic:
+            os.symlink(os.path.relpath(source, os.path.dirname(target)), target)
+        else:
+            os.link(source, target)
+    except (OSError, AttributeError):
+        shutil.copy2(source, target)
+
+def recorded_views(metadata):
+    """Views a conversation has, per its metadata"""
+    if "generated_views" in metadata:
+        return set(metadata["generated_views"])
+    # Older conversations only record their profile; full ones had every view
+    return set(VIEWS) if metadata.get("output_profile", "full") == "full" else set()
+
+def generate_speaker_links(conversation_dir, metadata):
+    """
+    Rebuild the speakers/ folder from the utterances' current speakers
+
+    Packed conversations have no utterance files to link to, so their
+    utterances are cut out of the packed stream into the folders instead.
+    """
+    packed = load_segments_index(conversation_dir) is not None
+    speakers_dir = os.path.join(conversation_dir, "speakers")
+    if os.path.isdir(speakers_dir):
+        shutil.rmtree(speakers_dir)
+
+    for utterance in metadata["utterances"]:
+        audio_path = os.path.join(conversation_dir, utterance.get("audio_file", f"utterances/{utterance['id']}.wav"))
+        speaker_dir = os.path.join(speakers_dir, utterance["speaker"].replace(" ", "_"))
+        os.makedirs(speaker_dir, exist_ok=True)
+        target = os.path.join(speaker_dir, os.path.basename(audio_path))
+        if os.path.exists(audio_path) or not packed:
+            _link_or_copy(audio_path, target, symbolic=True)
+            continue
+        audio = load_utterance_audio(conversation_dir, utterance)
+        if audio is not None:
+            audio.export(target, format="wav")
+
+    os.makedirs(speakers_dir, exist_ok=True)
+    return speakers_dir
+
+def generate_legacy_utterances(conversation_dir, metadata, project_dir):
+    """Write the conversation's utterances into the shared speaker_utterances/ folders"""
+    conversation_name = metadata.get("audio_name") or metadata["conversation_id"]
+    safe_conv_name = os.path.splitext(os.path.basename(conversation_name))[0]
+
+    written = 0
+    for utterance in metadata["utterances"]:
+        audio_path = os.path.join(conversation_dir, utterance.get("audio_file", f"utterances/{utterance['id']}.wav"))
+        packed_audio = None
+        if not os.path.exists(audio_path):
+            # Packed conversations write a WAV cut out of their stream
+            packed_audio = load_utterance_audio(conversation_dir, utterance)
+            if packed_audio is None:
+                continue
+        speaker_dir = os.path.join(project_dir, LEGACY_UTTERANCES_DIR, utterance["speaker"])
+        os.makedirs(speaker_dir, exist_ok=True)
+
+        utterance_number = int(utterance["id"].rsplit("_", 1)[-1])
+        filepath = os.path.join(speaker_dir, f"{safe_conv_name}_utterance_{utterance_number}.wav")
+        if packed_audio is not None:
+            packed_audio.export(filepath, format="wav")
+        else:
+            _link_or_copy(audio_path, filepath)
+        with open(f"{os.path.splitext(filepath)[0]}.txt", "w") as f:
+            f.write(utterance["text"])
+        written += 1
+
+    return written
+
+def generate_legacy_transcript(conversation_dir, metadata, project_dir):
+    """Write the conversation's legacy transcript into the project folder"""
+    conversation_name = metadata.get("audio_name") or metadata["conversation_id"]
+    name = metadata.get("legacy_transcript") or legacy_transcript_name(metadata["conversation_id"])
+
+    lines = [f"Conversation Transcript: {conversation_name}\n", "=====================\n\n"]
+    for utterance in metadata["utterances"]:
+        lines.append(f"{utterance['speaker']}: {utterance['text']}\n\n")
+    atomic_write_text(os.path.join(project_dir, name), "".join(lines))
+
+    metadata["legacy_transcript"] = name
+    return name
+
+def generate_views(conversation_dir, views=VIEWS, project_dir=None):
+    """
+    Generate derived views of a processed conversation from its metadata.json
+
+    Args:
+        conversation_dir: Path to the conversation directory
+        views: Views to generate (see VIEWS)
+        project_dir: Folder holding the legacy views (default: parent of the processed folder)
+
+    Returns:
+        list: Generated views
+    """
+    conversation_dir = os.path.abspath(conversation_dir)
+    processed_dir = os.path.dirname(conversation_dir)
+    project_dir = project_dir or os.path.dirname(processed_dir)
+
+    metadata_path = os.path.join(conversation_dir, "metadata.json")
+    with open(metadata_path, "r") as f:
+        metadata = json.load(f)
+
+    for view in views:
+        if view == "speakers":
+            generate_speaker_links(conversation_dir, metadata)
+        elif view == "legacy_utterances":
+            generate_legacy_utterances(conversation_dir, metadata, project_dir)
+        elif view == "legacy_transcript":
+            generate_legacy_transcript(conversation_dir, metadata, project_dir)
+        else:
+            raise ValueError(f"Unknown view: {view} (expected one of {', '.join(VIEWS)})")
+
+    metadata["generated_views"] = sorted(recorded_views(metadata) | set(views))
+    atomic_write_json(metadata_path, metadata)
+    if "legacy_transcript" in views:
+        update_conversation(processed_dir, metadata["conversation_id"], metadata)
+
+    return list(views)
+
+def ensure_views(conversation_dir, views=VIEWS, project_dir=None):
+    """
+    Generate the views a consumer needs if the conversation doesn't have them yet
+
+    Conversations processed with the full profile have every view already,
+    unless packing removed their speakers/ links; minimal-profile
+    conversations have none.
+    """
+    with open(os.path.join(conversation_dir, "metadata.json"), "r") as f:
+        metadata = json.load(f)
+
+    missing = [view for view in views if view not in recorded_views(metadata)]
+    if not missing:
+        return []
+    return generate_views(conversation_dir, missing, project_dir)
+
+def main():
+    """Process command line arguments and generate views"""
+    parser = argparse.ArgumentParser(description="Generate derived views (speaker folders, legacy files) of processed conversations.")
+    parser.add_argument("conversations", nargs="*", help="Conversation directories")
+    parser.add_argument("--all", action="store_true", help="Generate views for every processed conversation")
+    parser.add_argument("--views", default=",".join(VIEWS),
+                        help=f"Comma-separated views to generate (default: {','.join(VIEWS)})")
+    parser.add_argument("--processed-dir", default=PROCESSED_DIR, help="Processed conversations folder (with --all)")
+
+    args = parser.parse_args()
+
+    views = [v.strip() for v in args.views.split(",") if v.strip()]
+    unknown = [v for v in views if v not in VIEWS]
+    if unknown:
+        print(f"Error: Unknown view(s): {', '.join(unknown)} (expected {', '.join(VIEWS)})")
+        sys.exit(1)
+
+    conversations = list(args.conversations)
+    if args.all and os.path.isdir(args.processed_dir):
+        conversations += [os.path.join(args.processed_dir, d) for d in sorted(os.listdir(args.processed_dir))]
+    conversations = [c for c in conversations if os.path.exists(os.path.join(c, "metadata.json"))]
+    if not conversations:
+        print("No processed conversations found")
+        sys.exit(1)
+
+    for conversation_dir in conversations:
+        try:
+            generate_views(conversation_dir, views)
+        except ValueError as e:
+            print(f"Skipped {os.path.basename(os.path.normpath(conversation_dir))}: {e}")
+            continue
+        print(f"Generated {', '.join(views)} for {os.path.basename(os.path.normpath(conversation_dir))}")
+
+if __name__ == "__main__":
+    main()
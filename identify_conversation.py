@@ -1,7 +1,7 @@
 import sys
 import os
 import assemblyai as aai
-from pinecone import Pinecone
+from vector_store import get_vector_store
 from nemo.collections.asr.models import EncDecSpeakerLabelModel
 import torch
 import numpy as np
@@ -10,8 +10,7 @@ from datetime import datetime
 
 # Initialize APIs
 aai.settings.api_key = os.getenv("ASSEMBLYAI_API_KEY")
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pc.Index("speaker-embeddings")
+index = get_vector_store()
 
 def convert_to_wav(input_file):
     """Convert an audio file to WAV format if needed"""
@@ -1,4 +1,4 @@
-from pinecone import Pinecone
+from vector_store import get_vector_store
 import assemblyai as aai
 import requests
 import os
@@ -11,9 +11,8 @@ import numpy as np
 import uuid
 from sklearn.metrics.pairwise import cosine_similarity
 
-# Initialize Pinecone
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pc.Index("speaker-embeddings")
+# Shared Pinecone client
+index = get_vector_store()
 
 # Initialize AssemblyAI
 aai.settings.api_key = os.getenv("ASSEMBLYAI_API_KEY")
@@ -1,10 +1,14 @@
 import sys
 import os
-from pinecone import Pinecone
+from vector_store import get_vector_store
+from voice_bank import iter_index_vectors, FETCH_BATCH_SIZE
 from nemo.collections.asr.models import EncDecSpeakerLabelModel
 import torch
 import numpy as np
 import uuid
+import time
+import json
+from datetime import datetime
 from pydub import AudioSegment
 import argparse
 
@@ -131,6 +135,291 @@ def add_speaker_embedding(index, wav_file, speaker_name, is_new_speaker=True):
             os.remove(wav_file)
             print(f"Cleaned up temporary file: {wav_file}")
 
+# Vectors fetched and re-written per request when relabeling
+RELABEL_BATCH_SIZE = 100
+# Rounds (one second apart) to wait for re-written vectors to leave the old name's filter
+RELABEL_STALE_ROUNDS = 5
+
+class IncompleteRelabelError(Exception):
+    """Raised when some embeddings still carry the old name after relabeling"""
+    
+    def __init__(self, message, relabeled, remaining_ids):
+        super().__init__(message)
+        self.relabeled = relabeled
+        self.remaining_ids = remaining_ids
+
+def relabel_speaker(index, old_name, new_name, batch_size=RELABEL_BATCH_SIZE):
+    """
+    Change the speaker_name of all of a speaker's embeddings
+    
+    Vectors are enumerated with a metadata filter on the old name and
+    re-written in batches with their values and the updated metadata. Each
+    batch removes its vectors from the filter, so the operation is
+    idempotent and can simply be run again if it is interrupted. Relabeling
+    to a name that already exists merges the two identities.
+    
+    Args:
+        index: Pinecone index
+        old_name: Current speaker name
+        new_name: Speaker name to assign
+        batch_size: Number of vectors re-written per upsert
+        
+    Returns:
+        int: Number of relabeled embeddings
+        
+    Raises:
+        IncompleteRelabelError: Embeddings still carry the old name (run it again)
+    """
+    if old_name == new_name:
+        return 0
+    
+    relabeled = 0
+    seen_ids = set()
+    stale_rounds = 0
+    while True:
+        # Enumerate the next batch of vectors that still carry the old name
+        results = index.query(
+            vector=[0.0] * 192,  # Dummy vector for metadata-only search
+            top_k=batch_size,
+            include_metadata=True,
+            include_values=True,
+            filter={"speaker_name": {"$eq": old_name}}
+        )
+        
+        if not results['matches']:
+            break
+        
+        # The index is eventually consistent, so recently re-written vectors
+        # can still show up under the old name for a moment
+        new_matches = [m for m in results['matches'] if m['id'] not in seen_ids]
+        if not new_matches:
+            stale_rounds += 1
+            if stale_rounds > RELABEL_STALE_ROUNDS:
+                # Check the stored metadata: lagging query results are fine,
+                # vectors that really kept the old name are not
+                stale_ids = [m['id'] for m in results['matches']]
+                stored = index.fetch(ids=stale_ids)['vectors']
+                remaining = [i for i in stale_ids
+                             if i in stored and (stored[i].get('metadata') or {}).get('speaker_name') == old_name]
+                if remaining:
+                    raise IncompleteRelabelError(
+                        f"Relabeled {relabeled} embeddings from '{old_name}' to '{new_name}', but "
+                        f"{len(remaining)} still carry the old name; run the relabel again",
+                        relabeled, remaining
+                    )
+                break
+            time.sleep(1)
+            continue
+        stale_rounds = 0
+        
+        vectors = []
+        for match in new_matches:
+            seen_ids.add(match['id'])
+            metadata = dict(match['metadata'])
+            metadata['speaker_name'] = new_name
+            # Remember the original identity the first time it is relabeled
+            metadata.setdefault('original_speaker_name', old_name)
+            vectors.append((match['id'], match['values'], metadata))
+        
+        index.upsert(vectors=vectors)
+        relabeled += len(vectors)
+        print(f"  Relabeled {relabeled} embeddings...")
+        
+        # A short batch means this was the last one
+        if len(results['matches']) < batch_size:
+            break
+    
+    print(f"Relabeled {relabeled} embeddings from '{old_name}' to '{new_name}'")
+    return relabeled
+
+def merge_speakers(index, source_name, target_name, batch_size=RELABEL_BATCH_SIZE):
+    """Merge one speaker identity into another (all embeddings end up under target_name)"""
+    if not check_speaker_exists(index, target_name):
+        print(f"Error: Speaker '{target_name}' does not exist in the database.")
+        print("Use --relabel-speaker to rename a speaker instead.")
+        return 0
+    
+    count = relabel_speaker(index, source_name, target_name, batch_size)
+    print(f"Merged '{source_name}' into '{target_name}' ({count} embeddings)")
+    return count
+
+# Compaction: at most this many exemplars are kept per speaker
+MAX_EXEMPLARS_PER_SPEAKER = 50
+# Removed vectors less similar than this to every kept exemplar count as lost coverage
+COVERAGE_THRESHOLD = 0.80
+COMPACTION_ARCHIVE_DIR = "voice_bank_archive"
+def find_speakers(index):
+    """
+    List the IDs of every speaker's embeddings
+    
+    Queries return at most 1000 vectors with metadata, so the whole bank is
+    read by listing its IDs and fetching them in pages (see
+    voice_bank.iter_index_vectors).
+    
+    Returns:
+        dict: Speaker name -> IDs of their embeddings
+    """
+    speakers = {}
+    for vector_id, _, metadata in iter_index_vectors(index):
+        speakers.setdefault(metadata.get('speaker_name', ''), []).append(vector_id)
+    return speakers
+
+def get_speaker_vectors(index, vector_ids):
+    """
+    Fetch the normalized values and metadata of embeddings by ID, in pages
+    
+    Returns:
+        tuple: (ids, vectors, metadata) of the embeddings that still exist
+    """
+    ids, values, metadata = [], [], []
+    for start in range(0, len(vector_ids), FETCH_BATCH_SIZE):
+        page = vector_ids[start:start + FETCH_BATCH_SIZE]
+        fetched = index.fetch(ids=page)['vectors']
+        for vector_id in page:
+            if vector_id in fetched:
+                ids.append(vector_id)
+                values.append(fetched[vector_id]['values'])
+                metadata.append(fetched[vector_id].get('metadata') or {})
+    if not ids:
+        return [], np.zeros((0, 192), dtype=np.float32), []
+    
+    vectors = np.array(values, dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return ids, vectors, metadata
+
+def select_exemplars(vectors, max_exemplars, pinned=None):
+    """
+    Choose a diverse subset of a speaker's vectors (greedy k-center)
+    
+    Starts from the pinned vectors (or the medoid when there are none) and
+    repeatedly adds the vector farthest from everything selected so far, so
+    the kept set covers the spread of the speaker's voice rather than its
+    most common condition.
+    
+    Args:
+        vectors: Normalized embeddings (n x dim)
+        max_exemplars: Size of the kept set (pinned vectors are always kept)
+        pinned: Boolean mask of vectors that must be kept
+        
+    Returns:
+        tuple: (indices of the kept vectors, similarity of every vector to its nearest kept one)
+    """
+    count = len(vectors)
+    pinned = np.zeros(count, dtype=bool) if pinned is None else pinned
+    
+    selected = list(np.flatnonzero(pinned))
+    if not selected:
+        # Medoid: the vector closest to the speaker's mean direction
+        selected = [int(np.argmax(vectors @ vectors.mean(axis=0)))]
+    
+    nearest = (vectors @ vectors[selected].T).max(axis=1)
+    while len(selected) < min(max_exemplars, count):
+        farthest = int(np.argmin(nearest))
+        if nearest[farthest] >= 1.0 - 1e-6:
+            break  # Everything left is an exact duplicate
+        selected.append(farthest)
+        nearest = np.maximum(nearest, vectors @ vectors[farthest])
+    
+    return np.array(sorted(selected)), nearest
+
+def compact_speaker(index, speaker_name, max_exemplars=MAX_EXEMPLARS_PER_SPEAKER,
+                    archive_dir=COMPACTION_ARCHIVE_DIR, dry_run=False, vector_ids=None):
+    """
+    Reduce a speaker's embeddings to a capped, diverse exemplar set
+    
+    Manually enrolled and verified embeddings (everything that was not
+    auto-enrolled during processing) are always kept. Removed vectors are
+    appended to <archive_dir>/<speaker>.jsonl before they are deleted, so
+    they can be re-upserted later.
+    
+    Args:
+        index: Pinecone index
+        speaker_name: Speaker to compact
+        max_exemplars: Number of embeddings to keep
+        archive_dir: Folder for removed vectors (None deletes them outright)
+        dry_run: Only report what would be removed
+        vector_ids: IDs of the speaker's embeddings (found by reading the bank if not given)
+        
+    Returns:
+        dict: Coverage report for the speaker
+    """
+    if vector_ids is None:
+        vector_ids = find_speakers(index).get(speaker_name, [])
+    ids, vectors, metadata = get_speaker_vectors(index, vector_ids)
+    report = {"speaker": speaker_name, "before": len(ids), "after": len(ids), "removed": 0}
+    if len(ids) <= max_exemplars:
+        return report
+    
+    # Auto-enrolled vectors carry is_short_utterance; everything else was added on purpose
+    pinned = np.array(['is_short_utterance' not in m for m in metadata])
+    kept, nearest = select_exemplars(vectors, max_exemplars, pinned)
+    removed = np.setdiff1d(np.arange(len(ids)), kept)
+    
+    removed_similarity = nearest[removed]
+    report.update({
+        "after": len(kept),
+        "removed": len(removed),
+        "pinned": int(pinned.sum()),
+        "mean_coverage": round(float(removed_similarity.mean()), 4) if len(removed) else 1.0,
+        "min_coverage": round(float(removed_similarity.min()), 4) if len(removed) else 1.0,
+        "uncovered": int((removed_similarity < COVERAGE_THRESHOLD).sum())
+    })
+    
+    if dry_run or not len(removed):
+        return report
+    
+    if archive_dir:
+        os.makedirs(archive_dir, exist_ok=True)
+        archive_path = os.path.join(archive_dir, f"{speaker_name.replace(' ', '_')}.jsonl")
+        with open(archive_path, 'a') as f:
+            for i in removed:
+                f.write(json.dumps({
+                    "id": ids[i],
+                    "values": vectors[i].tolist(),
+                    "metadata": metadata[i],
+                    "archived": datetime.now().isoformat()
+                }) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    
+    removed_ids = [ids[i] for i in removed]
+    for start in range(0, len(removed_ids), RELABEL_BATCH_SIZE):
+        index.delete(ids=removed_ids[start:start + RELABEL_BATCH_SIZE])
+    
+    return report
+
+def compact_voice_bank(index, speaker_names=None, max_exemplars=MAX_EXEMPLARS_PER_SPEAKER,
+                       archive_dir=COMPACTION_ARCHIVE_DIR, dry_run=False):
+    """
+    Compact every speaker (or the given ones) that has more than max_exemplars embeddings
+    
+    The bank is read once to find each speaker's embeddings. Speakers are
+    then handled one at a time, each archived and deleted before the next
+    is fetched, so an interrupted run loses nothing and simply continues
+    with the remaining speakers when started again.
+    
+    Returns:
+        list: Coverage report per compacted speaker
+    """
+    speakers = find_speakers(index)
+    if not speaker_names:
+        speaker_names = sorted(name for name, ids in speakers.items() if len(ids) > max_exemplars)
+    
+    reports = []
+    for speaker_name in speaker_names:
+        report = compact_speaker(index, speaker_name, max_exemplars, archive_dir, dry_run,
+                                 vector_ids=speakers.get(speaker_name, []))
+        reports.append(report)
+        if not report["removed"]:
+            print(f"{speaker_name}: {report['before']} embeddings, nothing to compact")
+            continue
+        print(f"{speaker_name}: {report['before']} -> {report['after']} embeddings "
+              f"({report['pinned']} pinned), coverage of removed: mean {report['mean_coverage']:.3f}, "
+              f"min {report['min_coverage']:.3f}, {report['uncovered']} below {COVERAGE_THRESHOLD:.2f}"
+              + (" [dry run]" if dry_run else ""))
+    
+    return reports
+
 def list_speakers(index):
     """List all speakers and their embeddings in the database"""
     # Query with dummy vector to get all vectors
@@ -178,6 +467,14 @@ Examples:
   Deleting:
     %(prog)s speaker_John_Smith_abc123 --delete-embedding  # Delete specific embedding
     %(prog)s "John Smith" --delete-speaker                 # Delete speaker and all embeddings
+  
+  Relabeling:
+    %(prog)s "John Smith" "Johnny Smith" --relabel-speaker  # Rename speaker on all embeddings
+    %(prog)s "J. Smith" "John Smith" --merge-speaker        # Merge J. Smith into John Smith
+  
+  Compacting:
+    %(prog)s --compact                                      # Cap every speaker's exemplars
+    %(prog)s "John Smith" --compact --max-exemplars 30 --dry-run
 """)
     
     # Add speaker arguments
@@ -196,18 +493,39 @@ Examples:
                       help='Delete all embeddings for the specified speaker')
     parser.add_argument('--delete-embedding', action='store_true',
                       help='Delete a specific embedding by ID')
+    parser.add_argument('--relabel-speaker', action='store_true',
+                      help='Rename a speaker on all of their embeddings')
+    parser.add_argument('--merge-speaker', action='store_true',
+                      help='Merge a speaker into another existing speaker')
+    parser.add_argument('--compact', action='store_true',
+                      help='Keep a diverse, capped set of embeddings per speaker (all speakers unless one is given)')
+    
+    # Compaction options
+    parser.add_argument('--max-exemplars', type=int, default=MAX_EXEMPLARS_PER_SPEAKER,
+                      help=f'Embeddings kept per speaker when compacting (default: {MAX_EXEMPLARS_PER_SPEAKER})')
+    parser.add_argument('--archive-dir', default=COMPACTION_ARCHIVE_DIR,
+                      help=f'Where removed embeddings are archived (default: {COMPACTION_ARCHIVE_DIR})')
+    parser.add_argument('--no-archive', action='store_true',
+                      help='Delete removed embeddings without archiving them')
+    parser.add_argument('--dry-run', action='store_true',
+                      help='Report what compaction would remove without changing the database')
     
     args = parser.parse_args()
     
-    # Initialize Pinecone
-    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-    index = pc.Index("speaker-embeddings")
+    # Shared Pinecone client
+    index = get_vector_store()
     
     # List speakers
     if args.list:
         list_speakers(index)
         return
     
+    # Compact the voice bank
+    if args.compact:
+        compact_voice_bank(index, [args.input] if args.input else None, args.max_exemplars,
+                           None if args.no_archive else args.archive_dir, args.dry_run)
+        return
+    
     # Handle deletion operations
     if args.delete_speaker and args.input:
         delete_speaker(index, args.input)
@@ -217,6 +535,18 @@ Examples:
         delete_single_embedding(index, args.input)
         return
     
+    # Handle relabel/merge operations
+    if (args.relabel_speaker or args.merge_speaker) and args.input and args.speaker_name:
+        try:
+            if args.merge_speaker:
+                merge_speakers(index, args.input, args.speaker_name)
+            else:
+                relabel_speaker(index, args.input, args.speaker_name)
+        except IncompleteRelabelError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        return
+    
     # Handle adding embeddings
     if args.input and args.speaker_name:
         if not os.path.exists(args.input):
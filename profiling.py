@@ -0,0 +1,193 @@
+"""
+Tracing of a single conversation run.
+
+process_conversation(..., profile=True) (or speaker_id_testing.py
+--profile) records nested spans for every step: decoding, transcription,
+the slice/embed/query/enqueue/save steps of each utterance, combining
+unknown speakers and the final file writes. The spans are written as a
+Chrome trace-event file (trace.json next to metadata.json) that can be
+opened in chrome://tracing or https://ui.perfetto.dev.
+
+A sampling profile of the same run can be added with a sampler:
+
+- "pyinstrument": profile.html (needs the pyinstrument package)
+- "cprofile": profile.pstats (standard library, open with pstats or snakeviz)
+
+Tracing is per thread, so concurrent jobs never end up in each other's
+trace, and spans cost one thread-local lookup when tracing is off. The
+samplers hook into the interpreter for the whole process, so runs with a
+sampler are serialized: a second one waits until the first has stopped.
+"""
+
+import os
+import json
+import time
+import functools
+import threading
+
+TRACE_FILENAME = "trace.json"
+SAMPLERS = ("pyinstrument", "cprofile")
+
+_local = threading.local()
+
+# Held from start_tracing to stop_tracing by the one run with a sampler
+_sampler_lock = threading.Lock()
+
+class Tracer:
+    """Collects completed spans as Chrome trace events"""
+
+    def __init__(self, sampler=None):
+        self.events = []
+        self.origin_ns = time.perf_counter_ns()
+        self.pid = os.getpid()
+        self.tid = threading.get_ident()
+        self.sampler_name = sampler
+        self.sampler = None
+
+    def add(self, name, start_ns, end_ns, args):
+        self.events.append({
+            "name": name,
+            "ph": "X",
+            "ts": (start_ns - self.origin_ns) / 1000,
+            "dur": (end_ns - start_ns) / 1000,
+            "pid": self.pid,
+            "tid": self.tid,
+            "args": args
+        })
+
+class Span:
+    """A timed section; use as a context manager or call end()"""
+
+    __slots__ = ("tracer", "name", "args", "start_ns")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start_ns = time.perf_counter_ns()
+
+    def end(self, **args):
+        if self.tracer is not None:
+            self.args.update(args)
+            self.tracer.add(self.name, self.start_ns, time.perf_counter_ns(), self.args)
+            self.tracer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.end()
+
+class _NullSpan:
+    """Span used when tracing is off"""
+
+    def end(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+def span(name, **args):
+    """Start a span in the current thread's trace (no-op when not tracing)"""
+    tracer = getattr(_local, "tracer", None)
+    if tracer is None:
+        return _NULL_SPAN
+    return Span(tracer, name, args)
+
+def traced(name):
+    """Decorator recording every call of a function as a span"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if getattr(_local, "tracer", None) is None:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def start_tracing(sampler=None):
+    """
+    Start tracing the current thread
+
+    Args:
+        sampler: Optional sampling profiler to run alongside ("pyinstrument" or "cprofile")
+
+    Returns:
+        Tracer: Pass to stop_tracing
+    """
+    if sampler and sampler not in SAMPLERS:
+        raise ValueError(f"Unknown sampler: {sampler} (expected one of {', '.join(SAMPLERS)})")
+
+    tracer = Tracer(sampler)
+    if sampler == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("pyinstrument is not installed, recording the trace without a sampling profile")
+        else:
+            tracer.sampler = Profiler()
+    elif sampler == "cprofile":
+        import cProfile
+        tracer.sampler = cProfile.Profile()
+
+    if tracer.sampler is not None:
+        if not _sampler_lock.acquire(blocking=False):
+            print("Waiting for another profiled run to finish")
+            _sampler_lock.acquire()
+        try:
+            if sampler == "pyinstrument":
+                tracer.sampler.start()
+            else:
+                tracer.sampler.enable()
+        except BaseException:
+            _sampler_lock.release()
+            raise
+
+    _local.tracer = tracer
+    return tracer
+
+def stop_tracing(tracer, output_dir):
+    """
+    Stop tracing and write the trace (and sampling profile) to output_dir
+
+    Returns:
+        dict: Paths of the written files ("trace" and optionally "sampler")
+    """
+    _local.tracer = None
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {}
+
+    if tracer.sampler is not None:
+        try:
+            if tracer.sampler_name == "pyinstrument":
+                tracer.sampler.stop()
+            else:
+                tracer.sampler.disable()
+        finally:
+            _sampler_lock.release()
+        if tracer.sampler_name == "pyinstrument":
+            paths["sampler"] = os.path.join(output_dir, "profile.html")
+            with open(paths["sampler"], "w") as f:
+                f.write(tracer.sampler.output_html())
+        else:
+            paths["sampler"] = os.path.join(output_dir, "profile.pstats")
+            tracer.sampler.dump_stats(paths["sampler"])
+
+    # Name the thread so the viewer shows something better than its ID
+    events = [{"name": "thread_name", "ph": "M", "pid": tracer.pid, "tid": tracer.tid,
+               "args": {"name": "process_conversation"}}]
+    events.extend(sorted(tracer.events, key=lambda e: e["ts"]))
+
+    paths["trace"] = os.path.join(output_dir, TRACE_FILENAME)
+    with open(paths["trace"], "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    return paths
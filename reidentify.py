@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Script to re-identify speakers in already processed conversations.
+
+After new speakers are enrolled, conversations full of Unknown_speaker_X
+labels can be re-scored against the current speaker database without
+re-transcribing them. The stored utterance boundaries and audio are reused,
+and these files are updated in place:
+- metadata.json
+- transcript.txt
+- The speakers/ folder links
+
+Only conversations with unknown or low-confidence utterances are processed.
+With --cluster / --no-cluster, conversations processed with another
+identification mode are identified again from scratch in that mode (from
+their stored embeddings) and their processing_config is updated.
+"""
+
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+
+from speaker_id_testing import (
+    PROCESSED_DIR,
+    EMBEDDING_DIM,
+    load_speaker_model,
+    load_conversation_embeddings,
+    embedding_to_numpy,
+    get_segment_embedding,
+    match_embedding,
+    test_voice_segment,
+    identify_by_clustering,
+    identify_unknown_speakers_by_combining,
+    move_speaker_link,
+    write_transcript,
+    processing_config,
+)
+from voice_activity import compute_voice_activity, trim_to_voiced
+from conversation_index import atomic_write_json, update_conversation
+from segment_store import load_utterance_audio as load_stored_utterance_audio
+
+# Utterances below this confidence are re-scored as well as unknown ones
+LOW_CONFIDENCE_THRESHOLD = 0.50
+
+def needs_reidentification(utterance, min_confidence=LOW_CONFIDENCE_THRESHOLD):
+    """Check if an utterance is unknown or was identified with low confidence"""
+    return utterance["speaker"].startswith("Unknown_") or utterance.get("confidence", 0.0) < min_confidence
+
+def needs_new_config(metadata, cluster):
+    """Check if a conversation was processed with another identification mode (cluster=None: never)"""
+    if cluster is None:
+        return False
+    return metadata.get("processing_config", processing_config()) != processing_config(cluster)
+
+def find_conversations(paths=None):
+    """Get the conversation directories to check (all processed conversations by default)"""
+    if not paths:
+        if not os.path.isdir(PROCESSED_DIR):
+            return []
+        paths = [os.path.join(PROCESSED_DIR, d) for d in sorted(os.listdir(PROCESSED_DIR))]
+
+    return [p for p in paths if os.path.exists(os.path.join(p, "metadata.json"))]
+
+def load_utterance_audio(conversation_path, utterance):
+    """Load the stored audio of an utterance, trimmed to its voiced frames"""
+    audio = load_stored_utterance_audio(conversation_path, utterance)
+    if audio is None:
+        return None
+
+    segment, _ = trim_to_voiced(audio, compute_voice_activity(audio), 0, len(audio))
+    return segment
+
+def embed_stored_utterances(conversation_path, utterances, speaker_model):
+    """Embed a conversation's stored utterance audio (for conversations without embeddings.npy)"""
+    rows = np.zeros((len(utterances), EMBEDDING_DIM), dtype=np.float32)
+    for row, utterance in enumerate(utterances):
+        segment = load_utterance_audio(conversation_path, utterance)
+        if segment is not None:
+            rows[row] = embedding_to_numpy(get_segment_embedding(segment, speaker_model))
+    return rows
+
+def identify_with_config(utterances, embeddings, cluster, speakers_dir):
+    """
+    Identify every utterance again from its embedding, with or without clustering
+
+    Clusters start from the stored diarization labels, as in processing.
+
+    Returns:
+        dict: Cluster statistics, or None without clustering
+    """
+    embedded = [embeddings[row] if embeddings[row].any() else None for row in range(len(utterances))]
+
+    assignments, cluster_stats = {}, None
+    if cluster:
+        diarized = [{"speaker": u.get("diarization_speaker", u["speaker"]), "start": u["start_ms"], "end": u["end_ms"]}
+                    for u in utterances]
+        assignments, cluster_stats = identify_by_clustering(diarized, embedded)
+
+    for i, utterance in enumerate(utterances):
+        if embedded[i] is None:
+            continue  # Never embedded (silence)
+        utterance.pop("cluster_identification", None)
+
+        if i in assignments:
+            assignment = assignments[i]
+            speaker_name, confidence, embedding_id = assignment["speaker"], assignment["confidence"], assignment["embedding_id"]
+            utterance["cluster_identification"] = True
+        else:
+            is_short = utterance["end_ms"] - utterance["start_ms"] < 700
+            speaker_name, confidence, embedding_id = match_embedding(embedded[i], is_short=is_short)
+
+        if not speaker_name:
+            label = assignments[i]["cluster"] if i in assignments else utterance.get("diarization_speaker", f"speaker_{i}")
+            speaker_name = f"Unknown_{label}"
+
+        if speaker_name != utterance["speaker"]:
+            move_speaker_link(speakers_dir, utterance["id"], utterance["speaker"], speaker_name)
+        utterance["speaker"] = speaker_name
+        utterance["confidence"] = confidence
+        utterance["embedding_id"] = embedding_id
+
+    return cluster_stats
+
+def reidentify_conversation(conversation_path, speaker_model, min_confidence=LOW_CONFIDENCE_THRESHOLD, cluster=None):
+    """
+    Re-run speaker matching for the weak utterances of a processed conversation.
+
+    Args:
+        conversation_path: Path to the conversation directory
+        speaker_model: Loaded speaker recognition model
+        min_confidence: Utterances below this confidence are re-scored
+        cluster: Identification mode to apply (None keeps the conversation's
+            own); a conversation processed in another mode is identified again
+            in full and its processing_config is updated
+
+    Returns:
+        dict: Summary with the number of checked and updated utterances
+    """
+    conversation_path = os.path.abspath(conversation_path)
+    metadata_path = os.path.join(conversation_path, "metadata.json")
+    speakers_dir = os.path.join(conversation_path, "speakers")
+
+    with open(metadata_path, 'r') as f:
+        metadata = json.load(f)
+
+    utterances = metadata.get("utterances", [])
+    config_changed = needs_new_config(metadata, cluster)
+    if config_changed:
+        candidates = utterances
+    else:
+        candidates = [u for u in utterances if needs_reidentification(u, min_confidence)]
+    summary = {"conversation_id": os.path.basename(conversation_path), "checked": len(candidates), "updated": 0}
+    if not candidates:
+        return summary
+
+    print(f"\nRe-identifying {len(candidates)} utterance(s) in {summary['conversation_id']}...")
+
+    # Remember the original assignments to know what changed
+    original = {u["id"]: (u["speaker"], u.get("confidence")) for u in utterances}
+
+    # Stored embeddings make re-scoring free of inference
+    embeddings = load_conversation_embeddings(conversation_path, metadata)
+    rows = {u["id"]: row for row, u in enumerate(utterances)}
+
+    if config_changed:
+        # Identify everything again in the requested mode
+        if embeddings is None:
+            embeddings = embed_stored_utterances(conversation_path, utterances, speaker_model)
+        cluster_stats = identify_with_config(utterances, embeddings, cluster, speakers_dir)
+        metadata["processing_config"] = processing_config(cluster)
+        if cluster_stats is not None:
+            metadata["cluster_stats"] = cluster_stats
+        else:
+            metadata.pop("cluster_stats", None)
+        candidates = []
+
+    # Re-score each weak utterance individually
+    for utterance in candidates:
+        if embeddings is not None:
+            embedding = embeddings[rows[utterance["id"]]]
+            if not embedding.any():
+                continue  # Never embedded (silence)
+            speaker_name, confidence, embedding_id = match_embedding(embedding)
+        else:
+            segment = load_utterance_audio(conversation_path, utterance)
+            if segment is None:
+                continue
+            speaker_name, confidence, embedding_id, _ = test_voice_segment(segment, speaker_model)
+
+        if speaker_name and confidence > utterance.get("confidence", 0.0):
+            print(f"  {utterance['id']}: {utterance['speaker']} -> {speaker_name} (confidence: {confidence:.4f})")
+
+            # Move the speakers/ link before updating the metadata
+            if speaker_name != utterance["speaker"]:
+                move_speaker_link(speakers_dir, utterance["id"], utterance["speaker"], speaker_name)
+
+            utterance["speaker"] = speaker_name
+            utterance["confidence"] = confidence
+            utterance["embedding_id"] = embedding_id
+
+    # Try the remaining unknown speakers with their utterances combined
+    # (this also moves their speakers/ links)
+    if any(u["speaker"].startswith("Unknown_") for u in utterances):
+        conversation_info = {"dir": conversation_path, "speakers_dir": speakers_dir}
+        identify_unknown_speakers_by_combining(
+            utterances, conversation_info, None, speaker_model,
+            load_segment=lambda u: load_utterance_audio(conversation_path, u),
+            embeddings=embeddings
+        )
+
+    summary["updated"] = sum(1 for u in utterances if (u["speaker"], u.get("confidence")) != original[u["id"]])
+    if summary["updated"] == 0 and not config_changed:
+        return summary
+
+    # Save updated metadata
+    metadata["speakers"] = list(set(u["speaker"] for u in utterances))
+    metadata["date_reidentified"] = datetime.now().isoformat()
+    atomic_write_json(metadata_path, metadata)
+    update_conversation(os.path.dirname(conversation_path), summary["conversation_id"], metadata)
+
+    # Rewrite the transcript, keeping its original title
+    transcript_path = os.path.join(conversation_path, "transcript.txt")
+    conversation_name = metadata.get("original_audio", summary["conversation_id"])
+    if os.path.exists(transcript_path):
+        with open(transcript_path, 'r') as f:
+            first_line = f.readline().strip()
+        if first_line.startswith("Conversation Transcript: "):
+            conversation_name = first_line[len("Conversation Transcript: "):]
+    write_transcript(transcript_path, conversation_name, utterances)
+
+    print(f"  Updated {summary['updated']} utterance(s) in {summary['conversation_id']}")
+    return summary
+
+def reidentify_conversations(paths=None, min_confidence=LOW_CONFIDENCE_THRESHOLD, max_workers=4, cluster=None):
+    """
+    Re-identify speakers across many conversations in parallel.
+
+    Args:
+        paths: Conversation directories (defaults to all processed conversations)
+        min_confidence: Utterances below this confidence are re-scored
+        max_workers: Number of conversations processed concurrently
+        cluster: Identification mode to apply (see reidentify_conversation)
+
+    Returns:
+        list: Summary for each conversation that needed re-identification
+    """
+    conversations = []
+    for path in find_conversations(paths):
+        with open(os.path.join(path, "metadata.json"), 'r') as f:
+            metadata = json.load(f)
+        if needs_new_config(metadata, cluster) or any(
+                needs_reidentification(u, min_confidence) for u in metadata.get("utterances", [])):
+            conversations.append(path)
+
+    print(f"Found {len(conversations)} conversation(s) with unknown or low-confidence utterances")
+    if not conversations:
+        return []
+
+    # Load the model once and share it between workers (only needed for
+    # conversations processed before embeddings were stored)
+    speaker_model = None
+    if any(load_conversation_embeddings(path) is None for path in conversations):
+        speaker_model = load_speaker_model()
+
+    summaries = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(reidentify_conversation, path, speaker_model, min_confidence, cluster): path
+            for path in conversations
+        }
+        for future in as_completed(futures):
+            try:
+                summaries.append(future.result())
+            except Exception as e:
+                print(f"Error re-identifying {futures[future]}: {e}")
+                summaries.append({"conversation_id": os.path.basename(futures[future]), "error": str(e)})
+
+    return summaries
+
+def main():
+    """Process command line arguments and re-identify the conversations"""
+    parser = argparse.ArgumentParser(description="Re-identify speakers in processed conversations.")
+    parser.add_argument("conversations", nargs="*",
+                        help="Conversation directories (default: all in processed_conversations)")
+    parser.add_argument("--min-confidence", type=float, default=LOW_CONFIDENCE_THRESHOLD,
+                        help="Re-score utterances below this confidence (default: 0.50)")
+    parser.add_argument("--workers", type=int, default=4, help="Number of conversations processed in parallel")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--cluster", dest="cluster", action="store_true", default=None,
+                      help="Identify conversations processed without clustering again with clustering")
+    mode.add_argument("--no-cluster", dest="cluster", action="store_false",
+                      help="Identify clustered conversations again per utterance")
+
+    args = parser.parse_args()
+
+    summaries = reidentify_conversations(args.conversations, args.min_confidence, args.workers, args.cluster)
+
+    updated = [s for s in summaries if s.get("updated")]
+    failed = [s for s in summaries if "error" in s]
+    print(f"\nRe-identification completed:")
+    print(f"  Conversations checked: {len(summaries)}")
+    print(f"  Conversations updated: {len(updated)}")
+    print(f"  Utterances updated: {sum(s['updated'] for s in updated)}")
+
+    if failed:
+        print(f"  Failed: {len(failed)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
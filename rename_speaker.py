@@ -6,6 +6,9 @@ This updates:
 - All metadata.json entries
 - Both transcript files
 
+With --all, the speaker is renamed in every conversation they appear in,
+using the conversation index to find them.
+
 And optionally runs the update_speaker_db_verified.py script for the renamed speaker.
 """
 
@@ -14,88 +17,93 @@ import sys
 import json
 import shutil
 import re
+import time
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-def rename_speaker(conversation_path, old_speaker, new_speaker, update_db=False, confidence_threshold=0.60):
+from conversation_index import (
+    atomic_write_json,
+    atomic_write_text,
+    get_speaker_conversations,
+    update_conversation,
+    update_conversations,
+)
+from generate_views import ensure_views
+
+def rename_speaker_in_conversation(conversation_path, old_speaker, new_speaker, confidence_threshold=0.60,
+                                   update_index=True):
     """
-    Rename a speaker in a processed conversation and update all related files.
+    Rename a speaker in one processed conversation, touching only the files that change.
+    
+    Files are replaced atomically. If the new speaker already appears in the
+    conversation, the two are merged.
     
     Args:
         conversation_path: Path to the conversation directory
         old_speaker: Current speaker name to replace
         new_speaker: New speaker name
-        update_db: Whether to run the update_speaker_db_verified.py script after renaming
-        confidence_threshold: Confidence threshold for the update_speaker_db_verified.py script
+        confidence_threshold: Kept for API compatibility (used by update_db in rename_speaker)
+        update_index: Update the conversation index; callers renaming many
+            conversations pass False and apply the returned metadata in one batch
+        
+    Returns:
+        dict: Summary of the changes (with the updated "metadata"), or None if
+        the speaker is not in the conversation
     """
-    # Normalize path
     conversation_path = os.path.abspath(conversation_path)
-    
-    if not os.path.isdir(conversation_path):
-        print(f"Error: {conversation_path} is not a valid directory")
-        return False
-    
-    print(f"Renaming speaker '{old_speaker}' to '{new_speaker}' in {conversation_path}")
-    
-    # Check if this is a valid conversation directory
     metadata_path = os.path.join(conversation_path, "metadata.json")
     if not os.path.exists(metadata_path):
-        print(f"Error: {conversation_path} does not contain metadata.json")
-        return False
+        return None
     
     # Load metadata
     with open(metadata_path, 'r') as f:
         metadata = json.load(f)
     
     # Check if old speaker exists in the metadata
-    if old_speaker not in metadata["speakers"]:
-        print(f"Error: Speaker '{old_speaker}' not found in metadata")
-        return False
+    if old_speaker not in metadata["speakers"] or old_speaker == new_speaker:
+        return None
     
-    # Create normalized directory names
-    old_speaker_dir_name = old_speaker.replace(" ", "_")
-    new_speaker_dir_name = new_speaker.replace(" ", "_")
+    summary = {
+        "conversation_id": os.path.basename(conversation_path),
+        "utterances": 0,
+        "files_changed": []
+    }
     
-    # Check if the speaker directory exists
+    # 1. Move the speaker directory (merging into an existing one if needed)
     speakers_dir = os.path.join(conversation_path, "speakers")
-    old_speaker_dir = os.path.join(speakers_dir, old_speaker_dir_name)
-    new_speaker_dir = os.path.join(speakers_dir, new_speaker_dir_name)
-    
-    if not os.path.isdir(old_speaker_dir):
-        print(f"Error: Speaker directory '{old_speaker_dir}' not found")
-        return False
-    
-    if os.path.exists(new_speaker_dir) and old_speaker_dir_name != new_speaker_dir_name:
-        print(f"Error: Directory '{new_speaker_dir}' already exists")
-        return False
+    old_speaker_dir = os.path.join(speakers_dir, old_speaker.replace(" ", "_"))
+    new_speaker_dir = os.path.join(speakers_dir, new_speaker.replace(" ", "_"))
     
-    # Now let's make the changes
-    changes_made = 0
-    
-    # Calculate project directory (two levels up from conversation dir)
-    project_dir = Path(conversation_path).parent.parent
-    
-    # 1. Rename the speaker directory
-    if old_speaker_dir_name != new_speaker_dir_name:
-        print(f"Renaming directory: {old_speaker_dir} -> {new_speaker_dir}")
-        os.rename(old_speaker_dir, new_speaker_dir)
-        changes_made += 1
+    if os.path.isdir(old_speaker_dir) and old_speaker_dir != new_speaker_dir:
+        if not os.path.exists(new_speaker_dir):
+            os.rename(old_speaker_dir, new_speaker_dir)
+        else:
+            for item in os.listdir(old_speaker_dir):
+                target = os.path.join(new_speaker_dir, item)
+                if os.path.lexists(target):
+                    os.remove(target)
+                os.rename(os.path.join(old_speaker_dir, item), target)
+            os.rmdir(old_speaker_dir)
+        summary["files_changed"].append(new_speaker_dir)
     
     # 2. Update metadata.json
-    # Replace in speakers list
-    if old_speaker in metadata["speakers"]:
-        metadata["speakers"] = [new_speaker if s == old_speaker else s for s in metadata["speakers"]]
-        changes_made += 1
+    speakers = []
+    for speaker in metadata["speakers"]:
+        speaker = new_speaker if speaker == old_speaker else speaker
+        if speaker not in speakers:
+            speakers.append(speaker)
+    metadata["speakers"] = speakers
     
-    # Replace in utterances
     for utterance in metadata["utterances"]:
         if utterance["speaker"] == old_speaker:
             utterance["speaker"] = new_speaker
-            changes_made += 1
+            # Named by hand, so the label can serve as ground truth
+            utterance["verified"] = True
+            summary["utterances"] += 1
     
-    # Save updated metadata
-    with open(metadata_path, 'w') as f:
-        json.dump(metadata, f, indent=2)
+    atomic_write_json(metadata_path, metadata)
+    summary["files_changed"].append(metadata_path)
     
     # 3. Update transcript file in the conversation directory
     transcript_path = os.path.join(conversation_path, "transcript.txt")
@@ -105,54 +113,54 @@ def rename_speaker(conversation_path, old_speaker, new_speaker, update_db=False,
         
         # Replace [Old Speaker ... with [New Speaker ...
         pattern = r'\[' + re.escape(old_speaker) + r' ([0-9:]{8})'
-        replacement = '[' + new_speaker + r' \1'
+        replacement = '[' + new_speaker.replace('\\', r'\\') + r' \1'
         updated_content = re.sub(pattern, replacement, transcript_content)
         
         if updated_content != transcript_content:
-            with open(transcript_path, 'w') as f:
-                f.write(updated_content)
-            changes_made += 1
-            print(f"Updated transcript file: {transcript_path}")
+            atomic_write_text(transcript_path, updated_content)
+            summary["files_changed"].append(transcript_path)
     
-    # 4. Find and update the legacy transcript file in the main directory
+    # 4. Update the legacy transcript file in the main directory
     # Legacy transcripts have format: transcript_YYYYMMDD_HHMMSS.txt
-    # Extract conversation ID to help find the right legacy transcript
-    conversation_id = os.path.basename(conversation_path)
-    
-    # Metadata contains date_processed which can help identify the right legacy transcript
-    if "date_processed" in metadata:
-        # Extract date from ISO format string (2025-03-12T...)
-        date_parts = metadata["date_processed"].split("T")[0].split("-")
-        if len(date_parts) == 3:
-            date_prefix = f"{date_parts[0]}{date_parts[1]}{date_parts[2]}"
-            
-            # Look for legacy transcripts with this date prefix
-            legacy_transcripts = list(project_dir.glob(f"transcript_{date_prefix}_*.txt"))
-            
-            for legacy_path in legacy_transcripts:
-                # Read the transcript to check if it contains the old speaker name
-                with open(legacy_path, 'r') as f:
-                    legacy_content = f.read()
-                
-                # Look for lines that start with "Old Speaker: "
-                pattern = r'^' + re.escape(old_speaker) + r': '
-                replacement = new_speaker + ': '
-                
-                updated_legacy = re.sub(pattern, replacement, legacy_content, flags=re.MULTILINE)
-                
-                if updated_legacy != legacy_content:
-                    with open(legacy_path, 'w') as f:
-                        f.write(updated_legacy)
-                    changes_made += 1
-                    print(f"Updated legacy transcript: {legacy_path}")
-    
-    # 5. Update any symlinks within the speaker directories
-    # This is only necessary if we're on a system that supports symlinks
-    # and the speaker_id_testing.py script used symlinks rather than copies
-    
-    # Move any files from the legacy speaker_utterances directory
+    project_dir = Path(conversation_path).parent.parent
+    if "legacy_transcript" in metadata:
+        # Newer conversations record which legacy transcript is theirs (None
+        # with the minimal output profile)
+        legacy_transcripts = [project_dir / metadata["legacy_transcript"]] if metadata["legacy_transcript"] else []
+    elif "date_processed" in metadata:
+        # Older ones are found by the processing date (2025-03-12T...)
+        date_prefix = metadata["date_processed"].split("T")[0].replace("-", "")
+        legacy_transcripts = list(project_dir.glob(f"transcript_{date_prefix}_*.txt"))
+    else:
+        legacy_transcripts = []
+    
+    for legacy_path in legacy_transcripts:
+        if not legacy_path.exists():
+            continue
+        with open(legacy_path, 'r') as f:
+            legacy_content = f.read()
+        
+        # Look for lines that start with "Old Speaker: "
+        pattern = r'^' + re.escape(old_speaker) + r': '
+        replacement = new_speaker.replace('\\', r'\\') + ': '
+        updated_legacy = re.sub(pattern, replacement, legacy_content, flags=re.MULTILINE)
+        
+        if updated_legacy != legacy_content:
+            atomic_write_text(str(legacy_path), updated_legacy)
+            summary["files_changed"].append(str(legacy_path))
+    
+    # 5. Keep the conversation index in sync
+    if update_index:
+        update_conversation(os.path.dirname(conversation_path), summary["conversation_id"], metadata)
+    
+    summary["metadata"] = metadata
+    return summary
+
+def move_legacy_speaker_utterances(project_dir, old_speaker, new_speaker):
+    """Move a speaker's files in the legacy speaker_utterances directory"""
     legacy_speaker_dir = os.path.join(project_dir, "speaker_utterances", old_speaker)
     new_legacy_speaker_dir = os.path.join(project_dir, "speaker_utterances", new_speaker)
+    moved = 0
     
     if os.path.exists(legacy_speaker_dir):
         print(f"Moving files from legacy directory: {legacy_speaker_dir} -> {new_legacy_speaker_dir}")
@@ -170,23 +178,127 @@ def rename_speaker(conversation_path, old_speaker, new_speaker, update_db=False,
                     os.remove(new_path)
             
             shutil.move(old_path, new_path)
-            changes_made += 1
+            moved += 1
         
         # Remove old directory if empty
         if len(os.listdir(legacy_speaker_dir)) == 0:
             os.rmdir(legacy_speaker_dir)
             print(f"Removed empty legacy directory: {legacy_speaker_dir}")
     
+    return moved
+
+def rename_speaker_across_archive(processed_dir, old_speaker, new_speaker, max_workers=8):
+    """
+    Rename a speaker in every conversation they appear in.
+    
+    Affected conversations are found through the conversation index instead
+    of scanning the archive, and are updated in parallel. The index and the
+    search database are updated once, after all conversations are done.
+    
+    Args:
+        processed_dir: Path to the processed conversations folder
+        old_speaker: Current speaker name to replace
+        new_speaker: New speaker name
+        max_workers: Number of conversations updated concurrently
+        
+    Returns:
+        dict: Summary of the rename operation
+    """
+    start = time.time()
+    conversation_ids = get_speaker_conversations(processed_dir, old_speaker)
+    
+    summary = {
+        "conversations": len(conversation_ids),
+        "updated": 0,
+        "utterances": 0,
+        "files_changed": 0,
+        "updated_ids": [],
+        "errors": []
+    }
+    
+    changed_metadata = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                rename_speaker_in_conversation,
+                os.path.join(processed_dir, conversation_id),
+                old_speaker,
+                new_speaker,
+                update_index=False
+            ): conversation_id
+            for conversation_id in conversation_ids
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                summary["errors"].append({"conversation_id": futures[future], "error": str(e)})
+                continue
+            if result:
+                changed_metadata[futures[future]] = result["metadata"]
+                summary["updated"] += 1
+                summary["updated_ids"].append(futures[future])
+                summary["utterances"] += result["utterances"]
+                summary["files_changed"] += len(result["files_changed"])
+    
+    update_conversations(processed_dir, changed_metadata)
+    
+    # The legacy speaker folder is shared by all conversations, so move it once
+    project_dir = os.path.dirname(os.path.abspath(processed_dir))
+    summary["files_changed"] += move_legacy_speaker_utterances(project_dir, old_speaker, new_speaker)
+    
+    summary["elapsed_seconds"] = round(time.time() - start, 3)
+    return summary
+
+def rename_speaker(conversation_path, old_speaker, new_speaker, update_db=False, confidence_threshold=0.60):
+    """
+    Rename a speaker in a processed conversation and update all related files.
+    
+    Args:
+        conversation_path: Path to the conversation directory
+        old_speaker: Current speaker name to replace
+        new_speaker: New speaker name
+        update_db: Whether to run the update_speaker_db_verified.py script after renaming
+        confidence_threshold: Confidence threshold for the update_speaker_db_verified.py script
+    """
+    # Normalize path
+    conversation_path = os.path.abspath(conversation_path)
+    
+    if not os.path.isdir(conversation_path):
+        print(f"Error: {conversation_path} is not a valid directory")
+        return False
+    
+    print(f"Renaming speaker '{old_speaker}' to '{new_speaker}' in {conversation_path}")
+    
+    # Check if this is a valid conversation directory
+    if not os.path.exists(os.path.join(conversation_path, "metadata.json")):
+        print(f"Error: {conversation_path} does not contain metadata.json")
+        return False
+    
+    result = rename_speaker_in_conversation(conversation_path, old_speaker, new_speaker, confidence_threshold)
+    if result is None:
+        print(f"Error: Speaker '{old_speaker}' not found in metadata")
+        return False
+    
+    for path in result["files_changed"]:
+        print(f"Updated: {path}")
+    
+    # Calculate project directory (two levels up from conversation dir)
+    project_dir = Path(conversation_path).parent.parent
+    moved = move_legacy_speaker_utterances(project_dir, old_speaker, new_speaker)
+    
     # Print summary
-    print(f"\nRename operation completed with {changes_made} changes:")
+    print(f"\nRename operation completed with {len(result['files_changed']) + moved} changes:")
     print(f"- Speaker '{old_speaker}' has been renamed to '{new_speaker}'")
-    print(f"- Directory: {speakers_dir}/{old_speaker_dir_name} -> {speakers_dir}/{new_speaker_dir_name}")
+    print(f"- {result['utterances']} utterances reassigned")
     print(f"- Metadata and transcripts have been updated")
     
     # 6. Run update_speaker_db_verified.py if requested
     if update_db:
         # Check if the legacy speaker directory exists (it should after the rename operation)
         target_dir = os.path.join("speaker_utterances", new_speaker)
+        # Minimal-profile conversations get their legacy copies when they are needed
+        ensure_views(conversation_path, ["legacy_utterances"], project_dir)
         if os.path.isdir(os.path.join(project_dir, target_dir)):
             print(f"\nRunning update_speaker_db_verified.py for {new_speaker}...")
             command = [
@@ -216,14 +328,29 @@ def main():
     import argparse
     
     parser = argparse.ArgumentParser(description="Rename a speaker in a processed conversation.")
-    parser.add_argument("conversation_path", help="Path to the conversation directory")
+    parser.add_argument("conversation_path",
+                        help="Path to the conversation directory (or the processed conversations folder with --all)")
     parser.add_argument("old_speaker", help="Current speaker name to replace")
     parser.add_argument("new_speaker", help="New speaker name")
     parser.add_argument("--update-db", action="store_true", help="Run update_speaker_db_verified.py after renaming")
     parser.add_argument("--confidence", type=float, default=0.60, help="Confidence threshold for update_speaker_db_verified.py")
+    parser.add_argument("--all", action="store_true", help="Rename the speaker across the whole archive")
+    parser.add_argument("--workers", type=int, default=8, help="Conversations updated in parallel with --all")
     
     args = parser.parse_args()
     
+    if args.all:
+        summary = rename_speaker_across_archive(args.conversation_path, args.old_speaker, args.new_speaker,
+                                                max_workers=args.workers)
+        print(f"Renamed '{args.old_speaker}' to '{args.new_speaker}' in {summary['updated']} of "
+              f"{summary['conversations']} conversations ({summary['utterances']} utterances, "
+              f"{summary['files_changed']} files) in {summary['elapsed_seconds']}s")
+        for error in summary["errors"]:
+            print(f"  Error in {error['conversation_id']}: {error['error']}")
+        if summary["errors"]:
+            sys.exit(1)
+        return
+    
     success = rename_speaker(
         args.conversation_path, 
         args.old_speaker, 
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Packed storage for a conversation's utterance audio.
+
+Processing writes every utterance as its own uncompressed
+utterances/utterance_NNN.wav, so one meeting leaves hundreds of small PCM
+files behind. A packed conversation keeps all of them in one compressed
+stream instead:
+
+- segments.flac (or segments.opus): the utterances back to back, in order
+- segments_index.json: where each utterance starts in the stream and how long it is
+
+Utterances are cut out of the stream on demand (load_utterance_audio), and
+recently used ones are kept decoded in a small LRU (get_segment_wav). FLAC
+is lossless, so the packed audio is sample-exact. Opus is much smaller but
+lossy and resampled to 48 kHz.
+
+Existing conversations are converted with:
+
+    python segment_store.py --all                     # Pack every conversation (FLAC)
+    python segment_store.py processed_conversations/conversation_20250312_101500 --verify
+    python segment_store.py --all --compress-original # Also store original WAVs as FLAC
+"""
+
+import io
+import os
+import sys
+import json
+import shutil
+import argparse
+import threading
+from collections import OrderedDict
+
+from pydub import AudioSegment
+
+from conversation_index import atomic_write_json
+
+# Sample-exact reads of the packed stream when soundfile is installed
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+PROCESSED_DIR = "processed_conversations"
+SEGMENTS_INDEX_FILE = "segments_index.json"
+SEGMENTS_INDEX_VERSION = 1
+CODECS = {
+    "flac": {"file": "segments.flac", "format": "flac", "parameters": None},
+    "opus": {"file": "segments.opus", "format": "opus", "parameters": ["-b:a", "32k"]}
+}
+
+# Decoded segments kept in memory (as WAV bytes)
+SEGMENT_CACHE_SIZE = 128
+
+_segment_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _utterance_path(conversation_dir, utterance):
+    return os.path.join(conversation_dir, utterance.get("audio_file", f"utterances/{utterance['id']}.wav"))
+
+def load_segments_index(conversation_dir):
+    """Get a conversation's segment index, or None if it isn't packed"""
+    index_path = os.path.join(conversation_dir, SEGMENTS_INDEX_FILE)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, "r") as f:
+        return json.load(f)
+
+def _read_packed(conversation_dir, segments_index, segment_id):
+    """Cut one segment out of the packed stream"""
+    segment = segments_index["segments"].get(segment_id)
+    if segment is None:
+        return None
+
+    stream_path = os.path.join(conversation_dir, segments_index["file"])
+    if soundfile is not None and segments_index["codec"] == "flac":
+        # Seek straight to the segment's first sample
+        data, frame_rate = soundfile.read(stream_path, start=segment["start_sample"],
+                                          frames=segment["samples"], dtype="int16")
+        return AudioSegment(data.tobytes(), frame_rate=frame_rate, sample_width=2,
+                            channels=1 if data.ndim == 1 else data.shape[1])
+
+    # ffmpeg seeks to the segment; trimming to the stored length keeps it exact
+    audio = AudioSegment.from_file(stream_path, format=CODECS[segments_index["codec"]]["format"],
+                                   start_second=segment["start_ms"] / 1000.0,
+                                   duration=segment["duration_ms"] / 1000.0 + 0.05)
+    if segments_index["codec"] == "flac":
+        return audio.get_sample_slice(0, segment["samples"])
+    return audio[:segment["duration_ms"]]
+
+def load_utterance_audio(conversation_dir, utterance):
+    """
+    Load an utterance's audio from its WAV file or the packed stream
+
+    Returns:
+        AudioSegment: The utterance audio, or None if it isn't stored
+    """
+    audio_path = _utterance_path(conversation_dir, utterance)
+    if os.path.exists(audio_path):
+        return AudioSegment.from_file(audio_path)
+
+    segments_index = load_segments_index(conversation_dir)
+    if segments_index is None:
+        return None
+    return _read_packed(conversation_dir, segments_index, utterance["id"])
+
+def get_segment_wav(conversation_dir, segment_id):
+    """
+    Get a segment of a packed conversation as WAV bytes (LRU cached)
+
+    Returns:
+        bytes: WAV data, or None if the conversation isn't packed or has no such segment
+    """
+    index_path = os.path.join(conversation_dir, SEGMENTS_INDEX_FILE)
+    try:
+        mtime_ns = os.stat(index_path).st_mtime_ns
+    except OSError:
+        return None
+
+    # Repacking changes the index, which invalidates its cached segments
+    key = (os.path.abspath(conversation_dir), segment_id)
+    with _cache_lock:
+        entry = _segment_cache.get(key)
+        if entry and entry[0] == mtime_ns:
+            _segment_cache.move_to_end(key)
+            return entry[1]
+
+    audio = _read_packed(conversation_dir, load_segments_index(conversation_dir), segment_id)
+    if audio is None:
+        return None
+    buffer = io.BytesIO()
+    audio.export(buffer, format="wav")
+    wav = buffer.getvalue()
+
+    with _cache_lock:
+        _segment_cache[key] = (mtime_ns, wav)
+        _segment_cache.move_to_end(key)
+        while len(_segment_cache) > SEGMENT_CACHE_SIZE:
+            _segment_cache.popitem(last=False)
+    return wav
+
+def pack_conversation(conversation_dir, codec="flac", verify=False, keep_files=False, compress_original=False):
+    """
+    Convert a conversation's utterance WAV files into one packed stream
+
+    The stream and index are written first; the WAV files (and the speakers/
+    links to them) are only removed once the index is in place.
+
+    Args:
+        conversation_dir: Path to the conversation directory
+        codec: "flac" (lossless) or "opus" (lossy)
+        verify: Decode every segment again and compare its length before deleting anything
+        keep_files: Keep the WAV files next to the packed stream
+        compress_original: Also re-encode an original_audio.wav as FLAC
+
+    Returns:
+        dict: Bytes before and after, and the number of packed segments
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec: {codec} (expected one of {', '.join(CODECS)})")
+
+    metadata_path = os.path.join(conversation_dir, "metadata.json")
+    with open(metadata_path, "r") as f:
+        metadata = json.load(f)
+
+    summary = {"conversation_id": metadata["conversation_id"], "segments": 0, "bytes_before": 0, "bytes_after": 0}
+    utterances = [u for u in metadata["utterances"] if os.path.exists(_utterance_path(conversation_dir, u))]
+
+    if utterances and load_segments_index(conversation_dir) is None:
+        chunks = []
+        segments = {}
+        first = None
+        samples = 0
+        for utterance in utterances:
+            audio_path = _utterance_path(conversation_dir, utterance)
+            audio = AudioSegment.from_file(audio_path)
+            if first is None:
+                first = audio  # All segments take the format of the first one
+            audio = audio.set_frame_rate(first.frame_rate).set_channels(first.channels).set_sample_width(first.sample_width)
+            segments[utterance["id"]] = {
+                "start_sample": samples,
+                "samples": int(audio.frame_count()),
+                "start_ms": round(samples * 1000 / first.frame_rate),
+                "duration_ms": len(audio)
+            }
+            chunks.append(audio.raw_data)
+            samples += int(audio.frame_count())
+            summary["bytes_before"] += os.path.getsize(audio_path)
+        packed = AudioSegment(data=b"".join(chunks), frame_rate=first.frame_rate,
+                              sample_width=first.sample_width, channels=first.channels)
+
+        settings = CODECS[codec]
+        stream_path = os.path.join(conversation_dir, settings["file"])
+        packed.export(stream_path, format=settings["format"], parameters=settings["parameters"])
+        segments_index = {
+            "version": SEGMENTS_INDEX_VERSION,
+            "codec": codec,
+            "file": settings["file"],
+            "frame_rate": packed.frame_rate,
+            "channels": packed.channels,
+            "sample_width": packed.sample_width,
+            "segments": segments
+        }
+
+        if verify:
+            for segment_id, segment in segments.items():
+                audio = _read_packed(conversation_dir, segments_index, segment_id)
+                if audio is None or abs(len(audio) - segment["duration_ms"]) > 1:
+                    os.remove(stream_path)
+                    raise ValueError(f"Verification failed for {segment_id} in {conversation_dir}")
+
+        atomic_write_json(os.path.join(conversation_dir, SEGMENTS_INDEX_FILE), segments_index)
+        summary["segments"] = len(segments)
+        summary["bytes_after"] = os.path.getsize(stream_path)
+
+        if not keep_files:
+            for utterance in utterances:
+                os.remove(_utterance_path(conversation_dir, utterance))
+            # The speakers/ links pointed at the WAV files
+            speakers_dir = os.path.join(conversation_dir, "speakers")
+            if os.path.isdir(speakers_dir):
+                shutil.rmtree(speakers_dir)
+            # Recorded so the links are rebuilt from the packed stream on demand (see generate_views.py)
+            from generate_views import recorded_views
+            metadata["generated_views"] = sorted(recorded_views(metadata) - {"speakers"})
+
+        metadata["audio_storage"] = {"format": "packed", "codec": codec, "index": SEGMENTS_INDEX_FILE}
+
+    if compress_original:
+        original_wav = os.path.join(conversation_dir, "original_audio.wav")
+        if os.path.exists(original_wav):
+            original_flac = os.path.join(conversation_dir, "original_audio.flac")
+            AudioSegment.from_file(original_wav).export(original_flac, format="flac")
+            summary["bytes_before"] += os.path.getsize(original_wav)
+            summary["bytes_after"] += os.path.getsize(original_flac)
+            os.remove(original_wav)
+            metadata["original_audio"] = "original_audio.flac"
+
+    atomic_write_json(metadata_path, metadata)
+    return summary
+
+def main():
+    """Process command line arguments and pack conversations"""
+    parser = argparse.ArgumentParser(description="Pack conversations' utterance audio into one compressed stream.")
+    parser.add_argument("conversations", nargs="*", help="Conversation directories")
+    parser.add_argument("--all", action="store_true", help="Pack every processed conversation")
+    parser.add_argument("--codec", choices=sorted(CODECS), default="flac", help="flac (lossless, default) or opus (lossy)")
+    parser.add_argument("--verify", action="store_true", help="Decode every segment again before deleting the WAV files")
+    parser.add_argument("--keep-files", action="store_true", help="Keep the WAV files")
+    parser.add_argument("--compress-original", action="store_true", help="Also store original_audio.wav as FLAC")
+    parser.add_argument("--processed-dir", default=PROCESSED_DIR, help="Processed conversations folder (with --all)")
+
+    args = parser.parse_args()
+
+    conversations = list(args.conversations)
+    if args.all and os.path.isdir(args.processed_dir):
+        conversations += [os.path.join(args.processed_dir, d) for d in sorted(os.listdir(args.processed_dir))]
+    conversations = [c for c in conversations if os.path.exists(os.path.join(c, "metadata.json"))]
+    if not conversations:
+        print("No processed conversations found")
+        sys.exit(1)
+
+    total_before = total_after = 0
+    for conversation_dir in conversations:
+        try:
+            summary = pack_conversation(conversation_dir, args.codec, args.verify, args.keep_files, args.compress_original)
+        except Exception as e:
+            print(f"{conversation_dir}: failed ({e})")
+            continue
+        total_before += summary["bytes_before"]
+        total_after += summary["bytes_after"]
+        if summary["bytes_before"]:
+            print(f"{summary['conversation_id']}: {summary['segments']} segments, "
+                  f"{summary['bytes_before'] / 1e6:.1f} MB -> {summary['bytes_after'] / 1e6:.1f} MB")
+        else:
+            print(f"{summary['conversation_id']}: already packed")
+
+    if total_before:
+        print(f"\nTotal: {total_before / 1e6:.1f} MB -> {total_after / 1e6:.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Within-conversation clustering of utterance embeddings.
+
+The cluster mode of process_conversation identifies speakers once per
+voice instead of once per utterance. The clustering itself only needs the
+embeddings and a function that matches a vector against a speaker bank,
+so it lives here, without the model stack: processing passes its
+database lookup, and evaluate_identification.py replays stored
+embeddings against a local bank.
+"""
+
+import numpy as np
+
+CLUSTER_OUTLIER_THRESHOLD = 0.50   # Members less similar to their cluster are looked up alone
+CLUSTER_REASSIGN_MARGIN = 0.10     # Margin needed to move an utterance to another diarization label
+
+# Utterances shorter than this always inherit their cluster's identity
+SHORT_UTTERANCE_SECONDS = 0.7
+
+def identify_clusters(utterances, embeddings, match, confidence_threshold=0.40, verbose=True):
+    """
+    Identify speakers once per cluster of utterance embeddings
+
+    AssemblyAI's speaker labels are used as the initial clusters. Utterances
+    that are clearly closer to another label's centroid are moved there, then
+    each cluster is matched once using a robust (outlier-trimmed,
+    duration-weighted) centroid and the identity is propagated to its
+    members. Long utterances that don't fit their cluster are left for a
+    per-utterance lookup; short ones always inherit.
+
+    Args:
+        utterances: Utterances with speaker (diarization label), start and end (ms)
+        embeddings: One flat embedding (or None for silent utterances) per utterance
+        match: Function (vector, confidence_threshold) -> (speaker_name or
+            None, confidence, embedding_id) looking a centroid up in the bank
+        confidence_threshold: Minimum score for a cluster match
+        verbose: Print the identity found for each cluster
+
+    Returns:
+        tuple: (assignments by utterance index, cluster statistics). Outliers
+        and silent utterances have no assignment.
+    """
+    rows = [i for i, embedding in enumerate(embeddings) if embedding is not None]
+    stats = {"clusters": 0, "bank_lookups": 0, "outliers": 0}
+    if not rows:
+        return {}, stats
+
+    vectors = np.stack([np.asarray(embeddings[i], dtype=np.float32).ravel() for i in rows])
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    durations = np.array([(utterances[i]["end"] - utterances[i]["start"]) / 1000.0 for i in rows])
+    is_short = durations < SHORT_UTTERANCE_SECONDS
+    weights = np.minimum(durations, 10.0)  # Longer utterances give more reliable embeddings
+
+    # Start from the diarization labels
+    labels = sorted(set(utterances[i].get("speaker", "A") for i in rows))
+    assignment = np.array([labels.index(utterances[i].get("speaker", "A")) for i in rows])
+
+    def centroids_for(mask):
+        result = np.zeros((len(labels), vectors.shape[1]), dtype=np.float32)
+        for c in range(len(labels)):
+            members = (assignment == c) & mask
+            if members.any():
+                centroid = (vectors[members] * weights[members, None]).sum(axis=0)
+                result[c] = centroid / (np.linalg.norm(centroid) + 1e-12)
+        return result
+
+    # Move utterances that clearly belong to another label
+    centroids = centroids_for(np.ones(len(rows), dtype=bool))
+    for _ in range(2):
+        similarities = vectors @ centroids.T
+        own = similarities[np.arange(len(rows)), assignment]
+        best = similarities.argmax(axis=1)
+        moved = (best != assignment) & (similarities.max(axis=1) - own >= CLUSTER_REASSIGN_MARGIN) & ~is_short
+        if not moved.any():
+            break
+        assignment[moved] = best[moved]
+        centroids = centroids_for(np.ones(len(rows), dtype=bool))
+
+    # Recompute centroids without the outliers so they don't drag the identity
+    own = (vectors @ centroids.T)[np.arange(len(rows)), assignment]
+    inliers = own >= CLUSTER_OUTLIER_THRESHOLD
+    centroids = centroids_for(inliers)
+    own = (vectors @ centroids.T)[np.arange(len(rows)), assignment]
+    outliers = (own < CLUSTER_OUTLIER_THRESHOLD) & ~is_short
+
+    assignments = {}
+    for c, label in enumerate(labels):
+        members = np.flatnonzero((assignment == c) & ~outliers)
+        if len(members) == 0 or not centroids[c].any():
+            continue
+
+        # One bank lookup for the whole cluster
+        stats["clusters"] += 1
+        stats["bank_lookups"] += 1
+        speaker_name, confidence, embedding_id = match(centroids[c], confidence_threshold)
+        if verbose:
+            print(f"  Cluster {label} ({len(members)} utterances): "
+                  f"{speaker_name or 'no match'} (confidence: {confidence:.4f})")
+
+        # The member closest to the centroid represents the cluster
+        representative = members[np.argmax(own[members])]
+        for m in members:
+            assignments[rows[m]] = {
+                "speaker": speaker_name,
+                "confidence": confidence,
+                "embedding_id": embedding_id,
+                "cluster": label,
+                "cluster_similarity": float(own[m]),
+                "representative": m == representative
+            }
+
+    stats["outliers"] = int(outliers.sum())
+    stats["bank_lookups"] += stats["outliers"]
+    return assignments, stats
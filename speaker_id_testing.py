@@ -2,19 +2,28 @@ import sys
 import os
 import json
 import shutil
+import tempfile
+import threading
+import functools
 import assemblyai as aai
-from pinecone import Pinecone
+from vector_store import get_vector_store
+from enrollment_queue import get_enrollment_queue
 from nemo.collections.asr.models import EncDecSpeakerLabelModel
 import torch
 import numpy as np
 from pydub import AudioSegment
 from datetime import datetime
 import uuid
+from voice_activity import compute_voice_activity, trim_to_voiced
+from speaker_clustering import identify_clusters
+from conversation_index import atomic_write_json, update_conversation, hash_file
+from profiling import span, traced, start_tracing, stop_tracing, TRACE_FILENAME
+from segment_store import pack_conversation
+from utterance_log import UTTERANCE_LOG_FILE, append_utterance, read_utterance_log, compact_records
 
 # Initialize APIs
 aai.settings.api_key = os.getenv("ASSEMBLYAI_API_KEY")
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pc.Index("speaker-embeddings")
+index = get_vector_store()
 
 # Set custom HuggingFace cache directory in the project folder
 os.environ["TRANSFORMERS_CACHE"] = os.path.join(os.getcwd(), "hf_cache")
@@ -25,9 +34,38 @@ os.makedirs(os.path.join(os.getcwd(), "hf_cache"), exist_ok=True)
 PROCESSED_DIR = "processed_conversations"
 UTTERANCES_DIR = "speaker_utterances"  # Keep backward compatibility for now
 
+# What processing writes besides the canonical utterance audio, metadata,
+# transcript and embeddings. Views left out can be generated later from
+# metadata.json (see generate_views.py).
+OUTPUT_PROFILES = {
+    "full": {"speakers", "legacy_utterances", "legacy_transcript"},
+    "minimal": set()
+}
+DEFAULT_OUTPUT_PROFILE = os.getenv("OUTPUT_PROFILE", "full")
+
+# Pack the utterance audio into one FLAC stream after processing (see segment_store.py)
+DEFAULT_PACK_SEGMENTS = os.getenv("PACK_SEGMENTS", "false").lower() == "true"
+
 # Confidence threshold for automatic database updates
 AUTO_UPDATE_CONFIDENCE_THRESHOLD = 0.70
 
+# Best-match score at which an embedding counts as already in the database
+DUPLICATE_SIMILARITY_THRESHOLD = 0.98
+
+# Local copy of the speaker recognition model
+MODEL_PATH = "models/titanet_large.nemo"
+
+# Stored per-utterance embeddings (row-aligned with metadata["utterances"])
+EMBEDDINGS_FILE = "embeddings.npy"
+EMBEDDING_MODEL_VERSION = "titanet_large-v1"
+EMBEDDING_DIM = 192
+EMBEDDING_DTYPE = np.float32
+
+# Speaker recognition model shared by every caller in this process
+_speaker_model = None
+_speaker_model_lock = threading.Lock()
+_inference_lock = threading.Lock()
+
 def format_time(ms):
     """Format milliseconds as HH:MM:SS"""
     seconds = ms / 1000
@@ -42,7 +80,9 @@ def convert_to_wav(input_file):
         
     print(f"Converting {input_file} to WAV format...")
     base_filename = os.path.splitext(os.path.basename(input_file))[0]
-    wav_file = f"{base_filename}_temp.wav"
+    # Unique name so files with the same name can be converted concurrently
+    fd, wav_file = tempfile.mkstemp(prefix=f"{base_filename}_", suffix="_temp.wav")
+    os.close(fd)
     
     # Load and convert the audio file
     audio = AudioSegment.from_file(input_file)
@@ -58,6 +98,7 @@ def convert_to_wav(input_file):
     
     return wav_file
 
+@traced("transcribe")
 def transcribe(file_path):
     """Transcribe audio file using AssemblyAI"""
     print(f"\nTranscribing {file_path}...")
@@ -66,6 +107,48 @@ def transcribe(file_path):
     transcript = transcriber.transcribe(file_path)
     return transcript.json_response
 
+def load_speaker_model():
+    """Load the speaker recognition model once and share it across calls"""
+    global _speaker_model
+    
+    with _speaker_model_lock:
+        if _speaker_model is not None:
+            return _speaker_model
+        
+        print("\nLoading speaker recognition model...")
+        speaker_model = None
+        # Try loading from local file first
+        if os.path.exists(MODEL_PATH):
+            try:
+                speaker_model = EncDecSpeakerLabelModel.restore_from(MODEL_PATH)
+                print(f"Loaded model from local path: {MODEL_PATH}")
+            except Exception as e:
+                print(f"Error loading local model: {e}")
+                
+        # If local loading failed, try downloading
+        if speaker_model is None:
+            try:
+                print("Trying to download model from NGC...")
+                speaker_model = EncDecSpeakerLabelModel.from_pretrained(model_name="titanet_large")
+                
+                # Save for future use
+                os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
+                speaker_model.save_to(MODEL_PATH)
+                print(f"Model saved to: {MODEL_PATH} for future use")
+            except Exception as e:
+                print(f"Error downloading model: {e}")
+                print("\nPlease run direct_model_download.py first to download the model.")
+                raise Exception("Could not load speaker recognition model. Run direct_model_download.py first.")
+        
+        _speaker_model = speaker_model
+        return _speaker_model
+
+def embedding_to_numpy(embedding):
+    """Convert a model embedding to a flat numpy array"""
+    if isinstance(embedding, torch.Tensor):
+        return embedding.squeeze().cpu().numpy()
+    return np.asarray(embedding).squeeze()
+
 def add_embedding_to_pinecone(embedding, speaker_name, source_file, is_short=False, duration_seconds=None):
     """Add an embedding to Pinecone with appropriate metadata"""
     # Generate unique ID
@@ -95,77 +178,198 @@ def add_embedding_to_pinecone(embedding, speaker_name, source_file, is_short=Fal
     
     return unique_id
 
-def check_if_embedding_exists(embedding, similarity_threshold=0.98):
+def check_if_embedding_exists(embedding, similarity_threshold=DUPLICATE_SIMILARITY_THRESHOLD):
     """Check if an embedding already exists in the database"""
+    lookup = lookup_embedding(embedding, duplicate_threshold=similarity_threshold)
+    return lookup["is_duplicate"], lookup["duplicate_id"]
+
+@traced("embed")
+def get_segment_embedding(audio_segment, speaker_model):
+    """Generate the speaker embedding for an audio segment"""
+    # Save segment to a temporary file (unique so concurrent jobs don't collide)
+    fd, temp_wav = tempfile.mkstemp(prefix="temp_segment_", suffix=".wav")
+    os.close(fd)
+    audio_segment.export(temp_wav, format="wav")
+    
+    try:
+        # Inference on the shared model is serialized between threads
+        with _inference_lock:
+            return speaker_model.get_embedding(temp_wav)
+    finally:
+        if os.path.exists(temp_wav):
+            os.remove(temp_wav)
+
+@traced("query")
+def lookup_embedding(embedding, confidence_threshold=0.40, is_short=False,
+                     duplicate_threshold=DUPLICATE_SIMILARITY_THRESHOLD):
+    """
+    Look an embedding up in the speaker database with a single query
+    
+    One query answers identification, the near-duplicate check and
+    auto-update eligibility together, so callers never need to query the
+    same vector twice.
+    
+    Args:
+        embedding: Embedding to look up
+        confidence_threshold: Minimum score to accept the best match
+        is_short: Fetch (and print) an extra candidate for short utterances
+        duplicate_threshold: Score at which the best match counts as a duplicate
+        
+    Returns:
+        dict: speaker_name/confidence/embedding_id of the accepted match (None,
+        0.0, None if below threshold), the raw matches, is_duplicate and
+        duplicate_id, and whether the embedding may be auto-added
+    """
+    # Look for top 2 matches for short utterances to see candidates
+    top_k = 2 if is_short else 1
+    
+    # Query database
     results = index.query(
-        vector=embedding.tolist(),
-        top_k=1,
+        vector=embedding_to_numpy(embedding).tolist(),
+        top_k=top_k,  # Get more matches for short utterances
         include_metadata=True
     )
     
-    if results["matches"] and results["matches"][0]["score"] >= similarity_threshold:
-        return True, results["matches"][0]["id"]
+    lookup = {
+        "speaker_name": None,
+        "confidence": 0.0,
+        "embedding_id": None,
+        "matches": results["matches"],
+        "is_duplicate": False,
+        "duplicate_id": None,
+        "auto_update": False
+    }
+    
+    if results["matches"]:
+        match = results["matches"][0]
+        
+        # For short utterances, print more details
+        if is_short:
+            print(f"  Top matches:")
+            for i, match_result in enumerate(results["matches"]):
+                is_short_sample = match_result["metadata"].get("is_short_utterance", False)
+                print(f"   {i+1}. {match_result['metadata']['speaker_name']} "
+                      f"(score: {match_result['score']:.4f}, "
+                      f"short sample: {is_short_sample})")
+        
+        if match["score"] >= confidence_threshold:
+            lookup["speaker_name"] = match["metadata"]["speaker_name"]
+            lookup["confidence"] = match["score"]
+            lookup["embedding_id"] = match["id"]
+        
+        if match["score"] >= duplicate_threshold:
+            lookup["is_duplicate"] = True
+            lookup["duplicate_id"] = match["id"]
+        
+        lookup["auto_update"] = (
+            lookup["confidence"] >= AUTO_UPDATE_CONFIDENCE_THRESHOLD and not lookup["is_duplicate"]
+        )
+    
+    return lookup
+
+def match_embedding(embedding, confidence_threshold=0.40, is_short=False):
+    """Match an embedding against the speaker database"""
+    lookup = lookup_embedding(embedding, confidence_threshold, is_short)
+    return lookup["speaker_name"], lookup["confidence"], lookup["embedding_id"]
+
+def lookup_voice_segment(audio_segment, speaker_model, confidence_threshold=0.40, is_short=False):
+    """Embed a voice segment and look it up in the speaker database"""
+    # Generate embedding
+    embedding = get_segment_embedding(audio_segment, speaker_model)
+    
+    # Special handling for very short utterances - log additional info
+    segment_duration = len(audio_segment) / 1000.0  # Convert to seconds
+    if segment_duration < 0.7:  # Less than 700ms
+        is_short = True
+        print(f"  Short utterance detected ({segment_duration:.2f} seconds)")
     
-    return False, None
+    return lookup_embedding(embedding, confidence_threshold, is_short), embedding
 
 def test_voice_segment(audio_segment, speaker_model, confidence_threshold=0.40, is_short=False):
     """Test a voice segment against the speaker database"""
-    # Save segment to temporary file
-    temp_wav = "temp_segment.wav"
-    audio_segment.export(temp_wav, format="wav")
+    lookup, embedding = lookup_voice_segment(audio_segment, speaker_model, confidence_threshold, is_short)
+    return lookup["speaker_name"], lookup["confidence"], lookup["embedding_id"], embedding
+
+@traced("cluster")
+def identify_by_clustering(utterances, embeddings, confidence_threshold=0.40):
+    """
+    Identify speakers once per cluster of utterance embeddings
     
-    try:
-        # Generate embedding
-        embedding = speaker_model.get_embedding(temp_wav)
-        
-        # Special handling for very short utterances - log additional info
-        segment_duration = len(audio_segment) / 1000.0  # Convert to seconds
-        if segment_duration < 0.7:  # Less than 700ms
-            is_short = True
-            print(f"  Short utterance detected ({segment_duration:.2f} seconds)")
-            
-            # Look for top 2 matches to see candidates
-            top_k = 2
-        else:
-            top_k = 1
-            
-        # Query database
-        results = index.query(
-            vector=embedding.tolist(),
-            top_k=top_k,  # Get more matches for short utterances
-            include_metadata=True
-        )
+    See speaker_clustering.identify_clusters; clusters are matched against
+    the speaker database.
+    
+    Args:
+        utterances: AssemblyAI utterances (with speaker, start and end)
+        embeddings: One embedding (or None for silent utterances) per utterance
+        confidence_threshold: Minimum score for a cluster match
         
-        if results["matches"]:
-            match = results["matches"][0]
-            
-            # For short utterances, print more details
-            if is_short:
-                print(f"  Top matches:")
-                for i, match_result in enumerate(results["matches"]):
-                    is_short_sample = match_result["metadata"].get("is_short_utterance", False)
-                    print(f"   {i+1}. {match_result['metadata']['speaker_name']} "
-                          f"(score: {match_result['score']:.4f}, "
-                          f"short sample: {is_short_sample})")
-            
-            if match["score"] >= confidence_threshold:
-                return match["metadata"]["speaker_name"], match["score"], match["id"], embedding
+    Returns:
+        tuple: (assignments by utterance index, cluster statistics). Outliers
+        and silent utterances have no assignment.
+    """
+    vectors = [embedding_to_numpy(e) if e is not None else None for e in embeddings]
+    return identify_clusters(utterances, vectors, match_embedding, confidence_threshold)
+
+def move_speaker_link(speakers_dir, utterance_id, old_speaker, new_speaker):
+    """Move an utterance's entry in the speakers/ folder from one speaker to another"""
+    # Conversations processed with the minimal output profile have no speakers/ folder
+    if not os.path.isdir(speakers_dir):
+        return
     
-    finally:
-        if os.path.exists(temp_wav):
-            os.remove(temp_wav)
+    old_speaker_dir = os.path.join(speakers_dir, old_speaker.replace(" ", "_"))
+    new_speaker_dir = os.path.join(speakers_dir, new_speaker.replace(" ", "_"))
     
-    return None, 0.0, None, embedding
+    # Create the new speaker directory if needed
+    os.makedirs(new_speaker_dir, exist_ok=True)
+    
+    utterance_file = f"{utterance_id}.wav"
+    old_path = os.path.join(old_speaker_dir, utterance_file)
+    new_path = os.path.join(new_speaker_dir, utterance_file)
+    
+    # Get the target of the symlink
+    if os.path.exists(old_path):
+        try:
+            # For symlinks
+            if os.path.islink(old_path):
+                target = os.readlink(old_path)
+                if os.path.exists(new_path):
+                    os.remove(new_path)
+                os.symlink(target, new_path)
+                os.remove(old_path)
+            else:
+                # For regular files (if not using symlinks)
+                shutil.copy2(old_path, new_path)
+                os.remove(old_path)
+        except (OSError, FileNotFoundError) as e:
+            print(f"  Error moving file: {e}")
+    
+    # Remove empty directory if needed
+    if os.path.exists(old_speaker_dir) and not os.listdir(old_speaker_dir):
+        try:
+            os.rmdir(old_speaker_dir)
+            print(f"  Removed empty directory: {old_speaker_dir}")
+        except OSError as e:
+            print(f"  Error removing directory: {e}")
 
-def identify_unknown_speakers_by_combining(utterance_metadata, conversation_info, full_audio, speaker_model):
-    """Combine utterances from unknown speakers to create more robust samples for identification"""
-    # Group utterances by unknown speaker ID
+@traced("combine")
+def identify_unknown_speakers_by_combining(utterance_metadata, conversation_info, full_audio, speaker_model, vad=None,
+                                           load_segment=None, embeddings=None):
+    """
+    Combine utterances from unknown speakers to create more robust samples for identification
+
+    The voiced audio of each utterance is cut from full_audio, unless a
+    load_segment(utterance) callable is given (e.g. to read stored utterance
+    files when the full audio is not decoded). When stored embeddings
+    (row-aligned with utterance_metadata) are given, the group is matched
+    with their normalized mean instead and no inference is run.
+    """
+    # Group utterances (with their row) by unknown speaker ID
     unknown_speakers = {}
-    for utterance in utterance_metadata:
+    for row, utterance in enumerate(utterance_metadata):
         if utterance["speaker"].startswith("Unknown_"):
             if utterance["speaker"] not in unknown_speakers:
                 unknown_speakers[utterance["speaker"]] = []
-            unknown_speakers[utterance["speaker"]].append(utterance)
+            unknown_speakers[utterance["speaker"]].append((row, utterance))
     
     if not unknown_speakers:
         return utterance_metadata
@@ -173,107 +377,144 @@ def identify_unknown_speakers_by_combining(utterance_metadata, conversation_info
     print(f"Found {len(unknown_speakers)} unknown speaker(s) to process")
     
     # Process each unknown speaker group
-    for unknown_speaker, utterances in unknown_speakers.items():
+    for unknown_speaker, members in unknown_speakers.items():
+        utterances = [utterance for _, utterance in members]
         print(f"\nProcessing combined utterances for {unknown_speaker} ({len(utterances)} utterances)...")
         
-        # Combine all utterances into one audio segment
-        combined_audio = AudioSegment.empty()
-        for utterance in utterances:
-            segment = full_audio[utterance["start_ms"]:utterance["end_ms"]]
-            combined_audio += segment
+        if embeddings is not None:
+            embedding = combine_embeddings(embeddings[[row for row, _ in members]])
+            if embedding is None:
+                print(f"  No stored embeddings for these utterances, skipping")
+                continue
+        else:
+            # Combine the voiced part of all utterances into one audio segment
+            combined_audio = AudioSegment.empty()
+            for utterance in utterances:
+                if load_segment is not None:
+                    segment = load_segment(utterance)
+                else:
+                    segment, _ = trim_to_voiced(full_audio, vad, utterance["start_ms"], utterance["end_ms"])
+                if segment is not None:
+                    combined_audio += segment
+                
+            # Skip if combined audio is still too short
+            if len(combined_audio) < 1000:  # 1 second
+                print(f"  Combined audio still too short ({len(combined_audio)}ms), skipping")
+                continue
             
-        # Skip if combined audio is still too short
-        if len(combined_audio) < 1000:  # 1 second
-            print(f"  Combined audio still too short ({len(combined_audio)}ms), skipping")
-            continue
-        
-        print(f"  Combined audio length: {len(combined_audio)}ms")
+            print(f"  Combined audio length: {len(combined_audio)}ms")
+            
+            # Embed the combined audio
+            embedding = get_segment_embedding(combined_audio, speaker_model)
         
-        # Identify the combined audio
-        temp_file = "temp_combined.wav"
-        combined_audio.export(temp_file, format="wav")
+        # Test the combined sample against database
+        lookup = lookup_embedding(embedding)
         
-        try:
-            # Test the combined sample against database
-            embedding = speaker_model.get_embedding(temp_file)
-            results = index.query(
-                vector=embedding.tolist(),
-                top_k=1,
-                include_metadata=True
-            )
+        if lookup["speaker_name"]:
+            speaker_name = lookup["speaker_name"]
+            confidence = lookup["confidence"]
+            embedding_id = lookup["embedding_id"]
             
-            if results["matches"] and results["matches"][0]["score"] >= 0.40:
-                match = results["matches"][0]
-                speaker_name = match["metadata"]["speaker_name"]
-                confidence = match["score"]
-                embedding_id = match["id"]
-                
-                print(f"  ✅ Identified as {speaker_name} (confidence: {confidence:.4f})")
-                
-                # Normalize speaker name for directory
-                speaker_dir_name = speaker_name.replace(" ", "_")
-                
-                # Create the new speaker directory if needed
-                new_speaker_dir = os.path.join(conversation_info["speakers_dir"], speaker_dir_name)
-                if not os.path.exists(new_speaker_dir):
-                    os.makedirs(new_speaker_dir, exist_ok=True)
+            print(f"  ✅ Identified as {speaker_name} (confidence: {confidence:.4f})")
+            
+            # Reassign all utterances from this unknown speaker
+            for utterance in utterances:
+                old_speaker = utterance["speaker"]
                 
-                # Reassign all utterances from this unknown speaker
-                for utterance in utterances:
-                    old_speaker = utterance["speaker"]
-                    old_speaker_dir_name = old_speaker.replace(" ", "_")
-                    
-                    # Update the metadata
-                    utterance["speaker"] = speaker_name
-                    utterance["confidence"] = confidence
-                    utterance["embedding_id"] = embedding_id
-                    utterance["combined_identification"] = True
-                    
-                    # Move the symlink to the correct speaker directory
-                    old_speaker_dir = os.path.join(conversation_info["speakers_dir"], old_speaker_dir_name)
-                    
-                    # Move the symlink
-                    utterance_file = f"{utterance['id']}.wav"
-                    old_path = os.path.join(old_speaker_dir, utterance_file)
-                    new_path = os.path.join(new_speaker_dir, utterance_file)
-                    
-                    # Get the target of the symlink
-                    if os.path.exists(old_path):
-                        try:
-                            # For symlinks
-                            if os.path.islink(old_path):
-                                target = os.readlink(old_path)
-                                if os.path.exists(new_path):
-                                    os.remove(new_path)
-                                os.symlink(target, new_path)
-                                os.remove(old_path)
-                            else:
-                                # For regular files (if not using symlinks)
-                                shutil.copy2(old_path, new_path)
-                                os.remove(old_path)
-                        except (OSError, FileNotFoundError) as e:
-                            print(f"  Error moving file: {e}")
+                # Update the metadata
+                utterance["speaker"] = speaker_name
+                utterance["confidence"] = confidence
+                utterance["embedding_id"] = embedding_id
+                utterance["combined_identification"] = True
                 
-                # Remove empty directory if needed
-                if os.path.exists(old_speaker_dir) and not os.listdir(old_speaker_dir):
-                    try:
-                        os.rmdir(old_speaker_dir)
-                        print(f"  Removed empty directory: {old_speaker_dir}")
-                    except OSError as e:
-                        print(f"  Error removing directory: {e}")
+                # Move the symlink to the correct speaker directory
+                move_speaker_link(conversation_info["speakers_dir"], utterance["id"], old_speaker, speaker_name)
+        else:
+            if lookup["matches"]:
+                best = lookup["matches"][0]
+                print(f"  ❌ Match found but confidence too low: {best['metadata']['speaker_name']} (confidence: {best['score']:.4f})")
             else:
-                if results["matches"]:
-                    print(f"  ❌ Match found but confidence too low: {results['matches'][0]['metadata']['speaker_name']} (confidence: {results['matches'][0]['score']:.4f})")
-                else:
-                    print(f"  ❌ No matches found for combined utterances")
-                
-        finally:
-            # Clean up
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
+                print(f"  ❌ No matches found for combined utterances")
     
     return utterance_metadata
 
+def combine_embeddings(rows):
+    """Average a set of embeddings into one normalized embedding (ignoring empty rows)"""
+    rows = np.asarray(rows, dtype=np.float32)
+    norms = np.linalg.norm(rows, axis=1)
+    rows = rows[norms > 0] / norms[norms > 0, None]
+    if len(rows) == 0:
+        return None
+    
+    mean = rows.mean(axis=0)
+    return mean / np.linalg.norm(mean)
+
+@traced("save_embeddings")
+def save_conversation_embeddings(conversation_dir, embeddings):
+    """
+    Save the utterance embeddings of a conversation to embeddings.npy
+    
+    Args:
+        conversation_dir: Path to the conversation directory
+        embeddings: One embedding (or None for skipped utterances) per utterance
+        
+    Returns:
+        dict: Description of the stored embeddings for metadata.json
+    """
+    matrix = np.zeros((len(embeddings), EMBEDDING_DIM), dtype=EMBEDDING_DTYPE)
+    for row, embedding in enumerate(embeddings):
+        if embedding is not None:
+            matrix[row] = embedding_to_numpy(embedding)
+    
+    # Write in one shot, replacing any previous file atomically
+    embeddings_path = os.path.join(conversation_dir, EMBEDDINGS_FILE)
+    temp_path = embeddings_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        np.save(f, matrix)
+    os.replace(temp_path, embeddings_path)
+    
+    return {
+        "file": EMBEDDINGS_FILE,
+        "model": EMBEDDING_MODEL_VERSION,
+        "dim": EMBEDDING_DIM,
+        "dtype": np.dtype(EMBEDDING_DTYPE).name,
+        "count": len(embeddings)
+    }
+
+def load_conversation_embeddings(conversation_dir, metadata=None):
+    """
+    Load the stored utterance embeddings of a conversation (memory-mapped)
+    
+    Rows are aligned with metadata["utterances"]; utterances that were never
+    embedded (e.g. silence) have all-zero rows.
+    
+    Args:
+        conversation_dir: Path to the conversation directory
+        metadata: Parsed metadata.json (read from disk if not given)
+        
+    Returns:
+        numpy.ndarray: Read-only embedding matrix, or None if missing or made
+        with a different model
+    """
+    if metadata is None:
+        with open(os.path.join(conversation_dir, "metadata.json"), "r") as f:
+            metadata = json.load(f)
+    
+    info = metadata.get("embeddings")
+    if not info or info.get("model") != EMBEDDING_MODEL_VERSION:
+        return None
+    
+    embeddings_path = os.path.join(conversation_dir, info.get("file", EMBEDDINGS_FILE))
+    if not os.path.exists(embeddings_path):
+        return None
+    
+    embeddings = np.load(embeddings_path, mmap_mode="r")
+    if embeddings.shape[0] != len(metadata.get("utterances", [])):
+        return None
+    
+    return embeddings
+
+@traced("save_legacy")
 def save_utterance_legacy(audio_segment, speaker_name, conversation_name, utterance_text, utterance_id):
     """Save an utterance to the appropriate speaker folder (legacy method)"""
     # Create speaker directory if it doesn't exist
@@ -295,21 +536,32 @@ def save_utterance_legacy(audio_segment, speaker_name, conversation_name, uttera
     
     return filepath
 
-def create_conversation_dir(audio_file):
-    """Create a conversation directory with the new structure"""
+def create_conversation_dir(audio_file, speaker_links=True):
+    """Create a conversation directory with the new structure (speakers/ only if speaker_links)"""
     # Generate a timestamp-based ID for the conversation
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     conversation_id = f"conversation_{timestamp}"
     
-    # Create the main conversation directory
+    # Create the main conversation directory (add a suffix if another job
+    # started in the same second)
+    os.makedirs(PROCESSED_DIR, exist_ok=True)
     conversation_dir = os.path.join(PROCESSED_DIR, conversation_id)
-    os.makedirs(conversation_dir, exist_ok=True)
+    suffix = 1
+    while True:
+        try:
+            os.makedirs(conversation_dir)
+            break
+        except FileExistsError:
+            conversation_id = f"conversation_{timestamp}_{suffix}"
+            conversation_dir = os.path.join(PROCESSED_DIR, conversation_id)
+            suffix += 1
     
     # Create subdirectories
     utterances_dir = os.path.join(conversation_dir, "utterances")
     speakers_dir = os.path.join(conversation_dir, "speakers")
     os.makedirs(utterances_dir, exist_ok=True)
-    os.makedirs(speakers_dir, exist_ok=True)
+    if speaker_links:
+        os.makedirs(speakers_dir, exist_ok=True)
     
     # Copy original audio file
     original_ext = os.path.splitext(audio_file)[1]
@@ -324,8 +576,9 @@ def create_conversation_dir(audio_file):
         "original_audio": original_audio_path
     }
 
-def save_utterance(audio_segment, utterance_data, conversation_info, utterance_id):
-    """Save an utterance using the new structure"""
+@traced("save_utterance")
+def save_utterance(audio_segment, utterance_data, conversation_info, utterance_id, speaker_link=True):
+    """Save an utterance using the new structure (linked from speakers/ if speaker_link)"""
     # Generate utterance filename
     utterance_filename = f"utterance_{utterance_id:03d}.wav"
     utterance_path = os.path.join(conversation_info["utterances_dir"], utterance_filename)
@@ -335,27 +588,29 @@ def save_utterance(audio_segment, utterance_data, conversation_info, utterance_i
     
     # Get speaker name and create normalized version for folder name
     speaker_name = utterance_data["speaker"]
-    speaker_dir_name = speaker_name.replace(" ", "_")
     
-    # Create speaker directory if it doesn't exist
-    speaker_dir = os.path.join(conversation_info["speakers_dir"], speaker_dir_name)
-    os.makedirs(speaker_dir, exist_ok=True)
+    if speaker_link:
+        speaker_dir_name = speaker_name.replace(" ", "_")
     
-    # Create symlink or copy in speaker directory
-    speaker_utterance_path = os.path.join(speaker_dir, utterance_filename)
+        # Create speaker directory if it doesn't exist
+        speaker_dir = os.path.join(conversation_info["speakers_dir"], speaker_dir_name)
+        os.makedirs(speaker_dir, exist_ok=True)
     
-    try:
-        # Try creating a symlink (works on Linux/Mac)
-        rel_path = os.path.relpath(utterance_path, os.path.dirname(speaker_utterance_path))
-        if os.path.exists(speaker_utterance_path):
-            os.remove(speaker_utterance_path)  # Remove existing symlink/file if present
-        os.symlink(rel_path, speaker_utterance_path)
-    except (OSError, AttributeError):
-        # Fallback to copy on Windows or if symlinks not supported
-        shutil.copy2(utterance_path, speaker_utterance_path)
+        # Create symlink or copy in speaker directory
+        speaker_utterance_path = os.path.join(speaker_dir, utterance_filename)
+    
+        try:
+            # Try creating a symlink (works on Linux/Mac)
+            rel_path = os.path.relpath(utterance_path, os.path.dirname(speaker_utterance_path))
+            if os.path.exists(speaker_utterance_path):
+                os.remove(speaker_utterance_path)  # Remove existing symlink/file if present
+            os.symlink(rel_path, speaker_utterance_path)
+        except (OSError, AttributeError):
+            # Fallback to copy on Windows or if symlinks not supported
+            shutil.copy2(utterance_path, speaker_utterance_path)
     
     # Create utterance metadata
-    return {
+    utterance_meta = {
         "id": f"utterance_{utterance_id:03d}",
         "start_time": format_time(utterance_data["start"]),
         "end_time": format_time(utterance_data["end"]),
@@ -365,17 +620,92 @@ def save_utterance(audio_segment, utterance_data, conversation_info, utterance_i
         "text": utterance_data["text"],
         "confidence": utterance_data.get("confidence", 0.0),
         "embedding_id": utterance_data.get("embedding_id", None),
+        "speech_ratio": round(utterance_data.get("speech_ratio", 1.0), 3),
         "audio_file": os.path.join("utterances", utterance_filename)
     }
+    
+    if utterance_data.get("diarization_speaker"):
+        utterance_meta["diarization_speaker"] = utterance_data["diarization_speaker"]
+    
+    # Note identities that were propagated from the utterance's cluster
+    if utterance_data.get("cluster_identification"):
+        utterance_meta["cluster_identification"] = True
+    
+    return utterance_meta
+
+@traced("write_transcript")
+def write_transcript(transcript_path, conversation_name, utterance_metadata):
+    """Write the formatted transcript for a conversation from its utterance metadata"""
+    with open(transcript_path, "w") as f:
+        f.write(f"Conversation Transcript: {conversation_name}\n")
+        f.write("=====================\n\n")
+        for utterance in utterance_metadata:
+            start_time = format_time(utterance["start_ms"])
+            end_time = format_time(utterance["end_ms"])
+            f.write(f"[{utterance['speaker']} {start_time}-{end_time}]: {utterance['text']}\n\n")
+
+def processing_config(cluster=False):
+    """Settings that affect a conversation's results (re-uploads with other settings are re-scored)"""
+    return {"cluster": cluster, "embedding_model": EMBEDDING_MODEL_VERSION}
+
+def apply_enrollment_outcomes(db_update_stats, outcomes, skipped_before_queue):
+    """Fill the enrollment queue's outcome counts into a conversation's database statistics"""
+    db_update_stats["added"] = outcomes["added"]
+    db_update_stats["skipped_duplicate"] = skipped_before_queue + outcomes["duplicate"]
+    db_update_stats["failed"] = outcomes["failed"]
+    db_update_stats["pending"] = outcomes["pending"]
 
-def process_conversation(audio_file):
-    """Process a conversation audio file and identify speakers"""
+def record_enrollment_outcomes(metadata_path, skipped_before_queue, outcomes):
+    """Update a processed conversation's database statistics once its enrollments are written"""
+    with open(metadata_path, "r") as f:
+        metadata = json.load(f)
+    apply_enrollment_outcomes(metadata["database_update_stats"], outcomes, skipped_before_queue)
+    atomic_write_json(metadata_path, metadata)
+
+def process_conversation(audio_file, cluster=False, wav_file=None, content_hash=None,
+                         profile=False, profile_sampler=None, output_profile=None, pack_segments=None):
+    """
+    Process a conversation audio file and identify speakers
+    
+    With cluster=True the utterance embeddings are clustered first (see
+    identify_by_clustering) so the database is queried once per voice instead
+    of once per utterance.
+    
+    wav_file can pass an already decoded WAV of audio_file (the caller
+    owns it); otherwise the file is converted here. content_hash can pass the
+    SHA-256 of audio_file if the caller already computed it.
+    
+    With profile=True the run is traced (see profiling.py) and trace.json
+    is written next to metadata.json; profile_sampler adds a sampling
+    profile ("pyinstrument" or "cprofile").
+    
+    output_profile selects the optional files written besides the canonical
+    output (see OUTPUT_PROFILES; default from the OUTPUT_PROFILE environment
+    variable). "minimal" skips the speakers/ links and the legacy copies.
+    pack_segments stores the utterance audio as one FLAC stream with an
+    offset index instead of one WAV per utterance (default from PACK_SEGMENTS).
+    """
+    output_profile = output_profile or DEFAULT_OUTPUT_PROFILE
+    if output_profile not in OUTPUT_PROFILES:
+        raise ValueError(f"Unknown output profile: {output_profile} (expected one of {', '.join(OUTPUT_PROFILES)})")
+    output_views = OUTPUT_PROFILES[output_profile]
+    if pack_segments is None:
+        pack_segments = DEFAULT_PACK_SEGMENTS
+    
+    tracer = start_tracing(profile_sampler) if profile else None
+    run_span = span("process_conversation", audio_file=os.path.basename(audio_file), cluster=cluster)
+    conversation_info = None
+    
     # Make base directories
     os.makedirs(PROCESSED_DIR, exist_ok=True)
-    os.makedirs(UTTERANCES_DIR, exist_ok=True)  # Keep for backward compatibility
+    if "legacy_utterances" in output_views:
+        os.makedirs(UTTERANCES_DIR, exist_ok=True)  # Keep for backward compatibility
     
     # Convert to WAV if needed
-    wav_file = convert_to_wav(audio_file)
+    converted = wav_file is None
+    if converted:
+        with span("convert"):
+            wav_file = convert_to_wav(audio_file)
     conversation_name = os.path.basename(audio_file)
     
     # Track statistics for short utterances
@@ -386,17 +716,32 @@ def process_conversation(audio_file):
         "unidentified": 0
     }
     
-    # Track statistics for database updates
+    # Track statistics for database updates ("added" and the queue's
+    # duplicates are only known once the enrollment queue wrote them)
+    queued_ids = []
     db_update_stats = {
         "added": 0,
+        "pending": 0,
+        "failed": 0,
         "skipped_low_confidence": 0,
         "skipped_unknown": 0,
-        "skipped_duplicate": 0
+        "skipped_duplicate": 0,
+        "skipped_clustered": 0
+    }
+    
+    # Track how much audio the voice activity detection removed
+    vad_stats = {
+        "silent_utterances": 0,
+        "audio_ms_total": 0,
+        "audio_ms_embedded": 0
     }
     
     try:
         # Create conversation directory structure
-        conversation_info = create_conversation_dir(audio_file)
+        conversation_info = create_conversation_dir(audio_file, speaker_links="speakers" in output_views)
+        if content_hash is None:
+            with span("hash"):
+                content_hash = hash_file(audio_file)
         
         # Get transcript with speaker diarization
         transcript = transcribe(wav_file)
@@ -405,47 +750,54 @@ def process_conversation(audio_file):
         audio_duration = transcript.get("audio_duration", 0)
         
         # Load the full audio file
-        full_audio = AudioSegment.from_file(wav_file)
+        with span("load_audio"):
+            full_audio = AudioSegment.from_file(wav_file)
         
-        # Load speaker recognition model
-        print("\nLoading speaker recognition model...")
-        model_path = "models/titanet_large.nemo"
+        # Run voice activity detection once for the whole conversation
+        print("\nDetecting voice activity...")
+        with span("vad"):
+            vad = compute_voice_activity(full_audio)
         
-        speaker_model = None
-        # Try loading from local file first
-        if os.path.exists(model_path):
-            try:
-                speaker_model = EncDecSpeakerLabelModel.restore_from(model_path)
-                print(f"Loaded model from local path: {model_path}")
-            except Exception as e:
-                print(f"Error loading local model: {e}")
-                
-        # If local loading failed, try downloading
-        if speaker_model is None:
-            try:
-                print("Trying to download model from NGC...")
-                speaker_model = EncDecSpeakerLabelModel.from_pretrained(model_name="titanet_large")
-                
-                # Save for future use
-                os.makedirs("models", exist_ok=True)
-                speaker_model.save_to(model_path)
-                print(f"Model saved to: {model_path} for future use")
-            except Exception as e:
-                print(f"Error downloading model: {e}")
-                print("\nPlease run direct_model_download.py first to download the model.")
-                raise Exception("Could not load speaker recognition model. Run direct_model_download.py first.")
+        # Load speaker recognition model
+        with span("load_model"):
+            speaker_model = load_speaker_model()
         
         # Process each utterance
         print("\nIdentifying speakers and saving utterances...")
         identified_utterances = []
         utterance_paths = {}  # To track saved utterances by speaker
         utterance_metadata = []  # For the metadata.json file
+        conversation_embeddings = []  # Row-aligned with utterance_metadata
+        
+        # Finished utterances are appended here as they complete, so partial
+        # results survive a crash and can be tailed by readers
+        utterance_log_path = os.path.join(conversation_info["dir"], UTTERANCE_LOG_FILE)
+        
+        # In cluster mode, embed everything first and identify once per cluster
+        precomputed_embeddings = {}
+        cluster_assignments = {}
+        cluster_stats = None
+        if cluster:
+            print("Embedding utterances for clustering...")
+            with span("cluster_embed", utterances=len(transcript["utterances"])):
+                for i, utterance in enumerate(transcript["utterances"]):
+                    voiced_segment, _ = trim_to_voiced(full_audio, vad, utterance["start"], utterance["end"])
+                    if voiced_segment is not None:
+                        precomputed_embeddings[i] = get_segment_embedding(voiced_segment, speaker_model)
+            
+            cluster_assignments, cluster_stats = identify_by_clustering(
+                transcript["utterances"],
+                [precomputed_embeddings.get(i) for i in range(len(transcript["utterances"]))]
+            )
+            print(f"  {cluster_stats['bank_lookups']} database lookups for {len(transcript['utterances'])} utterances")
         
         for i, utterance in enumerate(transcript["utterances"]):
             # Extract audio segment
             start_ms = utterance["start"]
             end_ms = utterance["end"]
-            segment = full_audio[start_ms:end_ms]
+            utterance_span = span("utterance", index=i, start_ms=start_ms, duration_ms=end_ms - start_ms)
+            with span("slice"):
+                segment = full_audio[start_ms:end_ms]
             
             # Calculate duration in seconds
             duration_seconds = (end_ms - start_ms) / 1000.0
@@ -454,9 +806,40 @@ def process_conversation(audio_file):
             is_short = duration_seconds < 0.7  # Less than 700ms
             if is_short:
                 short_utterance_stats["total"] += 1
-                
-            # Test segment against database
-            speaker_name, confidence, embedding_id, embedding = test_voice_segment(segment, speaker_model)
+            
+            # Trim leading/trailing silence and long pauses before embedding
+            with span("trim"):
+                voiced_segment, speech_ratio = trim_to_voiced(full_audio, vad, start_ms, end_ms)
+            vad_stats["audio_ms_total"] += end_ms - start_ms
+            
+            if voiced_segment is None:
+                # Pure silence - skip the inference and the database query
+                print(f"  Skipping embedding - no voice activity (speech ratio: {speech_ratio:.2f})")
+                vad_stats["silent_utterances"] += 1
+                speaker_name, confidence, embedding_id, embedding = None, 0.0, None, None
+                lookup = None
+            elif i in cluster_assignments:
+                # Identity propagated from the utterance's cluster
+                vad_stats["audio_ms_embedded"] += len(voiced_segment)
+                embedding = precomputed_embeddings[i]
+                assignment = cluster_assignments[i]
+                speaker_name = assignment["speaker"]
+                confidence = assignment["confidence"]
+                embedding_id = assignment["embedding_id"]
+                utterance["cluster_identification"] = True
+                lookup = None  # Looked up as a cluster
+            elif i in precomputed_embeddings:
+                # Cluster outlier - look it up on its own
+                vad_stats["audio_ms_embedded"] += len(voiced_segment)
+                embedding = precomputed_embeddings[i]
+                lookup = lookup_embedding(embedding, is_short=len(voiced_segment) < 700)
+                speaker_name, confidence, embedding_id = lookup["speaker_name"], lookup["confidence"], lookup["embedding_id"]
+            else:
+                # Test segment against database (one query answers identification
+                # and the duplicate check)
+                vad_stats["audio_ms_embedded"] += len(voiced_segment)
+                lookup, embedding = lookup_voice_segment(voiced_segment, speaker_model)
+                speaker_name, confidence, embedding_id = lookup["speaker_name"], lookup["confidence"], lookup["embedding_id"]
             
             # Track identification of short utterances
             if is_short and speaker_name:
@@ -467,56 +850,69 @@ def process_conversation(audio_file):
             if not speaker_name:
                 # Create a unique ID for the unknown speaker within this conversation
                 original_speaker = utterance.get('speaker', f'speaker_{i}')  # This is usually 'speaker_0', 'speaker_1', etc.
+                if i in cluster_assignments:
+                    original_speaker = cluster_assignments[i]["cluster"]
                 speaker_name = f"Unknown_{original_speaker}"
                 db_update_stats["skipped_unknown"] += 1
+            elif i in cluster_assignments and not cluster_assignments[i]["representative"]:
+                # Only the most central member of a cluster is considered for the database
+                db_update_stats["skipped_clustered"] += 1
             else:
                 # Check if this utterance should be added to the database
                 if confidence >= AUTO_UPDATE_CONFIDENCE_THRESHOLD:
-                    # Check if very similar embedding already exists
-                    is_duplicate, duplicate_id = check_if_embedding_exists(embedding)
-                    
-                    if is_duplicate:
-                        print(f"  Skipping database update - very similar embedding already exists (ID: {duplicate_id})")
+                    # Cluster representatives were matched through their
+                    # centroid; their duplicate check happens in the enrollment queue
+                    if lookup is not None and lookup["is_duplicate"]:
+                        print(f"  Skipping database update - very similar embedding already exists (ID: {lookup['duplicate_id']})")
                         db_update_stats["skipped_duplicate"] += 1
                     else:
-                        # Add to database
+                        # Queue for the database (written and deduplicated in the background)
                         utterance_path = os.path.join(conversation_info["utterances_dir"], f"utterance_{i:03d}.wav")
-                        new_id = add_embedding_to_pinecone(
-                            embedding, 
-                            speaker_name, 
-                            utterance_path, 
-                            is_short=is_short,
-                            duration_seconds=duration_seconds
-                        )
-                        print(f"  🔄 Added high-quality utterance to database (ID: {new_id}, confidence: {confidence:.4f})")
-                        db_update_stats["added"] += 1
+                        with span("enqueue"):
+                            new_id = get_enrollment_queue(PROCESSED_DIR).enqueue(
+                                embedding_to_numpy(embedding), 
+                                speaker_name, 
+                                utterance_path, 
+                                is_short=is_short,
+                                duration_seconds=duration_seconds
+                            )
+                        print(f"  🔄 Queued high-quality utterance for the database (ID: {new_id}, confidence: {confidence:.4f})")
+                        queued_ids.append(new_id)
                 else:
                     print(f"  Skipping database update - confidence too low ({confidence:.4f} < {AUTO_UPDATE_CONFIDENCE_THRESHOLD})")
                     db_update_stats["skipped_low_confidence"] += 1
             
-            # Add speaker and confidence information to utterance
+            # Add speaker and confidence information to utterance (keeping the
+            # diarization label, which evaluate_identification.py replays)
+            utterance["diarization_speaker"] = utterance.get("speaker")
             utterance["speaker"] = speaker_name
             utterance["confidence"] = confidence
             utterance["embedding_id"] = embedding_id
             utterance["is_short"] = is_short
+            utterance["speech_ratio"] = speech_ratio
             
             # Save utterance using new structure
-            utterance_meta = save_utterance(segment, utterance, conversation_info, i)
+            utterance_meta = save_utterance(segment, utterance, conversation_info, i,
+                                            speaker_link="speakers" in output_views)
             utterance_metadata.append(utterance_meta)
+            conversation_embeddings.append(embedding)
+            with span("log"):
+                append_utterance(utterance_log_path, utterance_meta)
             
             # Also save using legacy method for backward compatibility
-            legacy_path = save_utterance_legacy(
-                segment, 
-                speaker_name, 
-                conversation_name, 
-                utterance["text"],
-                i
-            )
-            
-            # Track utterance
-            if speaker_name not in utterance_paths:
-                utterance_paths[speaker_name] = []
-            utterance_paths[speaker_name].append(legacy_path)
+            if "legacy_utterances" in output_views:
+                legacy_path = save_utterance_legacy(
+                    segment, 
+                    speaker_name, 
+                    conversation_name, 
+                    utterance["text"],
+                    i
+                )
+                
+                # Track utterance
+                if speaker_name not in utterance_paths:
+                    utterance_paths[speaker_name] = []
+                utterance_paths[speaker_name].append(legacy_path)
             
             # Update utterance for transcript
             identified_utterances.append(utterance)
@@ -526,14 +922,20 @@ def process_conversation(audio_file):
                 print(f"Utterance {i+1}/{len(transcript['utterances'])}: {speaker_name} - {utterance['text'][:50]}... (short)")
             else:
                 print(f"Utterance {i+1}/{len(transcript['utterances'])}: {speaker_name} - {utterance['text'][:50]}...")
+            utterance_span.end(speaker=speaker_name, confidence=round(confidence, 4))
         
         # Try to identify unknown speakers by combining their utterances
         if any(u["speaker"].startswith("Unknown_") for u in utterance_metadata):
             print("\nAttempting to identify unknown speakers by combining their utterances...")
             utterance_metadata = identify_unknown_speakers_by_combining(
-                utterance_metadata, conversation_info, full_audio, speaker_model
+                utterance_metadata, conversation_info, full_audio, speaker_model, vad=vad
             )
             
+            # Log the utterances whose speaker changed
+            for utterance in utterance_metadata:
+                if utterance.get("combined_identification"):
+                    append_utterance(utterance_log_path, utterance)
+            
             # Update the identified_utterances list to match the updated speaker assignments
             for i, utterance in enumerate(identified_utterances):
                 if i < len(utterance_metadata):  # Safety check
@@ -550,6 +952,26 @@ def process_conversation(audio_file):
                 if utterance.get("is_short", False) and utterance["speaker"].startswith("Unknown_"):
                     short_utterance_stats["unidentified"] += 1
         
+        # Keep the utterance embeddings so later steps need no inference
+        embeddings_info = save_conversation_embeddings(conversation_info["dir"], conversation_embeddings)
+        
+        # Count what the enrollment queue has written so far; the rest is
+        # filled in once it's written (see record_enrollment_outcomes)
+        skipped_before_queue = db_update_stats["skipped_duplicate"]
+        if queued_ids:
+            outcomes = get_enrollment_queue(PROCESSED_DIR).wait_for(queued_ids, timeout=0)
+            apply_enrollment_outcomes(db_update_stats, outcomes, skipped_before_queue)
+        
+        # Legacy transcript in the working directory (named after the
+        # conversation so concurrent jobs never share one)
+        legacy_transcript = None
+        if "legacy_transcript" in output_views:
+            legacy_transcript = f"transcript_{conversation_info['id'][len('conversation_'):]}.txt"
+        
+        # Compact the utterance log into metadata.json
+        records, _ = read_utterance_log(utterance_log_path)
+        utterance_metadata = compact_records(records)
+        
         # Create metadata.json
         speakers_list = list(set([u["speaker"] for u in utterance_metadata]))
         metadata = {
@@ -559,36 +981,64 @@ def process_conversation(audio_file):
             "duration_seconds": audio_duration,
             "speakers": speakers_list,
             "utterances": utterance_metadata,
+            "embeddings": embeddings_info,
             "short_utterance_stats": short_utterance_stats,
-            "database_update_stats": db_update_stats
+            "database_update_stats": db_update_stats,
+            "vad_stats": vad_stats,
+            "legacy_transcript": legacy_transcript,
+            "audio_name": conversation_name,
+            "output_profile": output_profile,
+            "generated_views": sorted(output_views),
+            "content_hash": content_hash,
+            "processing_config": processing_config(cluster)
         }
+        if cluster_stats is not None:
+            metadata["cluster_stats"] = cluster_stats
+        if profile:
+            metadata["trace_file"] = TRACE_FILENAME
         
         # Save metadata.json
         metadata_path = os.path.join(conversation_info["dir"], "metadata.json")
-        with open(metadata_path, "w") as f:
-            json.dump(metadata, f, indent=2)
+        with span("write_metadata"):
+            atomic_write_json(metadata_path, metadata)
+        
+        # The log is fully contained in metadata.json now
+        os.remove(utterance_log_path)
+        
+        # Register the conversation's speakers in the conversation index
+        with span("update_index"):
+            update_conversation(PROCESSED_DIR, conversation_info["id"], metadata)
         
         # Save transcript to the conversation directory
         transcript_path = os.path.join(conversation_info["dir"], "transcript.txt")
-        with open(transcript_path, "w") as f:
-            f.write(f"Conversation Transcript: {conversation_name}\n")
-            f.write("=====================\n\n")
-            for utterance in identified_utterances:
-                start_time = format_time(utterance["start"])
-                end_time = format_time(utterance["end"])
-                f.write(f"[{utterance['speaker']} {start_time}-{end_time}]: {utterance['text']}\n\n")
+        write_transcript(transcript_path, conversation_name, utterance_metadata)
         
         # Also save a legacy transcript (backward compatibility)
-        legacy_transcript = f"transcript_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-        with open(legacy_transcript, "w") as f:
-            f.write(f"Conversation Transcript: {conversation_name}\n")
-            f.write("=====================\n\n")
-            for utterance in identified_utterances:
-                f.write(f"{utterance['speaker']}: {utterance['text']}\n\n")
+        if legacy_transcript:
+            with open(legacy_transcript, "w") as f:
+                f.write(f"Conversation Transcript: {conversation_name}\n")
+                f.write("=====================\n\n")
+                for utterance in identified_utterances:
+                    f.write(f"{utterance['speaker']}: {utterance['text']}\n\n")
+        
+        if pack_segments:
+            with span("pack_segments"):
+                pack_summary = pack_conversation(conversation_info["dir"])
+            with open(metadata_path, "r") as f:
+                metadata = json.load(f)
+            print(f"\nPacked {pack_summary['segments']} utterances into one FLAC stream "
+                  f"({pack_summary['bytes_before'] / 1e6:.1f} MB -> {pack_summary['bytes_after'] / 1e6:.1f} MB)")
+        
+        # Report the remaining enrollments when the queue has written them
+        # (registered after the last metadata write of this run)
+        if db_update_stats["pending"]:
+            get_enrollment_queue(PROCESSED_DIR).when_done(
+                queued_ids, functools.partial(record_enrollment_outcomes, metadata_path, skipped_before_queue))
         
         print(f"\nConversation processed and saved to: {conversation_info['dir']}")
         print(f"Transcript saved to: {transcript_path}")
-        print(f"Legacy transcript saved to: {legacy_transcript}")
+        if legacy_transcript:
+            print(f"Legacy transcript saved to: {legacy_transcript}")
         
         # Print summary of saved utterances
         print("\nSaved utterances by speaker:")
@@ -606,29 +1056,62 @@ def process_conversation(audio_file):
         # Print database update stats
         print("\nDatabase update statistics:")
         print(f"  Added to database: {db_update_stats['added']} new utterances")
+        if db_update_stats["pending"]:
+            print(f"  Still queued for database: {db_update_stats['pending']} utterances "
+                  "(metadata.json is updated once they are written)")
+        if db_update_stats["failed"]:
+            print(f"  Failed to add to database: {db_update_stats['failed']} utterances")
         print(f"  Skipped (low confidence): {db_update_stats['skipped_low_confidence']} utterances")
         print(f"  Skipped (unknown speakers): {db_update_stats['skipped_unknown']} utterances")
         print(f"  Skipped (duplicates): {db_update_stats['skipped_duplicate']} utterances")
+        if cluster:
+            print(f"  Skipped (clustered): {db_update_stats['skipped_clustered']} utterances")
+        
+        # Print voice activity stats
+        print("\nVoice activity statistics:")
+        print(f"  Silent utterances skipped: {vad_stats['silent_utterances']}")
+        print(f"  Audio embedded: {vad_stats['audio_ms_embedded'] / 1000:.1f}s of {vad_stats['audio_ms_total'] / 1000:.1f}s")
             
         return conversation_info["dir"], metadata
             
     finally:
         # Clean up temporary WAV file if we created one
-        if wav_file.endswith('_temp.wav'):
+        if converted and wav_file.endswith('_temp.wav'):
             os.remove(wav_file)
             print(f"Cleaned up temporary file: {wav_file}")
+        
+        # Write the trace next to metadata.json (or into the processed folder if the run failed early)
+        run_span.end()
+        if tracer is not None:
+            trace_paths = stop_tracing(tracer, conversation_info["dir"] if conversation_info else PROCESSED_DIR)
+            print(f"Trace saved to: {trace_paths['trace']}")
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python speaker_id_testing.py <audio_file>")
-        sys.exit(1)
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Process a conversation and identify its speakers")
+    parser.add_argument("audio_file", help="Path to the conversation audio file")
+    parser.add_argument("--cluster", action="store_true",
+                        help="Cluster utterances and query the database once per voice")
+    parser.add_argument("--output-profile", choices=sorted(OUTPUT_PROFILES), default=DEFAULT_OUTPUT_PROFILE,
+                        help="full also writes the speakers/ links and legacy copies; minimal only the "
+                             "canonical output (views can be generated later with generate_views.py)")
+    parser.add_argument("--pack-segments", action="store_true", default=DEFAULT_PACK_SEGMENTS,
+                        help="Store the utterance audio as one FLAC stream with an offset index")
+    parser.add_argument("--profile", action="store_true",
+                        help="Write a Chrome trace of the run (trace.json next to metadata.json)")
+    parser.add_argument("--profile-sampler", choices=["pyinstrument", "cprofile"],
+                        help="Also record a sampling profile (implies --profile)")
+    args = parser.parse_args()
     
-    audio_file = sys.argv[1]
+    audio_file = args.audio_file
     if not os.path.exists(audio_file):
         print(f"Error: File {audio_file} does not exist")
         sys.exit(1)
     
-    process_conversation(audio_file)
+    process_conversation(audio_file, cluster=args.cluster, profile=args.profile or bool(args.profile_sampler),
+                         profile_sampler=args.profile_sampler, output_profile=args.output_profile,
+                         pack_segments=args.pack_segments)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,6 +1,6 @@
 import sys
 import os
-from pinecone import Pinecone
+from vector_store import get_vector_store
 from nemo.collections.asr.models import EncDecSpeakerLabelModel
 import torch
 import numpy as np
@@ -43,9 +43,8 @@ def test_match(audio_file, top_k=5):
     print("Generating voice embedding...")
     embedding = speaker_model.get_embedding(audio_file)
     
-    # Initialize Pinecone
-    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-    index = pc.Index("speaker-embeddings")
+    # Shared Pinecone client
+    index = get_vector_store()
     
     # Query the database
     print("\nQuerying speaker database...")
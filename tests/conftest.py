@@ -0,0 +1,61 @@
+import pytest
+
+class FakeIndex:
+    """
+    In-memory stand-in for a Pinecone index that enforces its request limits
+
+    Queries may return at most 1000 matches with values or metadata (10000
+    without), and list/fetch/delete take at most 100/1000/1000 IDs.
+    """
+
+    def __init__(self, vectors=()):
+        self.vectors = {}
+        self.requests = {"query": 0, "list": 0, "fetch": 0, "delete": 0, "upsert": 0}
+        self.upsert(vectors)
+
+    def upsert(self, vectors, **kwargs):
+        self.requests["upsert"] += 1
+        for vector_id, values, *metadata in vectors:
+            self.vectors[vector_id] = {"id": vector_id, "values": list(values),
+                                       "metadata": dict(metadata[0]) if metadata else {}}
+
+    def query(self, vector, top_k=10, include_values=False, include_metadata=False, filter=None, **kwargs):
+        self.requests["query"] += 1
+        if top_k > (1000 if include_values or include_metadata else 10000):
+            raise ValueError(f"top_k {top_k} exceeds the limit")
+        matches = []
+        for vector_id, stored in sorted(self.vectors.items()):
+            if filter and stored["metadata"].get("speaker_name") != filter["speaker_name"]["$eq"]:
+                continue
+            match = {"id": vector_id, "score": 0.0}
+            if include_values:
+                match["values"] = stored["values"]
+            if include_metadata:
+                match["metadata"] = stored["metadata"]
+            matches.append(match)
+        return {"matches": matches[:top_k]}
+
+    def list(self, limit=100, **kwargs):
+        if limit > 100:
+            raise ValueError(f"limit {limit} exceeds 100")
+        ids = sorted(self.vectors)
+        for start in range(0, len(ids), limit):
+            self.requests["list"] += 1
+            yield ids[start:start + limit]
+
+    def fetch(self, ids, **kwargs):
+        self.requests["fetch"] += 1
+        if len(ids) > 1000:
+            raise ValueError("Too many IDs")
+        return {"vectors": {i: self.vectors[i] for i in ids if i in self.vectors}}
+
+    def delete(self, ids=None, **kwargs):
+        self.requests["delete"] += 1
+        if len(ids) > 1000:
+            raise ValueError("Too many IDs")
+        for vector_id in ids:
+            self.vectors.pop(vector_id, None)
+
+@pytest.fixture
+def fake_index():
+    return FakeIndex
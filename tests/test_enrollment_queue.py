@@ -0,0 +1,84 @@
+import json
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+enrollment_queue = pytest.importorskip("enrollment_queue")
+
+from enrollment_queue import EnrollmentQueue, DEAD_LETTER_FILE
+
+class RequestError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+@pytest.fixture(autouse=True)
+def fast_flushes(monkeypatch):
+    monkeypatch.setattr(enrollment_queue, "FLUSH_INTERVAL_SECONDS", 0.01)
+
+@pytest.fixture
+def failing_index(fake_index):
+    class FailingIndex(fake_index):
+        """Rejects upserts containing a bad speaker; fails the first few with a 503"""
+
+        transient_failures = 0
+
+        def upsert(self, vectors, **kwargs):
+            if self.transient_failures:
+                self.transient_failures -= 1
+                raise RequestError(503)
+            if any(metadata["speaker_name"] == "Bad" for _, _, metadata in vectors):
+                raise RequestError(400)
+            super().upsert(vectors)
+    return FailingIndex()
+
+def enqueue(queue, names):
+    rng = np.random.default_rng(len(names))
+    return [queue.enqueue(rng.normal(size=192), name, "meeting.wav") for name in names]
+
+def test_permanent_failures_are_dead_lettered(tmp_path, failing_index):
+    queue = EnrollmentQueue(str(tmp_path), index=failing_index)
+    ids = enqueue(queue, ["Alice", "Bad", "Bob"])
+    queue.close()
+
+    assert queue.wait_for(ids, timeout=0) == {"added": 2, "duplicate": 0, "failed": 1, "pending": 0}
+    assert set(failing_index.vectors) == {ids[0], ids[2]}
+    with open(tmp_path / DEAD_LETTER_FILE) as f:
+        dead = [json.loads(line) for line in f]
+    assert [d["record"]["id"] for d in dead] == [ids[1]]
+    assert "400" in dead[0]["error"]
+
+    # The bad record no longer blocks later enrollments
+    queue = EnrollmentQueue(str(tmp_path), index=failing_index)
+    later = enqueue(queue, ["Carol"])
+    queue.close()
+    assert queue.wait_for(later, timeout=0)["added"] == 1
+
+def test_transient_failures_are_retried(tmp_path, failing_index):
+    failing_index.transient_failures = 2
+    queue = EnrollmentQueue(str(tmp_path), index=failing_index)
+    ids = enqueue(queue, ["Alice", "Bob"])
+    queue.close()
+
+    assert queue.wait_for(ids, timeout=0) == {"added": 2, "duplicate": 0, "failed": 0, "pending": 0}
+    assert not (tmp_path / DEAD_LETTER_FILE).exists()
+
+def test_when_done_reports_without_waiting(tmp_path, fake_index):
+    queue = EnrollmentQueue(str(tmp_path), index=fake_index())
+    ids = enqueue(queue, ["Alice", "Bob"])
+    reported = threading.Event()
+    counts = {}
+    def report(outcomes):
+        counts.update(outcomes)
+        reported.set()
+
+    queue.when_done(ids, report)
+    assert reported.wait(5)
+    assert counts == {"added": 2, "duplicate": 0, "failed": 0, "pending": 0}
+
+    # Already written: the callback runs right away
+    reported.clear()
+    queue.when_done(ids, report)
+    assert reported.is_set()
+    queue.close()
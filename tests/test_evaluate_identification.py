@@ -0,0 +1,30 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from evaluate_identification import equal_error_rate
+
+def test_separated_scores_have_no_errors():
+    assert equal_error_rate([0.9, 0.8, 0.85], [0.1, 0.2, 0.3]) == 0.0
+
+def test_one_overlapping_pair():
+    # At 0.65 one impostor is accepted and one genuine score rejected
+    assert equal_error_rate([0.6, 0.7, 0.8, 0.9], [0.1, 0.2, 0.3, 0.65]) == pytest.approx(0.25)
+
+def test_reversed_scores_are_always_wrong():
+    assert equal_error_rate([0.1, 0.2], [0.8, 0.9]) == 1.0
+
+def test_identical_distributions_are_at_chance():
+    rng = np.random.default_rng(0)
+    scores = rng.uniform(size=2000)
+    assert equal_error_rate(scores[:1000], scores[1000:]) == pytest.approx(0.5, abs=0.05)
+
+def test_independent_of_order_and_monotonic_rescaling():
+    genuine, impostor = [0.9, 0.55, 0.7, 0.4], [0.5, 0.1, 0.45, 0.6]
+    eer = equal_error_rate(genuine, impostor)
+    assert equal_error_rate(genuine[::-1], impostor[::-1]) == eer
+    assert equal_error_rate(np.exp(genuine), np.exp(impostor)) == eer
+
+def test_missing_scores_have_no_eer():
+    assert equal_error_rate([], [0.1]) is None
+    assert equal_error_rate([0.9], []) is None
@@ -0,0 +1,39 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from export_conversations import parse_date_bound, iter_export_records
+
+def test_plain_dates_and_end_of_day():
+    assert parse_date_bound("2025-01-01") == datetime(2025, 1, 1)
+    assert parse_date_bound("2025-01-01", end=True) == datetime(2025, 1, 2)
+    assert parse_date_bound("2025-01-01T12:30:00", end=True) == datetime(2025, 1, 1, 12, 30)
+    assert parse_date_bound("") is None
+
+@pytest.mark.parametrize("value", ["2025-01-01T00:00:00Z", "2025-01-01T09:00:00+09:00", "2024-12-31T19:00:00-05:00"])
+def test_bounds_with_a_timezone_become_naive_local_time(value):
+    bound = parse_date_bound(value)
+    expected = datetime(2025, 1, 1, tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+    assert bound.tzinfo is None
+    assert bound == expected
+
+def test_invalid_bounds_raise_value_error():
+    with pytest.raises(ValueError):
+        parse_date_bound("yesterday")
+
+def test_export_filters_with_timezone_bounds(tmp_path):
+    # The conversation index is built from the metadata on first use
+    (tmp_path / "conversation_1").mkdir()
+    (tmp_path / "conversation_1" / "metadata.json").write_text(json.dumps({
+        "conversation_id": "conversation_1",
+        "date_processed": datetime.now().isoformat(),
+        "utterances": [{"id": "utterance_000", "speaker": "Alice", "text": "hello", "confidence": 0.9}]
+    }))
+    hour_ago = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()
+    hour_ahead = (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat()
+
+    assert len(list(iter_export_records(str(tmp_path), date_from=parse_date_bound(hour_ago)))) == 1
+    assert list(iter_export_records(str(tmp_path), date_from=parse_date_bound(hour_ahead))) == []
+    assert list(iter_export_records(str(tmp_path), date_to=parse_date_bound(hour_ago))) == []
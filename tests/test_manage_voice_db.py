@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+manage_voice_db = pytest.importorskip("manage_voice_db")
+
+from manage_voice_db import compact_speaker, compact_voice_bank, find_speakers
+
+def speaker_vectors(name, count, rng, auto_enrolled=True):
+    vectors = rng.normal(size=(count, 192))
+    metadata = {"speaker_name": name}
+    if auto_enrolled:
+        metadata["is_short_utterance"] = False
+    return [(f"{name}_{i:05d}", v.tolist(), metadata) for i, v in enumerate(vectors)]
+
+@pytest.fixture
+def bank(fake_index):
+    rng = np.random.default_rng(0)
+    return fake_index(speaker_vectors("Alice", 2500, rng) + speaker_vectors("Bob", 30, rng)
+                      + speaker_vectors("Carol", 5, rng, auto_enrolled=False))
+
+def test_find_speakers_reads_past_the_query_limit(bank):
+    speakers = find_speakers(bank)
+
+    assert {name: len(ids) for name, ids in speakers.items()} == {"Alice": 2500, "Bob": 30, "Carol": 5}
+    assert bank.requests["query"] == 0
+
+def test_compaction_covers_the_whole_speaker(bank, tmp_path):
+    report = compact_speaker(bank, "Alice", max_exemplars=40, archive_dir=str(tmp_path))
+
+    assert report["before"] == 2500
+    assert report["after"] == 40
+    assert report["removed"] == 2460
+    assert len(find_speakers(bank)["Alice"]) == 40
+    with open(tmp_path / "Alice.jsonl") as f:
+        archived = [json.loads(line) for line in f]
+    assert len(archived) == 2460
+    assert {a["id"] for a in archived}.isdisjoint(bank.vectors)
+
+def test_dry_run_changes_nothing(bank):
+    report = compact_speaker(bank, "Alice", max_exemplars=40, archive_dir=None, dry_run=True)
+
+    assert report["removed"] == 2460
+    assert len(bank.vectors) == 2535
+    assert bank.requests["delete"] == 0
+
+def test_compact_voice_bank_only_touches_large_speakers(bank, tmp_path):
+    reports = compact_voice_bank(bank, max_exemplars=40, archive_dir=str(tmp_path))
+
+    assert [r["speaker"] for r in reports] == ["Alice"]
+    assert {name: len(ids) for name, ids in find_speakers(bank).items()} == {"Alice": 40, "Bob": 30, "Carol": 5}
+
+def test_manually_enrolled_embeddings_are_kept(bank):
+    report = compact_speaker(bank, "Carol", max_exemplars=2, archive_dir=None)
+
+    assert report["removed"] == 0
+    assert report["after"] == 5
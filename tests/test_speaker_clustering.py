@@ -0,0 +1,88 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from speaker_clustering import identify_clusters, CLUSTER_OUTLIER_THRESHOLD
+
+DIM = 16
+rng = np.random.default_rng(0)
+
+def direction(axis, noise=0.05):
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[axis] = 1.0
+    return vector + rng.normal(0, noise, DIM).astype(np.float32)
+
+def utterance(label, seconds, start=0):
+    return {"speaker": label, "start": start, "end": start + int(seconds * 1000)}
+
+class Bank:
+    """Matches a vector to the closest of a few known voices and records the lookups"""
+
+    def __init__(self, voices):
+        self.voices = {name: v / np.linalg.norm(v) for name, v in voices.items()}
+        self.lookups = []
+
+    def __call__(self, vector, threshold):
+        self.lookups.append(threshold)
+        name, score = max(((n, float(vector @ v)) for n, v in self.voices.items()), key=lambda x: x[1])
+        if score < threshold:
+            return None, score, None
+        return name, score, f"{name}_0"
+
+def scenario():
+    utterances = [utterance("A", 2) for _ in range(4)]       # 0-3: Alice
+    utterances += [utterance("B", 2) for _ in range(4)]      # 4-7: Bob
+    utterances.append(utterance("A", 2))                     # 8: Bob, mislabeled by diarization
+    utterances.append(utterance("A", 3))                     # 9: a third voice (long)
+    utterances.append(utterance("A", 0.5))                   # 10: a third voice (short)
+    utterances.append(utterance("B", 1))                     # 11: silent
+    embeddings = [direction(0) for _ in range(4)] + [direction(1) for _ in range(4)]
+    embeddings += [direction(1), direction(2), direction(2), None]
+    return utterances, embeddings
+
+def test_clusters_are_looked_up_once_and_propagated():
+    utterances, embeddings = scenario()
+    bank = Bank({"Alice": np.eye(DIM)[0], "Bob": np.eye(DIM)[1]})
+
+    assignments, stats = identify_clusters(utterances, embeddings, bank, confidence_threshold=0.4, verbose=False)
+
+    assert bank.lookups == [0.4, 0.4]
+    assert stats == {"clusters": 2, "bank_lookups": 3, "outliers": 1}
+    assert all(assignments[i]["speaker"] == "Alice" for i in range(4))
+    assert all(assignments[i]["speaker"] == "Bob" for i in range(4, 8))
+    assert sum(a["representative"] for a in assignments.values()) == 2
+
+def test_mislabeled_utterances_move_to_the_closer_cluster():
+    utterances, embeddings = scenario()
+    assignments, _ = identify_clusters(utterances, embeddings, Bank({"Alice": np.eye(DIM)[0],
+                                                                    "Bob": np.eye(DIM)[1]}), verbose=False)
+
+    assert assignments[8]["speaker"] == "Bob"
+    assert assignments[8]["cluster"] == "B"
+    assert assignments[8]["cluster_similarity"] > CLUSTER_OUTLIER_THRESHOLD
+
+def test_long_outliers_are_left_for_a_lookup_and_short_ones_inherit():
+    utterances, embeddings = scenario()
+    assignments, _ = identify_clusters(utterances, embeddings, Bank({"Alice": np.eye(DIM)[0],
+                                                                    "Bob": np.eye(DIM)[1]}), verbose=False)
+
+    assert 9 not in assignments
+    assert assignments[10]["speaker"] == "Alice"
+    assert assignments[10]["cluster_similarity"] < CLUSTER_OUTLIER_THRESHOLD
+    assert 11 not in assignments
+
+def test_unmatched_clusters_have_no_speaker():
+    utterances, embeddings = scenario()
+    assignments, stats = identify_clusters(utterances, embeddings, Bank({"Carol": np.eye(DIM)[3]}),
+                                           verbose=False)
+
+    assert stats["clusters"] == 2
+    assert {a["speaker"] for a in assignments.values()} == {None}
+
+def test_no_embeddings_means_no_lookups():
+    bank = Bank({"Alice": np.eye(DIM)[0]})
+    assignments, stats = identify_clusters([utterance("A", 1)], [None], bank, verbose=False)
+
+    assert assignments == {}
+    assert stats == {"clusters": 0, "bank_lookups": 0, "outliers": 0}
+    assert bank.lookups == []
@@ -0,0 +1,63 @@
+import pytest
+
+from transcript_search import build_match_query, index_conversations, search_utterances
+
+UTTERANCES = [
+    "The budget review is near the end",
+    "Let's talk budgeting OR not: the \"final\" numbers",
+    "NEAR(term) and other syntax-looking text*",
+    "Completely unrelated small talk",
+]
+
+@pytest.fixture
+def processed_dir(tmp_path):
+    index_conversations(str(tmp_path), {
+        "conversation_1": {
+            "date_processed": "2026-01-01T10:00:00",
+            "utterances": [
+                {"id": f"utterance_{i:03d}", "speaker": "Alice" if i % 2 == 0 else "Bob",
+                 "start_ms": i * 1000, "end_ms": (i + 1) * 1000, "confidence": 0.9, "text": text}
+                for i, text in enumerate(UTTERANCES)
+            ]
+        }
+    })
+    return str(tmp_path)
+
+def ids(results):
+    return [r["utterance_id"] for r in results]
+
+@pytest.mark.parametrize("query, expected", [
+    ("budget review", '"budget" "review"'),
+    ("budg*", '"budg"*'),
+    ('say "hi', '"say" """hi"'),
+    ("NEAR(a b)", '"NEAR(a" "b)"'),
+    ("* ** ", ""),
+    ("a\0b", '"a" "b"'),
+])
+def test_build_match_query_quotes_every_word(query, expected):
+    assert build_match_query(query) == expected
+
+@pytest.mark.parametrize("query", [
+    '"', '"budget', 'budget"', '""*', 'a"b', "NEAR(budget review)", "budget NEAR review", "NEAR/3",
+    "AND", "OR", "NOT budget", "(", ")", "^budget", "+budget", "-", "text:budget", "{text}: budget",
+    "*", "!!*", ".*", "budget\0", "bud\0get", "​", "x" * 5000,
+])
+def test_hostile_queries_never_reach_fts5_as_syntax(processed_dir, query):
+    # Must not raise sqlite3.OperationalError
+    search_utterances(query, processed_dir)
+
+def test_operators_are_searched_as_words(processed_dir):
+    assert ids(search_utterances("OR", processed_dir)) == ["utterance_001"]
+    assert ids(search_utterances("NEAR(term)", processed_dir)) == ["utterance_002"]
+    assert ids(search_utterances('"final', processed_dir)) == ["utterance_001"]
+
+def test_every_word_must_match_and_prefixes_work(processed_dir):
+    assert ids(search_utterances("budget review", processed_dir)) == ["utterance_000"]
+    assert set(ids(search_utterances("budg*", processed_dir))) == {"utterance_000", "utterance_001"}
+    assert search_utterances("budget unrelated", processed_dir) == []
+
+def test_filters_and_snippets(processed_dir):
+    results = search_utterances("talk", processed_dir, speakers=["Bob"])
+    assert set(ids(results)) == {"utterance_001", "utterance_003"}
+    assert all("<mark>" in r["snippet"] for r in results)
+    assert ids(search_utterances("talk", processed_dir, start_ms=2000)) == ["utterance_003"]
@@ -0,0 +1,29 @@
+import json
+import os
+
+from utterance_log import UTTERANCE_LOG_FILE, append_utterance, recover_conversation
+
+def utterance(utterance_id, speaker, start_ms, end_ms):
+    return {"id": utterance_id, "speaker": speaker, "start_ms": start_ms, "end_ms": end_ms, "text": ""}
+
+def test_recover_conversation_writes_partial_metadata(tmp_path):
+    log_path = str(tmp_path / UTTERANCE_LOG_FILE)
+    append_utterance(log_path, utterance("utterance_000", "Unknown_A", 0, 1500))
+    append_utterance(log_path, utterance("utterance_001", "Bob", 1500, 4000))
+    append_utterance(log_path, utterance("utterance_000", "Alice", 0, 1500))
+    (tmp_path / "original_audio.wav").write_bytes(b"")
+
+    metadata = recover_conversation(str(tmp_path))
+
+    with open(tmp_path / "metadata.json") as f:
+        assert json.load(f) == metadata
+    assert metadata["partial"] is True
+    assert metadata["original_audio"] == "original_audio.wav"
+    assert metadata["duration_seconds"] == 4.0
+    assert [u["speaker"] for u in metadata["utterances"]] == ["Alice", "Bob"]
+    # Written atomically: no temporary files left behind
+    assert sorted(os.listdir(tmp_path)) == ["metadata.json", "original_audio.wav", UTTERANCE_LOG_FILE]
+
+def test_recover_conversation_without_log_entries(tmp_path):
+    assert recover_conversation(str(tmp_path)) is None
+    assert not (tmp_path / "metadata.json").exists()
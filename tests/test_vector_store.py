@@ -0,0 +1,57 @@
+import pytest
+
+vector_store = pytest.importorskip("vector_store")
+
+class RequestError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+@pytest.fixture
+def store(monkeypatch, fake_index):
+    class RejectingIndex(fake_index):
+        """Rejects any upsert containing a vector without values"""
+
+        def upsert(self, vectors, **kwargs):
+            if any(not values for _, values, *_ in vectors):
+                raise RequestError(400)
+            super().upsert(vectors)
+
+    index = RejectingIndex()
+    class FakeClient:
+        def __init__(self, **kwargs):
+            pass
+
+        def Index(self, name, **kwargs):
+            return index
+
+    monkeypatch.setattr(vector_store, "Pinecone", FakeClient)
+    return vector_store.VectorStore()
+
+def test_bad_vector_only_fails_its_own_upsert(store):
+    # Upserts from two jobs land in the same batch
+    good = store.upsert([("a", [1.0]), ("b", [2.0])], wait=False)
+    bad = store.upsert([("c", [])], wait=False)
+    store.flush()
+
+    assert good.result(timeout=5) == 2
+    with pytest.raises(RequestError):
+        bad.result(timeout=5)
+    assert set(store.index.vectors) == {"a", "b"}
+    assert store.stats["batches_split"] == 1
+    assert store.stats["vectors_upserted"] == 2
+
+def test_transient_errors_are_not_split(store, monkeypatch):
+    monkeypatch.setattr(vector_store, "MAX_RETRIES", 0)
+    def unavailable(**kwargs):
+        raise RequestError(503)
+    store.index.upsert = unavailable
+
+    futures = [store.upsert([(name, [1.0])], wait=False) for name in "ab"]
+    store.flush()
+
+    for future in futures:
+        with pytest.raises(RequestError):
+            future.result(timeout=5)
+    assert store.stats["batches_split"] == 0
+    assert store.stats["requests"] == 1
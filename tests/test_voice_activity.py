@@ -0,0 +1,71 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pydub = pytest.importorskip("pydub")
+
+from voice_activity import compute_voice_activity, get_voiced_regions
+
+FRAME_RATE = 16000
+FRAME_MS = 30
+FRAME_LEN = FRAME_RATE * FRAME_MS // 1000
+
+def make_audio(layout, tone_dbfs=-15.0, noise_dbfs=-70.0):
+    """Audio of whole VAD frames: ("tone" | "noise", number of frames) runs"""
+    rng = np.random.default_rng(0)
+    t = np.arange(FRAME_LEN) / FRAME_RATE
+    chunks = []
+    for kind, frames in layout:
+        if kind == "tone":
+            # Sine RMS is amplitude / sqrt(2)
+            amplitude = 10 ** (tone_dbfs / 20) * np.sqrt(2)
+            chunk = np.tile(amplitude * np.sin(2 * np.pi * 440 * t), frames)
+        else:
+            chunk = rng.normal(0, 10 ** (noise_dbfs / 20), frames * FRAME_LEN)
+        chunks.append(chunk)
+    samples = (np.concatenate(chunks) * 32767).astype(np.int16)
+    return pydub.AudioSegment(samples.tobytes(), frame_rate=FRAME_RATE, sample_width=2, channels=1)
+
+def expected_mask(layout, voiced_kinds=("tone",)):
+    return np.concatenate([np.full(frames, kind in voiced_kinds) for kind, frames in layout])
+
+def test_tone_frames_are_voiced_and_noise_is_not():
+    layout = [("noise", 10), ("tone", 8), ("noise", 12), ("tone", 5), ("noise", 10)]
+    vad = compute_voice_activity(make_audio(layout), frame_ms=FRAME_MS, max_pause_ms=0)
+
+    assert vad["frame_ms"] == FRAME_MS
+    np.testing.assert_array_equal(vad["voiced"], expected_mask(layout))
+
+def test_short_pauses_are_bridged_and_long_ones_are_not():
+    # 5 frames (150 ms) and 15 frames (450 ms) against a 300 ms limit
+    layout = [("noise", 10), ("tone", 8), ("noise", 5), ("tone", 8), ("noise", 15), ("tone", 8), ("noise", 10)]
+    vad = compute_voice_activity(make_audio(layout), frame_ms=FRAME_MS, max_pause_ms=300)
+
+    expected = expected_mask(layout)
+    expected[18:23] = True
+    np.testing.assert_array_equal(vad["voiced"], expected)
+
+def test_frames_below_the_absolute_floor_are_silent():
+    # Well above the noise floor, but quieter than the -55 dBFS minimum
+    layout = [("noise", 20), ("tone", 10), ("noise", 20)]
+    audio = make_audio(layout, tone_dbfs=-60.0, noise_dbfs=-90.0)
+    vad = compute_voice_activity(audio, frame_ms=FRAME_MS, max_pause_ms=0)
+
+    assert not vad["voiced"].any()
+    assert compute_voice_activity(audio, frame_ms=FRAME_MS, max_pause_ms=0,
+                                  min_energy_dbfs=-70.0)["voiced"].sum() == 10
+
+def test_audio_shorter_than_a_frame_has_no_frames():
+    audio = pydub.AudioSegment.silent(duration=FRAME_MS // 2, frame_rate=FRAME_RATE)
+    assert compute_voice_activity(audio, frame_ms=FRAME_MS)["voiced"].size == 0
+
+def test_voiced_regions_are_padded_and_clipped_to_the_utterance():
+    voiced = np.zeros(20, dtype=bool)
+    voiced[5:10] = True
+    vad = {"frame_ms": FRAME_MS, "voiced": voiced}
+
+    regions, speech_ratio = get_voiced_regions(vad, 0, 20 * FRAME_MS, padding_ms=60)
+    assert regions == [(5 * FRAME_MS - 60, 10 * FRAME_MS + 60)]
+    assert speech_ratio == pytest.approx(0.25)
+
+    regions, _ = get_voiced_regions(vad, 6 * FRAME_MS, 8 * FRAME_MS, padding_ms=60)
+    assert regions == [(6 * FRAME_MS, 8 * FRAME_MS)]
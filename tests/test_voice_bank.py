@@ -0,0 +1,124 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from voice_bank import LocalVoiceBank, quantize, EMBEDDING_DIM
+
+rng = np.random.default_rng(0)
+
+def random_unit_vectors(count, dim=EMBEDDING_DIM):
+    vectors = rng.normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def make_bank(vectors, speakers=("Alice", "Bob", "Carol")):
+    bank = LocalVoiceBank(capacity=16)  # Small, so upserts have to grow the arrays
+    bank.upsert([
+        (f"v{i}", vector.tolist(), {"speaker_name": speakers[i % len(speakers)], "source_file": f"f{i}.wav"})
+        for i, vector in enumerate(vectors)
+    ])
+    return bank
+
+def test_quantize_round_trip_is_within_half_a_step():
+    vectors = random_unit_vectors(100)
+    codes, scales = quantize(vectors)
+
+    assert codes.dtype == np.int8 and scales.dtype == np.float32
+    assert np.abs(codes).max(axis=1).min() == 127  # Every vector uses the full range
+    error = np.abs(codes * scales[:, None] - vectors)
+    assert (error <= scales[:, None] / 2 + 1e-7).all()
+
+def test_quantized_dot_products_stay_close():
+    vectors = random_unit_vectors(200)
+    query = random_unit_vectors(1)[0]
+    codes, scales = quantize(vectors)
+
+    approximate = (codes @ query) * scales
+    assert np.abs(approximate - vectors @ query).max() < 0.01
+
+def test_rescored_query_recalls_the_exact_top_k():
+    vectors = random_unit_vectors(3000)
+    bank = make_bank(vectors)
+
+    recalled = 0
+    queries = random_unit_vectors(20)
+    for query in queries:
+        exact = np.argsort(-(vectors @ query))[:10]
+        matches = bank.query(query.tolist(), top_k=10)["matches"]
+        recalled += len({f"v{i}" for i in exact} & {m["id"] for m in matches})
+        # Scores come from the float32 rescoring, not the int8 scan
+        for match in matches:
+            assert match["score"] == pytest.approx(float(vectors[int(match["id"][1:])] @ query), abs=1e-5)
+    assert recalled / (10 * len(queries)) >= 0.99
+
+def test_a_stored_vector_is_its_own_best_match():
+    vectors = random_unit_vectors(500)
+    bank = make_bank(vectors)
+
+    match = bank.query((vectors[42] * 3).tolist(), top_k=1, include_metadata=True, include_values=True)["matches"][0]
+    assert match["id"] == "v42"
+    assert match["score"] == pytest.approx(1.0, abs=1e-5)
+    assert match["metadata"]["speaker_name"] == "Alice"
+    np.testing.assert_allclose(match["values"], vectors[42], atol=1e-6)
+
+def test_filters_upserts_and_deletes():
+    vectors = random_unit_vectors(30)
+    bank = make_bank(vectors)
+
+    alice = bank.query(vectors[0].tolist(), top_k=100, filter={"speaker_name": {"$eq": "Alice"}})["matches"]
+    assert len(alice) == 10
+    others = bank.query(vectors[0].tolist(), top_k=100, filter={"speaker_name": {"$nin": ["Alice", "Dave"]}})
+    assert len(others["matches"]) == 20
+
+    bank.delete(ids=["v0"])
+    bank.upsert([("v1", vectors[1].tolist(), {"speaker_name": "Dave", "verified": True})])
+    assert len(bank) == 29
+    assert "v0" not in {m["id"] for m in bank.query(vectors[0].tolist(), top_k=100)["matches"]}
+    assert bank.fetch(["v1"])["vectors"]["v1"]["metadata"]["verified"] is True
+
+    with pytest.raises(ValueError):
+        bank.query(vectors[0].tolist(), filter={"duration_seconds": {"$gt": 1.0}})
+    with pytest.raises(ValueError):
+        bank.query(vectors[0].tolist(), filter={"speaker_name": {"$gt": "A"}})
+
+@pytest.mark.parametrize("filter, expected", [
+    ({"speaker_name": "Bob"}, {"v1", "v4"}),
+    ({"speaker_name": {"$ne": "Alice"}}, {"v1", "v2", "v4", "v5"}),
+    ({"speaker_name": {"$in": ["Alice", "Carol", "Dave"]}}, {"v0", "v2", "v3", "v5"}),
+    ({"speaker_name": {"$nin": ["Alice", "Carol"]}}, {"v1", "v4"}),
+    ({"source_file": {"$in": ["f1.wav", "f3.wav"]}}, {"v1", "v3"}),
+    ({"speaker_name": {"$ne": "Alice"}, "source_file": {"$ne": "f1.wav"}}, {"v2", "v4", "v5"}),
+    ({"is_short_utterance": True}, set()),
+])
+def test_filter_operators(filter, expected):
+    vectors = random_unit_vectors(6)
+    bank = make_bank(vectors)
+
+    matches = bank.query(vectors[0].tolist(), top_k=10, filter=filter)["matches"]
+    assert {m["id"] for m in matches} == expected
+
+def test_from_index_copies_more_than_one_query_page(fake_index):
+    vectors = random_unit_vectors(2500)
+    index = fake_index([(f"v{i}", v.tolist(), {"speaker_name": f"S{i % 7}", "verified": i == 3})
+                        for i, v in enumerate(vectors)])
+
+    bank = LocalVoiceBank.from_index(index)
+
+    assert len(bank) == 2500
+    assert index.requests["query"] == 0
+    assert bank.fetch(["v3"])["vectors"]["v3"]["metadata"]["verified"] is True
+    match = bank.query(vectors[2400].tolist(), top_k=1, include_metadata=True)["matches"][0]
+    assert match["id"] == "v2400" and match["metadata"]["speaker_name"] == "S6"
+
+def test_snapshot_round_trip(tmp_path):
+    vectors = random_unit_vectors(50)
+    bank = make_bank(vectors)
+    bank.upsert([("v7", vectors[7].tolist(), {"speaker_name": "Bob", "original_speaker_name": "Unknown_A"})])
+    bank.delete(ids=["v3"])
+    bank.save(str(tmp_path))
+
+    loaded = LocalVoiceBank.load(str(tmp_path))
+    assert len(loaded) == 49
+    assert loaded.fetch(["v7"])["vectors"]["v7"]["metadata"]["original_speaker_name"] == "Unknown_A"
+    query = vectors[11].tolist()
+    assert [m["id"] for m in loaded.query(query, top_k=5)["matches"]] == \
+        [m["id"] for m in bank.query(query, top_k=5)["matches"]]
@@ -0,0 +1,70 @@
+import json
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+voice_search = pytest.importorskip("voice_search")
+
+from conversation_index import update_conversation
+from speaker_id_testing import EMBEDDING_DIM, save_conversation_embeddings
+
+def add_conversation(processed_dir, conversation_id, vectors):
+    conversation_dir = os.path.join(processed_dir, conversation_id)
+    os.makedirs(conversation_dir)
+    metadata = {
+        "conversation_id": conversation_id,
+        "speakers": ["Alice"],
+        "utterances": [{"id": f"utterance_{i:03d}", "speaker": "Alice", "text": "", "start_ms": 0, "end_ms": 1000}
+                       for i in range(len(vectors))],
+        "embeddings": save_conversation_embeddings(conversation_dir, list(vectors))
+    }
+    with open(os.path.join(conversation_dir, "metadata.json"), "w") as f:
+        json.dump(metadata, f)
+    update_conversation(processed_dir, conversation_id, metadata)
+
+def read_manifest(processed_dir):
+    with open(os.path.join(processed_dir, voice_search.VOICE_INDEX_DIR, voice_search.MANIFEST_FILE)) as f:
+        return json.load(f)
+
+@pytest.fixture
+def archive(tmp_path):
+    rng = np.random.default_rng(0)
+    add_conversation(str(tmp_path), "conversation_a", rng.normal(size=(8, EMBEDDING_DIM)))
+    add_conversation(str(tmp_path), "conversation_b", rng.normal(size=(8, EMBEDDING_DIM)))
+    voice_search.sync_voice_index(str(tmp_path))
+    return str(tmp_path)
+
+def test_rebuild_keeps_replaced_files_for_readers(archive, monkeypatch):
+    index_dir = os.path.join(archive, voice_search.VOICE_INDEX_DIR)
+    old_segments = read_manifest(archive)["segments"]
+
+    voice_search.rebuild_voice_index(archive)
+    voice_search.rebuild_voice_index(archive)
+
+    manifest = read_manifest(archive)
+    assert manifest["centroids"] == "centroids_000001.npy"
+    assert os.path.exists(os.path.join(index_dir, manifest["centroids"]))
+    retired = [entry["file"] for entry in manifest["retired"]]
+    assert set(old_segments) < set(retired) and "centroids_000000.npy" in retired
+    assert all(os.path.exists(os.path.join(index_dir, name)) for name in retired)
+
+    # Deleted by a later sync once the grace period is over
+    monkeypatch.setattr(voice_search, "RETIRED_FILE_GRACE_SECONDS", 0)
+    voice_search.sync_voice_index(archive)
+    assert read_manifest(archive)["retired"] == []
+    assert not any(os.path.exists(os.path.join(index_dir, name)) for name in retired)
+    assert voice_search.sync_voice_index(archive)["rows"] == 16
+
+def test_search_by_clip_uses_the_existing_index(archive, monkeypatch):
+    query = np.random.default_rng(1).normal(size=EMBEDDING_DIM)
+    add_conversation(archive, "conversation_c", [query])
+    monkeypatch.setattr(voice_search, "get_segment_embedding", lambda audio, model: query)
+
+    results = voice_search.search_by_clip(None, archive, top_k=1, speaker_model=object())
+    assert results[0]["conversation_id"] != "conversation_c"
+
+    voice_search.sync_voice_index(archive)
+    results = voice_search.search_by_clip(None, archive, top_k=1, speaker_model=object())
+    assert results[0]["conversation_id"] == "conversation_c"
+    assert results[0]["similarity"] == pytest.approx(1.0, abs=1e-3)
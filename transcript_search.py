@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Full-text search over the utterances of processed conversations.
+
+Utterances are kept in an SQLite database (search.db in the processed
+conversations folder) with an FTS5 index over their text. The database is
+updated whenever the conversation index is, so processed, renamed,
+re-identified and deleted conversations are searchable right away. It is
+rebuilt from the metadata.json files when missing, or with:
+
+    python transcript_search.py --rebuild
+
+Search from the command line with:
+
+    python transcript_search.py "budget review" --speaker "John Doe"
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import threading
+
+SEARCH_DB_FILENAME = "search.db"
+
+# Same folder as speaker_id_testing.PROCESSED_DIR (not imported to avoid loading the model stack)
+PROCESSED_DIR = "processed_conversations"
+
+DEFAULT_LIMIT = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    conversation_id TEXT PRIMARY KEY,
+    date_processed TEXT
+);
+CREATE TABLE IF NOT EXISTS utterances (
+    rowid INTEGER PRIMARY KEY,
+    conversation_id TEXT NOT NULL,
+    utterance_id TEXT NOT NULL,
+    speaker TEXT,
+    start_ms INTEGER,
+    end_ms INTEGER,
+    confidence REAL,
+    text TEXT
+);
+CREATE INDEX IF NOT EXISTS utterances_conversation ON utterances(conversation_id);
+CREATE INDEX IF NOT EXISTS utterances_speaker ON utterances(speaker);
+CREATE VIRTUAL TABLE IF NOT EXISTS utterance_fts USING fts5(
+    text, content='utterances', content_rowid='rowid', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS utterances_ai AFTER INSERT ON utterances BEGIN
+    INSERT INTO utterance_fts(rowid, text) VALUES (new.rowid, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS utterances_ad AFTER DELETE ON utterances BEGIN
+    INSERT INTO utterance_fts(utterance_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+END;
+"""
+
+# Serializes full rebuilds from concurrent jobs in this process
+_rebuild_lock = threading.Lock()
+
+def search_db_path(processed_dir):
+    """Path of the search database"""
+    return os.path.join(processed_dir, SEARCH_DB_FILENAME)
+
+def _connect(processed_dir):
+    """Open the search database, building it from the archive if it is missing"""
+    db_path = search_db_path(processed_dir)
+    created = not os.path.exists(db_path)
+
+    os.makedirs(processed_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+
+    if created:
+        _index_archive(conn, processed_dir)
+    return conn
+
+def _write_conversation(conn, conversation_id, metadata):
+    """Replace the rows of one conversation (caller commits)"""
+    conn.execute("DELETE FROM utterances WHERE conversation_id = ?", (conversation_id,))
+    conn.execute(
+        "INSERT OR REPLACE INTO conversations (conversation_id, date_processed) VALUES (?, ?)",
+        (conversation_id, metadata.get("date_processed"))
+    )
+    conn.executemany(
+        "INSERT INTO utterances (conversation_id, utterance_id, speaker, start_ms, end_ms, confidence, text) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (conversation_id, u["id"], u.get("speaker"), u.get("start_ms", 0), u.get("end_ms", 0),
+             u.get("confidence", 0.0), u.get("text", ""))
+            for u in metadata.get("utterances", [])
+        ]
+    )
+
+def _index_archive(conn, processed_dir):
+    """Index every conversation with a metadata.json"""
+    with _rebuild_lock:
+        count = 0
+        for conversation_id in sorted(os.listdir(processed_dir)):
+            metadata_path = os.path.join(processed_dir, conversation_id, "metadata.json")
+            if not os.path.exists(metadata_path):
+                continue
+            try:
+                with open(metadata_path, 'r') as f:
+                    metadata = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Skipping {conversation_id} in search index: {e}")
+                continue
+            _write_conversation(conn, conversation_id, metadata)
+            count += 1
+        conn.commit()
+        return count
+
+def rebuild_search_index(processed_dir=PROCESSED_DIR):
+    """
+    Rebuild the search database from scratch
+
+    Returns:
+        int: Number of conversations indexed
+    """
+    db_path = search_db_path(processed_dir)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    conn = _connect(processed_dir)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+    finally:
+        conn.close()
+
+def index_conversation(processed_dir, conversation_id, metadata):
+    """Add or refresh the utterances of a conversation in the search database"""
+    index_conversations(processed_dir, {conversation_id: metadata})
+
+def index_conversations(processed_dir, metadata_by_id):
+    """Add or refresh the utterances of several conversations in one transaction"""
+    conn = _connect(processed_dir)
+    try:
+        for conversation_id, metadata in metadata_by_id.items():
+            _write_conversation(conn, conversation_id, metadata)
+        conn.commit()
+    finally:
+        conn.close()
+
+def remove_conversation_from_search(processed_dir, conversation_id):
+    """Remove a conversation from the search database"""
+    conn = _connect(processed_dir)
+    try:
+        conn.execute("DELETE FROM utterances WHERE conversation_id = ?", (conversation_id,))
+        conn.execute("DELETE FROM conversations WHERE conversation_id = ?", (conversation_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+def build_match_query(query):
+    """
+    Turn free text into an FTS5 query
+
+    Every word must match. Words are quoted so punctuation in user input is
+    never parsed as query syntax, and a trailing * keeps prefix matching.
+    NUL characters end the query string inside SQLite, so they separate
+    words instead.
+    """
+    terms = []
+    for word in query.replace("\0", " ").split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+def search_utterances(query, processed_dir=PROCESSED_DIR, speakers=None, conversation_ids=None,
+                      date_from=None, date_to=None, start_ms=None, end_ms=None,
+                      limit=DEFAULT_LIMIT, offset=0):
+    """
+    Search utterance text, best matches first
+
+    Args:
+        query: Words to search for
+        processed_dir: Path to the processed conversations folder
+        speakers: Only utterances by these speakers
+        conversation_ids: Only utterances in these conversations
+        date_from: Only conversations processed at or after this datetime
+        date_to: Only conversations processed before this datetime
+        start_ms: Only utterances starting at or after this time in the conversation
+        end_ms: Only utterances ending at or before this time in the conversation
+        limit: Maximum number of results
+        offset: Number of results to skip
+
+    Returns:
+        list: Matching utterances with their conversation, timestamps and a highlighted snippet
+    """
+    match_query = build_match_query(query)
+    if not match_query:
+        return []
+
+    sql = [
+        "SELECT u.conversation_id, u.utterance_id, u.speaker, u.start_ms, u.end_ms, u.confidence, u.text,",
+        "       snippet(utterance_fts, 0, '<mark>', '</mark>', '...', 16) AS snippet,",
+        "       bm25(utterance_fts) AS score",
+        "FROM utterance_fts",
+        "JOIN utterances u ON u.rowid = utterance_fts.rowid",
+        "JOIN conversations c ON c.conversation_id = u.conversation_id",
+        "WHERE utterance_fts MATCH ?"
+    ]
+    params = [match_query]
+
+    if speakers:
+        sql.append(f"AND u.speaker IN ({', '.join('?' * len(speakers))})")
+        params.extend(speakers)
+    if conversation_ids:
+        sql.append(f"AND u.conversation_id IN ({', '.join('?' * len(conversation_ids))})")
+        params.extend(conversation_ids)
+    if date_from is not None:
+        sql.append("AND c.date_processed >= ?")
+        params.append(date_from.isoformat())
+    if date_to is not None:
+        sql.append("AND c.date_processed < ?")
+        params.append(date_to.isoformat())
+    if start_ms is not None:
+        sql.append("AND u.start_ms >= ?")
+        params.append(start_ms)
+    if end_ms is not None:
+        sql.append("AND u.end_ms <= ?")
+        params.append(end_ms)
+
+    sql.append("ORDER BY score LIMIT ? OFFSET ?")
+    params.extend([limit, offset])
+
+    conn = _connect(processed_dir)
+    try:
+        rows = conn.execute("\n".join(sql), params).fetchall()
+    finally:
+        conn.close()
+
+    return [
+        {
+            "conversation_id": row["conversation_id"],
+            "utterance_id": row["utterance_id"],
+            "speaker": row["speaker"],
+            "start_ms": row["start_ms"],
+            "end_ms": row["end_ms"],
+            "confidence": row["confidence"],
+            "text": row["text"],
+            "snippet": row["snippet"],
+            # bm25 is lower for better matches; flip it so higher is better
+            "score": round(-row["score"], 4)
+        }
+        for row in rows
+    ]
+
+def main():
+    """Process command line arguments and search the transcripts"""
+    parser = argparse.ArgumentParser(description="Search the transcripts of processed conversations.")
+    parser.add_argument("query", nargs="?", help="Words to search for (end a word with * for prefix matches)")
+    parser.add_argument("--speaker", action="append", help="Only utterances by this speaker (repeatable)")
+    parser.add_argument("--conversation", action="append", help="Only this conversation (repeatable)")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT, help="Maximum number of results")
+    parser.add_argument("--processed-dir", default=PROCESSED_DIR, help="Processed conversations folder")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the search database from the archive")
+
+    args = parser.parse_args()
+
+    if args.rebuild:
+        count = rebuild_search_index(args.processed_dir)
+        print(f"Indexed {count} conversation(s) into {search_db_path(args.processed_dir)}")
+        if not args.query:
+            return
+
+    if not args.query:
+        parser.print_help()
+        sys.exit(1)
+
+    results = search_utterances(
+        args.query,
+        args.processed_dir,
+        speakers=args.speaker,
+        conversation_ids=args.conversation,
+        limit=args.limit
+    )
+
+    for result in results:
+        start = result["start_ms"] // 1000
+        print(f"{result['conversation_id']} {result['utterance_id']} "
+              f"[{start // 60:02d}:{start % 60:02d}] {result['speaker']}: {result['text']}")
+    print(f"\n{len(results)} result(s)")
+
+if __name__ == "__main__":
+    main()
@@ -17,16 +17,15 @@ os.environ["XDG_CACHE_HOME"] = cache_dir
 
 # Now import the rest
 import argparse
-from pinecone import Pinecone
+from vector_store import get_vector_store
 from nemo.collections.asr.models import EncDecSpeakerLabelModel
 import torch
 import numpy as np
 import uuid
 from sklearn.metrics.pairwise import cosine_similarity
 
-# Initialize Pinecone
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pc.Index("speaker-embeddings")
+# Shared Pinecone client
+index = get_vector_store()
 
 def get_existing_embeddings(speaker_name):
     """Get existing embeddings for a speaker from Pinecone"""
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Append-only log of finished utterances.
+
+While a conversation is being processed, each finished utterance is
+appended to utterances.jsonl as one JSON line. metadata.json is compacted
+from this log at the end. Until then readers can tail the log to see
+partial results, and after a crash the log can be compacted into a partial
+metadata.json with:
+
+    python utterance_log.py <conversation_dir>
+"""
+
+import os
+import sys
+import json
+from datetime import datetime
+
+from conversation_index import atomic_write_json
+
+UTTERANCE_LOG_FILE = "utterances.jsonl"
+
+def append_utterance(log_path, utterance):
+    """Append a finished (or updated) utterance record to the log"""
+    with open(log_path, 'a') as f:
+        f.write(json.dumps(utterance) + "\n")
+        f.flush()
+
+def read_utterance_log(log_path, offset=0):
+    """
+    Read the records appended to the log since a byte offset
+
+    Only complete lines are returned, so a reader never sees a record that
+    is still being written.
+
+    Args:
+        log_path: Path to utterances.jsonl
+        offset: Byte offset to start reading from
+
+    Returns:
+        tuple: (list of records, offset to continue from)
+    """
+    if not os.path.exists(log_path):
+        return [], offset
+
+    records = []
+    with open(log_path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            if line.strip():
+                records.append(json.loads(line))
+
+    return records, offset
+
+def compact_records(records):
+    """Collapse log records into one entry per utterance (the latest record wins)"""
+    utterances = {}
+    for record in records:
+        # Dicts keep first-insertion order, so utterances stay in log order
+        utterances[record["id"]] = record
+    return list(utterances.values())
+
+def recover_conversation(conversation_dir):
+    """Write a partial metadata.json from the utterance log of an interrupted run"""
+    records, _ = read_utterance_log(os.path.join(conversation_dir, UTTERANCE_LOG_FILE))
+    utterances = compact_records(records)
+    if not utterances:
+        print(f"No utterances logged in {conversation_dir}")
+        return None
+
+    original_audio = [f for f in os.listdir(conversation_dir) if f.startswith("original_audio")]
+    metadata = {
+        "conversation_id": os.path.basename(os.path.abspath(conversation_dir)),
+        "original_audio": original_audio[0] if original_audio else None,
+        "date_processed": datetime.now().isoformat(),
+        "duration_seconds": max(u["end_ms"] for u in utterances) / 1000,
+        "speakers": list(set(u["speaker"] for u in utterances)),
+        "utterances": utterances,
+        "partial": True
+    }
+
+    metadata_path = os.path.join(conversation_dir, "metadata.json")
+    atomic_write_json(metadata_path, metadata)
+
+    print(f"Recovered {len(utterances)} utterances into {metadata_path}")
+    return metadata
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python utterance_log.py <conversation_dir>")
+        sys.exit(1)
+
+    if recover_conversation(sys.argv[1]) is None:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
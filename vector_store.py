@@ -0,0 +1,347 @@
+"""
+Shared client for the Pinecone speaker-embeddings index.
+
+Every module used to open its own Pinecone connection and call it one
+vector at a time from whichever thread needed it. get_vector_store()
+returns a single client per process instead, which:
+
+- Keeps one connection pool for all jobs
+- Retries transient failures (rate limiting, 5xx, network errors) with
+  exponential backoff
+- Applies a request rate limit shared by all threads
+- Coalesces upserts from concurrent jobs into batched requests written by
+  a background flusher every few milliseconds (a batch rejected outright is
+  retried one vector at a time, so a bad vector only fails its own job)
+- Shares the result of identical queries that are in flight at the same time
+
+The client mirrors the parts of the Pinecone Index API used in this
+project (query, upsert, fetch, delete, list, describe_index_stats), so it is a
+drop-in replacement for pc.Index(...).
+"""
+
+import os
+import json
+import time
+import random
+import atexit
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from pinecone import Pinecone
+
+# Network errors of the HTTP client used by Pinecone
+try:
+    from urllib3.exceptions import HTTPError as Urllib3Error
+except ImportError:
+    Urllib3Error = None
+
+INDEX_NAME = "speaker-embeddings"
+
+# Connection pool and request settings
+POOL_THREADS = 8
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 0.25
+BACKOFF_MAX_SECONDS = 8.0
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Requests per second across all threads (burst up to RATE_LIMIT_BURST)
+RATE_LIMIT_PER_SECOND = 50
+RATE_LIMIT_BURST = 100
+
+# Upserts arriving within this window are sent together
+UPSERT_WINDOW_SECONDS = 0.05
+UPSERT_BATCH_SIZE = 100
+
+_store = None
+_store_lock = threading.Lock()
+
+class RateLimiter:
+    """Token bucket shared by every request of the client"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# Connection failures and timeouts (no HTTP status) that are worth retrying
+NETWORK_ERRORS = (ConnectionError, TimeoutError) + ((Urllib3Error,) if Urllib3Error else ())
+
+def _is_retryable(error):
+    """
+    Retry rate limiting, server errors and network failures
+
+    Anything else (bad arguments, authentication, programming errors) is
+    raised right away.
+    """
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return isinstance(error, NETWORK_ERRORS)
+
+class VectorStore:
+    """Thread-safe, batching and rate-limited wrapper around a Pinecone index"""
+
+    def __init__(self, index_name=INDEX_NAME, api_key=None, pool_threads=POOL_THREADS,
+                 rate_limit=RATE_LIMIT_PER_SECOND, burst=RATE_LIMIT_BURST):
+        client = Pinecone(api_key=api_key or os.getenv("PINECONE_API_KEY"), pool_threads=pool_threads)
+        self.index = client.Index(index_name, pool_threads=pool_threads)
+        self.executor = ThreadPoolExecutor(max_workers=pool_threads, thread_name_prefix="vector-store")
+        self.rate_limiter = RateLimiter(rate_limit, burst)
+
+        # Upserts waiting for the flusher: (vector, namespace, future)
+        self.pending_upserts = []
+        self.writing_batches = 0
+        self.upsert_condition = threading.Condition()
+
+        # Identical queries in flight share one request
+        self.inflight_queries = {}
+        self.inflight_lock = threading.Lock()
+
+        # Updated from every thread, always under upsert_condition (see _count)
+        self.stats = {"requests": 0, "retries": 0, "upsert_batches": 0, "vectors_upserted": 0,
+                      "batches_split": 0, "queries_shared": 0}
+
+        flusher = threading.Thread(target=self._flush_upserts, name="vector-store-flusher", daemon=True)
+        flusher.start()
+
+    def _count(self, stat, amount=1):
+        """Add to one of the client's statistics"""
+        with self.upsert_condition:
+            self.stats[stat] += amount
+
+    def _call(self, method, **kwargs):
+        """Call an index method under the rate limit, retrying transient errors"""
+        for attempt in range(MAX_RETRIES + 1):
+            self.rate_limiter.acquire()
+            self._count("requests")
+            try:
+                return method(**kwargs)
+            except Exception as e:
+                if attempt == MAX_RETRIES or not _is_retryable(e):
+                    raise
+                self._count("retries")
+                delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)
+                time.sleep(delay * (0.5 + random.random()))
+
+    def query(self, vector, top_k=10, **kwargs):
+        """
+        Query the index (blocking)
+
+        Concurrent identical queries are sent once and share the result.
+        """
+        vector = [float(v) for v in vector]
+        key = json.dumps([vector, top_k, kwargs], sort_keys=True, default=str)
+
+        with self.inflight_lock:
+            future = self.inflight_queries.get(key)
+            owner = future is None
+            if owner:
+                future = self.executor.submit(self._call, self.index.query, vector=vector, top_k=top_k, **kwargs)
+                self.inflight_queries[key] = future
+            else:
+                self._count("queries_shared")
+
+        try:
+            return future.result()
+        finally:
+            if owner:
+                with self.inflight_lock:
+                    self.inflight_queries.pop(key, None)
+
+    def upsert(self, vectors, namespace=None, wait=True):
+        """
+        Queue vectors for the next batched upsert
+
+        Args:
+            vectors: (id, values, metadata) tuples
+            namespace: Optional index namespace
+            wait: Block until the vectors are written (errors are raised here)
+
+        Returns:
+            Future: Resolved once every vector was written
+        """
+        futures = []
+        with self.upsert_condition:
+            for vector in vectors:
+                vector_id, values, *metadata = vector
+                future = Future()
+                self.pending_upserts.append(((vector_id, [float(v) for v in values], *metadata), namespace, future))
+                futures.append(future)
+            self.upsert_condition.notify()
+
+        # One future for the whole call, resolved when its last vector is written
+        done = Future()
+        remaining = [len(futures)]
+        resolve_lock = threading.Lock()
+        def resolve(_):
+            with resolve_lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            errors = [f.exception() for f in futures if f.exception()]
+            if errors:
+                done.set_exception(errors[0])
+            else:
+                done.set_result(len(futures))
+        for future in futures:
+            future.add_done_callback(resolve)
+        if not futures:
+            done.set_result(0)
+
+        if wait:
+            done.result()
+        return done
+
+    def _flush_upserts(self):
+        """Background loop writing queued upserts in batches"""
+        while True:
+            with self.upsert_condition:
+                while not self.pending_upserts:
+                    self.upsert_condition.wait()
+
+            # Let upserts from other jobs gather for a moment
+            time.sleep(UPSERT_WINDOW_SECONDS)
+
+            with self.upsert_condition:
+                batch = self.pending_upserts[:UPSERT_BATCH_SIZE]
+                del self.pending_upserts[:UPSERT_BATCH_SIZE]
+                self.writing_batches += 1
+
+            by_namespace = {}
+            for vector, namespace, future in batch:
+                by_namespace.setdefault(namespace, []).append((vector, future))
+
+            for namespace, items in by_namespace.items():
+                try:
+                    self._write_batch(namespace, items)
+                except Exception as e:
+                    if _is_retryable(e) or len(items) == 1:
+                        for _, future in items:
+                            future.set_exception(e)
+                        continue
+                    # Rejected outright: find the bad vectors by writing one at a time
+                    self._count("batches_split")
+                    for item in items:
+                        try:
+                            self._write_batch(namespace, [item])
+                        except Exception as item_error:
+                            item[1].set_exception(item_error)
+
+            with self.upsert_condition:
+                self.writing_batches -= 1
+                self.upsert_condition.notify_all()
+
+    def _write_batch(self, namespace, items):
+        """Upsert (vector, future) items in one request and resolve their futures"""
+        kwargs = {"vectors": [vector for vector, _ in items]}
+        if namespace:
+            kwargs["namespace"] = namespace
+        self._call(self.index.upsert, **kwargs)
+        with self.upsert_condition:
+            self.stats["upsert_batches"] += 1
+            self.stats["vectors_upserted"] += len(items)
+        for _, future in items:
+            future.set_result(True)
+
+    def flush(self, timeout=30):
+        """Wait until every queued upsert has been written"""
+        deadline = time.monotonic() + timeout
+        with self.upsert_condition:
+            while (self.pending_upserts or self.writing_batches) and time.monotonic() < deadline:
+                self.upsert_condition.wait(timeout=max(deadline - time.monotonic(), 0))
+
+    def fetch(self, ids, **kwargs):
+        return self._call(self.index.fetch, ids=ids, **kwargs)
+
+    def delete(self, **kwargs):
+        return self._call(self.index.delete, **kwargs)
+
+    def list(self, **kwargs):
+        """Yield pages of vector IDs, like Index.list (one rate-limited request per page)"""
+        pagination_token = None
+        while True:
+            page = self._call(self.index.list_paginated, pagination_token=pagination_token, **kwargs)
+            ids = [vector.id for vector in page.vectors]
+            if ids:
+                yield ids
+            pagination_token = page.pagination.next if page.pagination else None
+            if not pagination_token:
+                return
+
+    def describe_index_stats(self, **kwargs):
+        return self._call(self.index.describe_index_stats, **kwargs)
+
+class LocalQueryStore:
+    """
+    Answers queries from a local voice bank; writes still go to Pinecone
+
+    Upserts and deletes are sent to the Pinecone store (the bank of record)
+    and mirrored into the local bank, so later queries in the same process
+    see them. The snapshot on disk is not rewritten.
+    """
+
+    def __init__(self, bank, remote):
+        self.bank = bank
+        self.remote = remote
+
+    def query(self, vector, top_k=10, **kwargs):
+        return self.bank.query(vector=vector, top_k=top_k, **kwargs)
+
+    def upsert(self, vectors, namespace=None, wait=True):
+        vectors = list(vectors)
+        result = self.remote.upsert(vectors, namespace=namespace, wait=wait)
+        self.bank.upsert(vectors)
+        return result
+
+    def delete(self, ids=None, **kwargs):
+        result = self.remote.delete(ids=ids, **kwargs)
+        self.bank.delete(ids=ids)
+        return result
+
+    def fetch(self, ids, **kwargs):
+        return self.remote.fetch(ids=ids, **kwargs)
+
+    def list(self, **kwargs):
+        return self.remote.list(**kwargs)
+
+    def describe_index_stats(self, **kwargs):
+        return self.remote.describe_index_stats(**kwargs)
+
+    def flush(self, timeout=30):
+        self.remote.flush(timeout=timeout)
+
+def get_vector_store():
+    """
+    Get the vector store client shared by every module in this process
+
+    If LOCAL_VOICE_BANK points to a voice bank snapshot (see voice_bank.py),
+    queries are answered from that snapshot instead of Pinecone. Writes
+    still go to Pinecone (see LocalQueryStore).
+    """
+    global _store
+
+    with _store_lock:
+        if _store is None:
+            local_bank = os.getenv("LOCAL_VOICE_BANK")
+            if local_bank:
+                from voice_bank import LocalVoiceBank
+                _store = LocalQueryStore(LocalVoiceBank.load(local_bank), VectorStore())
+            else:
+                _store = VectorStore()
+            # Scripts often exit right after their last upsert
+            atexit.register(_store.flush)
+        return _store
@@ -0,0 +1,149 @@
+"""
+Energy-based voice activity detection (VAD) for conversation audio.
+
+The VAD is computed once per conversation on the decoded audio and then used
+to trim every utterance down to its voiced frames before it is embedded.
+Pure-silence utterances can be skipped entirely, which saves both the
+TitaNet inference and the vector database query.
+"""
+
+import numpy as np
+from pydub import AudioSegment
+
+# Frame size used for the energy analysis
+VAD_FRAME_MS = 30
+
+# A frame is voiced when its energy is this many dB above the noise floor
+VAD_THRESHOLD_DB = 12.0
+
+# Frames quieter than this are always treated as silence (dBFS)
+VAD_MIN_ENERGY_DBFS = -55.0
+
+# Pauses shorter than this are kept inside the voiced region
+VAD_MAX_PAUSE_MS = 300
+
+# Padding kept around each voiced region so word onsets are not clipped
+VAD_PADDING_MS = 60
+
+# Utterances with a lower speech ratio than this are treated as silence
+MIN_SPEECH_RATIO = 0.05
+
+def compute_voice_activity(audio, frame_ms=VAD_FRAME_MS, threshold_db=VAD_THRESHOLD_DB,
+                           min_energy_dbfs=VAD_MIN_ENERGY_DBFS, max_pause_ms=VAD_MAX_PAUSE_MS):
+    """
+    Compute a per-frame voiced/unvoiced mask for a whole conversation.
+
+    Args:
+        audio: pydub AudioSegment with the decoded conversation
+        frame_ms: Length of each analysis frame in milliseconds
+        threshold_db: Required energy above the estimated noise floor
+        min_energy_dbfs: Absolute energy floor below which frames are silent
+        max_pause_ms: Pauses shorter than this are bridged
+
+    Returns:
+        dict: VAD result with the frame size and a boolean numpy mask
+    """
+    # Work on mono samples normalised to [-1, 1]
+    if audio.channels > 1:
+        audio = audio.set_channels(1)
+    samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
+    samples /= float(1 << (8 * audio.sample_width - 1))
+
+    # Split into frames and compute the RMS energy of each one
+    frame_len = max(1, int(audio.frame_rate * frame_ms / 1000))
+    num_frames = len(samples) // frame_len
+    if num_frames == 0:
+        return {"frame_ms": frame_ms, "voiced": np.zeros(0, dtype=bool)}
+
+    frames = samples[:num_frames * frame_len].reshape(num_frames, frame_len)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1) + 1e-12)
+    energy_db = 20 * np.log10(rms)
+
+    # Estimate the noise floor from the quietest frames
+    noise_floor = np.percentile(energy_db, 10)
+    threshold = max(noise_floor + threshold_db, min_energy_dbfs)
+    voiced = energy_db >= threshold
+
+    # Bridge short pauses so words are not split into fragments
+    max_gap = int(max_pause_ms / frame_ms)
+    if max_gap > 0 and voiced.any():
+        voiced_idx = np.flatnonzero(voiced)
+        gaps = np.diff(voiced_idx)
+        for start, gap in zip(voiced_idx[:-1], gaps):
+            if 1 < gap <= max_gap + 1:
+                voiced[start:start + gap] = True
+
+    return {"frame_ms": frame_ms, "voiced": voiced}
+
+def get_voiced_regions(vad, start_ms, end_ms, padding_ms=VAD_PADDING_MS):
+    """
+    Get the voiced regions of an utterance from a conversation VAD result.
+
+    Args:
+        vad: Result of compute_voice_activity
+        start_ms: Utterance start in milliseconds
+        end_ms: Utterance end in milliseconds
+        padding_ms: Padding kept around each voiced region
+
+    Returns:
+        tuple: (list of (start_ms, end_ms) voiced regions, speech ratio)
+    """
+    frame_ms = vad["frame_ms"]
+    voiced = vad["voiced"]
+    duration_ms = end_ms - start_ms
+    if duration_ms <= 0:
+        return [], 0.0
+
+    # Frames that overlap the utterance
+    first = max(0, start_ms // frame_ms)
+    last = min(len(voiced), -(-end_ms // frame_ms))
+    window = voiced[first:last]
+    if window.size == 0:
+        # No VAD information for this span, keep the utterance untouched
+        return [(start_ms, end_ms)], 1.0
+
+    speech_ratio = float(window.mean())
+    if not window.any():
+        return [], 0.0
+
+    # Find runs of voiced frames
+    padded = np.concatenate(([False], window, [False]))
+    edges = np.flatnonzero(np.diff(padded.astype(np.int8)))
+    regions = []
+    for run_start, run_end in zip(edges[::2], edges[1::2]):
+        region_start = max(start_ms, (first + run_start) * frame_ms - padding_ms)
+        region_end = min(end_ms, (first + run_end) * frame_ms + padding_ms)
+        # Merge regions that touch after padding
+        if regions and region_start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], max(regions[-1][1], region_end))
+        elif region_end > region_start:
+            regions.append((region_start, region_end))
+
+    return regions, speech_ratio
+
+def trim_to_voiced(full_audio, vad, start_ms, end_ms):
+    """
+    Cut an utterance out of the conversation audio keeping only voiced frames.
+
+    Args:
+        full_audio: pydub AudioSegment with the whole conversation
+        vad: Result of compute_voice_activity (or None to skip trimming)
+        start_ms: Utterance start in milliseconds
+        end_ms: Utterance end in milliseconds
+
+    Returns:
+        tuple: (trimmed AudioSegment or None for pure silence, speech ratio)
+    """
+    if vad is None:
+        return full_audio[start_ms:end_ms], 1.0
+
+    regions, speech_ratio = get_voiced_regions(vad, start_ms, end_ms)
+    if not regions or speech_ratio < MIN_SPEECH_RATIO:
+        return None, speech_ratio
+
+    # Join the voiced regions, dropping leading/trailing silence and long pauses
+    trimmed = AudioSegment.empty()
+    for region_start, region_end in regions:
+        trimmed += full_audio[region_start:region_end]
+
+    return trimmed, speech_ratio
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+Compact local copy of the speaker database (voice bank).
+
+Embeddings come out of the model as float32 and are usually carried
+around as Python lists of floats (.tolist()), which costs several
+kilobytes per vector. LocalVoiceBank keeps the bank in contiguous arrays
+instead:
+
+- L2-normalized vectors quantized to int8 with one float32 scale per
+  vector (~200 bytes per embedding), scanned in blocks
+- The float32 vectors, memory-mapped from the snapshot, used only to
+  rescore the best candidates of the int8 scan exactly
+- Metadata in parallel arrays (speaker index, short flag, duration)
+  instead of one dict per vector; other metadata keys (e.g.
+  original_speaker_name, verified) are kept per vector only where present
+
+query() answers in the same shape as the Pinecone index, so a snapshot
+can be used for offline matching (set LOCAL_VOICE_BANK to the snapshot
+folder, see vector_store.get_vector_store). Pinecone stays the bank of
+record: with LOCAL_VOICE_BANK set, writes still go to Pinecone and are
+mirrored into the loaded snapshot, and the snapshot itself is only
+rewritten by save().
+
+    python voice_bank.py --snapshot voice_bank_snapshot   # Copy the Pinecone bank
+    python voice_bank.py --stats voice_bank_snapshot
+"""
+
+import os
+import sys
+import json
+import argparse
+import threading
+
+import numpy as np
+
+EMBEDDING_DIM = 192
+SNAPSHOT_VERSION = 1
+
+# Candidates from the int8 scan rescored exactly, per requested result
+RESCORE_FACTOR = 8
+SCAN_BLOCK_ROWS = 65536
+
+# Metadata keys stored in their own arrays; anything else goes to extra_metadata
+METADATA_COLUMNS = ("speaker_name", "source_file", "is_short_utterance", "duration_seconds")
+
+# IDs listed and fetched per request when reading a whole Pinecone index
+FETCH_BATCH_SIZE = 100
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        return vectors / max(float(np.linalg.norm(vectors)), 1e-12)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+def quantize(vectors):
+    """
+    Quantize normalized vectors to int8 with a per-vector scale
+
+    Returns:
+        tuple: (int8 codes, float32 scales) with vector ~= codes * scale
+    """
+    vectors = np.atleast_2d(vectors)
+    scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def iter_index_vectors(index, batch_size=FETCH_BATCH_SIZE):
+    """
+    Yield every vector of a Pinecone index as (id, values, metadata)
+
+    Queries return at most 1000 vectors with values or metadata, so the IDs
+    are listed page by page (index.list, serverless indexes only) and each
+    page is fetched. Vectors deleted after they were listed are skipped.
+    """
+    for page in index.list(limit=batch_size):
+        page = list(page)
+        vectors = index.fetch(ids=page)["vectors"]
+        for vector_id in page:
+            vector = vectors.get(vector_id)
+            if vector is not None:
+                yield vector_id, vector["values"], vector.get("metadata") or {}
+
+class LocalVoiceBank:
+    """In-memory speaker database with int8 scanning and exact float32 rescoring"""
+
+    __slots__ = (
+        "dim", "size", "codes", "scales", "base_vectors", "extra_vectors",
+        "ids", "id_rows", "speaker_rows", "speaker_names", "speaker_lookup",
+        "is_short", "durations", "source_files", "extra_metadata", "deleted", "lock"
+    )
+
+    def __init__(self, dim=EMBEDDING_DIM, capacity=1024):
+        self.dim = dim
+        self.size = 0
+        self.codes = np.zeros((capacity, dim), dtype=np.int8)
+        self.scales = np.zeros(capacity, dtype=np.float32)
+        self.base_vectors = np.zeros((0, dim), dtype=np.float32)  # Memory-mapped from a snapshot
+        self.extra_vectors = []                                   # Rows added since loading
+        self.ids = []
+        self.id_rows = {}
+        self.speaker_rows = np.zeros(capacity, dtype=np.int32)
+        self.speaker_names = []
+        self.speaker_lookup = {}
+        self.is_short = np.zeros(capacity, dtype=bool)
+        self.durations = np.zeros(capacity, dtype=np.float32)
+        self.source_files = []
+        self.extra_metadata = {}  # row -> metadata keys without a column
+        self.deleted = np.zeros(capacity, dtype=bool)
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return self.size - int(self.deleted[:self.size].sum())
+
+    def _grow(self, needed):
+        capacity = len(self.scales)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        for name in ("codes", "scales", "speaker_rows", "is_short", "durations", "deleted"):
+            old = getattr(self, name)
+            new = np.zeros((new_capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:capacity] = old
+            setattr(self, name, new)
+
+    def _speaker_row(self, speaker_name):
+        row = self.speaker_lookup.get(speaker_name)
+        if row is None:
+            row = len(self.speaker_names)
+            self.speaker_names.append(speaker_name)
+            self.speaker_lookup[speaker_name] = row
+        return row
+
+    def _float_vectors(self, rows):
+        """Exact vectors for some rows (from the snapshot file or recent additions)"""
+        base_count = len(self.base_vectors)
+        if len(self.extra_vectors) > 1:
+            self.extra_vectors = [np.concatenate(self.extra_vectors)]
+        extra = self.extra_vectors[0] if self.extra_vectors else np.zeros((0, self.dim), np.float32)
+        return np.stack([self.base_vectors[r] if r < base_count else extra[r - base_count] for r in rows])
+
+    def upsert(self, vectors, **kwargs):
+        """Add or replace (id, values, metadata) tuples, like the Pinecone index"""
+        with self.lock:
+            for vector_id, values, *rest in vectors:
+                metadata = rest[0] if rest else {}
+                if vector_id in self.id_rows:
+                    self.deleted[self.id_rows[vector_id]] = True
+                    self.extra_metadata.pop(self.id_rows[vector_id], None)
+
+                normalized = _normalize(values)
+                codes, scales = quantize(normalized)
+                row = self.size
+                self._grow(row + 1)
+                self.codes[row] = codes[0]
+                self.scales[row] = scales[0]
+                self.extra_vectors.append(normalized.reshape(1, -1))
+                self.speaker_rows[row] = self._speaker_row(metadata.get("speaker_name", ""))
+                self.is_short[row] = bool(metadata.get("is_short_utterance", False))
+                self.durations[row] = metadata.get("duration_seconds") or 0.0
+                self.deleted[row] = False
+                self.ids.append(vector_id)
+                self.source_files.append(metadata.get("source_file", ""))
+                extra = {k: v for k, v in metadata.items() if k not in METADATA_COLUMNS}
+                if extra:
+                    self.extra_metadata[row] = extra
+                self.id_rows[vector_id] = row
+                self.size += 1
+
+    def delete(self, ids=None, **kwargs):
+        """Remove vectors by ID"""
+        with self.lock:
+            for vector_id in ids or []:
+                row = self.id_rows.pop(vector_id, None)
+                if row is not None:
+                    self.deleted[row] = True
+                    self.extra_metadata.pop(row, None)
+
+    def _metadata(self, row):
+        metadata = {
+            "speaker_name": self.speaker_names[self.speaker_rows[row]],
+            "source_file": self.source_files[row],
+            "is_short_utterance": bool(self.is_short[row])
+        }
+        if self.durations[row]:
+            metadata["duration_seconds"] = float(self.durations[row])
+        metadata.update(self.extra_metadata.get(row, {}))
+        return metadata
+
+    def fetch(self, ids, **kwargs):
+        """Get vectors by ID, like the Pinecone index"""
+        vectors = {}
+        for vector_id in ids:
+            row = self.id_rows.get(vector_id)
+            if row is not None:
+                vectors[vector_id] = {
+                    "id": vector_id,
+                    "values": self._float_vectors([row])[0].tolist(),
+                    "metadata": self._metadata(row)
+                }
+        return {"vectors": vectors}
+
+    def _match_values(self, field, values):
+        """Rows whose metadata field equals one of values"""
+        if field == "speaker_name":
+            speaker_rows = [self.speaker_lookup[v] for v in values if v in self.speaker_lookup]
+            return np.isin(self.speaker_rows[:self.size], speaker_rows)
+        if field == "is_short_utterance":
+            return np.isin(self.is_short[:self.size], [bool(v) for v in values])
+        if field == "source_file":
+            return np.isin(np.array(self.source_files, dtype=object), list(values))
+        raise ValueError(f"Unsupported filter field: {field} (speaker_name, is_short_utterance and "
+                         "source_file can be filtered)")
+
+    def _filter_mask(self, filter):
+        """
+        Rows allowed by a Pinecone-style filter
+
+        Conditions on speaker_name, is_short_utterance and source_file with
+        $eq, $ne, $in and $nin (or a bare value for $eq) are supported; all
+        of them must hold.
+        """
+        mask = ~self.deleted[:self.size]
+        for field, condition in (filter or {}).items():
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for operator, value in condition.items():
+                if operator in ("$eq", "$ne"):
+                    matched = self._match_values(field, [value])
+                elif operator in ("$in", "$nin"):
+                    matched = self._match_values(field, list(value))
+                else:
+                    raise ValueError(f"Unsupported filter operator: {operator} (expected $eq, $ne, $in or $nin)")
+                mask &= ~matched if operator in ("$ne", "$nin") else matched
+        return mask
+
+    def query(self, vector, top_k=10, include_metadata=False, include_values=False, filter=None, **kwargs):
+        """
+        Find the closest vectors (cosine similarity), like the Pinecone index
+
+        The int8 codes are scanned in blocks, then the best top_k *
+        RESCORE_FACTOR candidates are rescored with their float32 vectors.
+        """
+        with self.lock:
+            mask = self._filter_mask(filter)
+            candidates = np.flatnonzero(mask)
+            if not len(candidates):
+                return {"matches": []}
+
+            query = _normalize(vector)
+            if not query.any():
+                # All-zero vector: metadata-only listing
+                rows, scores = candidates[:top_k], np.zeros(min(top_k, len(candidates)), dtype=np.float32)
+            else:
+                approximate = np.empty(len(candidates), dtype=np.float32)
+                for start in range(0, len(candidates), SCAN_BLOCK_ROWS):
+                    block = candidates[start:start + SCAN_BLOCK_ROWS]
+                    approximate[start:start + len(block)] = (self.codes[block] @ query) * self.scales[block]
+
+                count = min(len(candidates), top_k * RESCORE_FACTOR)
+                shortlist = candidates[np.argpartition(-approximate, count - 1)[:count]]
+
+                # Exact rescoring of the shortlist
+                exact = self._float_vectors(shortlist) @ query
+                order = np.argsort(-exact)[:top_k]
+                rows, scores = shortlist[order], exact[order]
+
+            matches = []
+            for row, score in zip(rows, scores):
+                match = {"id": self.ids[row], "score": float(score)}
+                if include_metadata:
+                    match["metadata"] = self._metadata(row)
+                if include_values:
+                    match["values"] = self._float_vectors([row])[0].tolist()
+                matches.append(match)
+            return {"matches": matches}
+
+    def describe_index_stats(self, **kwargs):
+        return {"dimension": self.dim, "total_vector_count": len(self)}
+
+    def flush(self, timeout=None):
+        """Nothing is queued; changes to a local bank stay in memory until save()"""
+
+    def memory_bytes(self):
+        """Approximate resident memory of the scan arrays and metadata"""
+        rows = self.size
+        extra_rows = sum(len(v) for v in self.extra_vectors)
+        return (
+            rows * (self.dim + 4 + 4 + 1 + 4 + 1)  # codes, scale, speaker, short, duration, deleted
+            + extra_rows * self.dim * 4             # Float32 rows not yet in a snapshot
+            + sum(len(s) + 49 for s in self.ids)    # ID strings
+        )
+
+    def save(self, path):
+        """
+        Write a snapshot folder (int8 codes, scales, float32 vectors, metadata)
+
+        Deleted rows are dropped.
+        """
+        with self.lock:
+            live = np.flatnonzero(~self.deleted[:self.size])
+            vectors = self._float_vectors(live) if len(live) else np.zeros((0, self.dim), np.float32)
+            arrays = {
+                "codes.npy": self.codes[live],
+                "scales.npy": self.scales[live],
+                "vectors.npy": vectors.astype(np.float32),
+                "metadata.npz": {
+                    "ids": np.array([self.ids[r] for r in live]),
+                    "speaker_rows": self.speaker_rows[live],
+                    "speaker_names": np.array(self.speaker_names),
+                    "is_short": self.is_short[live],
+                    "durations": self.durations[live],
+                    "source_files": np.array([self.source_files[r] for r in live])
+                }
+            }
+
+            # Replace files atomically: a loaded bank may still map vectors.npy
+            os.makedirs(path, exist_ok=True)
+            for name, data in arrays.items():
+                temp_path = os.path.join(path, f".{name}.tmp")
+                with open(temp_path, "wb") as f:
+                    if isinstance(data, dict):
+                        np.savez(f, **data)
+                    else:
+                        np.save(f, data)
+                os.replace(temp_path, os.path.join(path, name))
+            extra_metadata = {self.ids[r]: self.extra_metadata[r] for r in live if r in self.extra_metadata}
+            temp_path = os.path.join(path, ".extra_metadata.json.tmp")
+            with open(temp_path, "w") as f:
+                json.dump(extra_metadata, f)
+            os.replace(temp_path, os.path.join(path, "extra_metadata.json"))
+            with open(os.path.join(path, "snapshot.json"), "w") as f:
+                json.dump({"version": SNAPSHOT_VERSION, "dim": self.dim, "count": int(len(live))}, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        """Load a snapshot; the float32 vectors stay on disk (memory-mapped)"""
+        with open(os.path.join(path, "snapshot.json"), "r") as f:
+            info = json.load(f)
+        if info.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported voice bank snapshot version: {info.get('version')}")
+
+        bank = cls(dim=info["dim"], capacity=max(info["count"], 1))
+        count = info["count"]
+        bank.codes[:count] = np.load(os.path.join(path, "codes.npy"))
+        bank.scales[:count] = np.load(os.path.join(path, "scales.npy"))
+        bank.base_vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+
+        with np.load(os.path.join(path, "metadata.npz")) as metadata:
+            bank.ids = [str(i) for i in metadata["ids"]]
+            bank.speaker_names = [str(n) for n in metadata["speaker_names"]]
+            bank.speaker_rows[:count] = metadata["speaker_rows"]
+            bank.is_short[:count] = metadata["is_short"]
+            bank.durations[:count] = metadata["durations"]
+            bank.source_files = [str(s) for s in metadata["source_files"]]
+
+        bank.speaker_lookup = {name: row for row, name in enumerate(bank.speaker_names)}
+        bank.id_rows = {vector_id: row for row, vector_id in enumerate(bank.ids)}
+
+        # Snapshots written before extra metadata was kept don't have the file
+        extra_path = os.path.join(path, "extra_metadata.json")
+        if os.path.exists(extra_path):
+            with open(extra_path, "r") as f:
+                bank.extra_metadata = {bank.id_rows[i]: extra for i, extra in json.load(f).items() if i in bank.id_rows}
+        bank.size = count
+        return bank
+
+    @classmethod
+    def from_index(cls, index, dim=EMBEDDING_DIM):
+        """Copy every vector of a Pinecone index into a local bank (see iter_index_vectors)"""
+        bank = cls(dim=dim)
+        bank.upsert(iter_index_vectors(index))
+        return bank
+
+def main():
+    """Process command line arguments and manage voice bank snapshots"""
+    parser = argparse.ArgumentParser(description="Manage compact local snapshots of the speaker database.")
+    parser.add_argument("path", help="Snapshot folder")
+    parser.add_argument("--snapshot", action="store_true", help="Copy the Pinecone speaker database into the folder")
+    parser.add_argument("--stats", action="store_true", help="Show the size of a snapshot")
+
+    args = parser.parse_args()
+
+    if args.snapshot:
+        from vector_store import get_vector_store
+        bank = LocalVoiceBank.from_index(get_vector_store())
+        bank.save(args.path)
+        print(f"Saved {len(bank)} embeddings of {len(bank.speaker_names)} speakers to {args.path}")
+    elif args.stats:
+        bank = LocalVoiceBank.load(args.path)
+        as_lists = len(bank) * (bank.dim * 32 + 64)  # Python list of floats per vector
+        print(f"Embeddings: {len(bank)}")
+        print(f"Speakers: {len(bank.speaker_names)}")
+        print(f"Resident memory: {bank.memory_bytes() / 1024:.1f} KiB "
+              f"(vs ~{as_lists / 1024:.1f} KiB as Python float lists)")
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,548 @@
+#!/usr/bin/env python3
+"""
+Query-by-voice search across every processed utterance.
+
+Finds the utterances in the archive that sound most like a clip, using an
+approximate nearest-neighbor (IVF) index built locally from the stored
+per-conversation embeddings (embeddings.npy):
+
+- The vectors are grouped into inverted lists around k-means centroids
+- A query is compared with the centroids and only the closest lists are scanned
+
+The index lives in processed_conversations/voice_index/. New conversations
+are added incrementally as segment files, and deleted or reprocessed
+conversations are dropped. When the archive has grown well past the size
+the centroids were trained on, the centroids are retrained and the segments
+are merged.
+
+Writers (syncs and rebuilds) hold a file lock on the index. Readers take no
+lock: files are never changed once written, the manifest names the segments
+and centroids to use, and replaced files are only deleted once no reader can
+still be loading them. Searches use the index as it is; the backend extends
+it in the background when conversations are added or deleted (see
+request_voice_index_sync).
+
+    python voice_search.py clip.wav --top-k 20
+    python voice_search.py --sync
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+
+import numpy as np
+from pydub import AudioSegment
+
+from speaker_id_testing import (
+    PROCESSED_DIR,
+    EMBEDDING_MODEL_VERSION,
+    EMBEDDING_DIM,
+    load_speaker_model,
+    load_conversation_embeddings,
+    get_segment_embedding,
+    embedding_to_numpy,
+)
+from conversation_index import load_index, atomic_write_json
+
+# File locks between processes writing the index (not available on Windows)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+VOICE_INDEX_DIR = "voice_index"
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = "index.lock"
+CENTROIDS_FILE = "centroids.npy"  # Unversioned name used by older indexes
+VOICE_INDEX_VERSION = 1
+
+# Replaced segments and centroids are kept this long for readers still loading them
+RETIRED_FILE_GRACE_SECONDS = 600
+
+# Index settings
+MIN_TRAIN_ROWS = 1024        # Below this a single list is used (exact search)
+TRAIN_SAMPLE_ROWS = 65536    # Vectors sampled to train the centroids
+KMEANS_ITERATIONS = 10
+RETRAIN_GROWTH = 4.0         # Retrain once the index is this many times the training size
+DEFAULT_NPROBE = 16          # Lists scanned per query
+DEFAULT_TOP_K = 20
+
+# Serializes index writes in this process
+_index_lock = threading.RLock()
+
+# Loaded index shared by queries in this process
+_loaded = {"key": None, "index": None}
+_loaded_lock = threading.Lock()
+
+# Background syncs per processed folder (see request_voice_index_sync)
+_background_syncs = {}
+_background_lock = threading.Lock()
+
+def _index_dir(processed_dir):
+    return os.path.join(processed_dir, VOICE_INDEX_DIR)
+
+class _WriteLock:
+    """Cross-process lock held while the index is synced or rebuilt (no-op without fcntl)"""
+
+    def __init__(self, processed_dir):
+        self.path = os.path.join(_index_dir(processed_dir), LOCK_FILE)
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        return self.file
+
+    def __exit__(self, *exc):
+        self.file.close()  # Closing releases the lock
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def _nlist_for(rows):
+    """Number of inverted lists for an index of this size"""
+    if rows < MIN_TRAIN_ROWS:
+        return 1
+    return int(min(max(4 * np.sqrt(rows), 1), 65536))
+
+def _assign(vectors, centroids, batch_size=65536):
+    """Assign each vector to its nearest centroid (cosine)"""
+    lists = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), batch_size):
+        batch = np.asarray(vectors[start:start + batch_size], dtype=np.float32)
+        lists[start:start + batch_size] = np.argmax(batch @ centroids.T, axis=1)
+    return lists
+
+def train_centroids(vectors, nlist, seed=0):
+    """
+    Train spherical k-means centroids on (a sample of) the vectors
+
+    Args:
+        vectors: Normalized vectors
+        nlist: Number of centroids
+
+    Returns:
+        numpy.ndarray: Normalized centroid matrix (nlist x dim)
+    """
+    rng = np.random.default_rng(seed)
+    if len(vectors) > TRAIN_SAMPLE_ROWS:
+        vectors = vectors[rng.choice(len(vectors), TRAIN_SAMPLE_ROWS, replace=False)]
+    vectors = np.asarray(vectors, dtype=np.float32)
+
+    nlist = min(nlist, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+
+    for _ in range(KMEANS_ITERATIONS):
+        lists = _assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, lists, vectors)
+        counts = np.bincount(lists, minlength=nlist)
+
+        # Re-seed empty lists with random vectors
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+
+    return centroids
+
+def _load_manifest(processed_dir):
+    try:
+        with open(os.path.join(_index_dir(processed_dir), MANIFEST_FILE), 'r') as f:
+            manifest = json.load(f)
+        if manifest.get("version") == VOICE_INDEX_VERSION and manifest.get("model") == EMBEDDING_MODEL_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {
+        "version": VOICE_INDEX_VERSION,
+        "model": EMBEDDING_MODEL_VERSION,
+        "dim": EMBEDDING_DIM,
+        "trained_rows": 0,
+        "next_segment": 0,
+        "segments": [],
+        "conversations": {},
+        "centroids": None,
+        "next_centroids": 0,
+        "retired": []
+    }
+
+def _load_centroids(processed_dir, manifest):
+    """Load the centroids named in the manifest (a single zero centroid before training)"""
+    name = manifest.get("centroids", CENTROIDS_FILE)
+    path = os.path.join(_index_dir(processed_dir), name) if name else None
+    if path and os.path.exists(path):
+        return np.load(path)
+    return np.zeros((1, EMBEDDING_DIM), dtype=np.float32)
+
+def _retire(manifest, names):
+    """Mark files the manifest no longer uses for deletion after the grace period"""
+    now = time.time()
+    manifest.setdefault("retired", []).extend({"file": name, "retired_at": now} for name in names)
+
+def _remove_retired(processed_dir, manifest):
+    """
+    Delete retired files that no reader can still be loading
+
+    Returns:
+        bool: Whether the manifest changed
+    """
+    cutoff = time.time() - RETIRED_FILE_GRACE_SECONDS
+    retired = manifest.get("retired", [])
+    kept = [entry for entry in retired if entry["retired_at"] > cutoff]
+    for entry in retired:
+        if entry["retired_at"] <= cutoff:
+            try:
+                os.remove(os.path.join(_index_dir(processed_dir), entry["file"]))
+            except FileNotFoundError:
+                pass
+    manifest["retired"] = kept
+    return len(kept) != len(retired)
+
+def _read_conversation_vectors(processed_dir, conversation_id):
+    """Get the normalized embeddings and utterance ids of a conversation"""
+    conversation_dir = os.path.join(processed_dir, conversation_id)
+    with open(os.path.join(conversation_dir, "metadata.json"), 'r') as f:
+        metadata = json.load(f)
+
+    embeddings = load_conversation_embeddings(conversation_dir, metadata)
+    if embeddings is None:
+        return None, []
+
+    # Skip utterances that were never embedded (all-zero rows)
+    keep = np.flatnonzero(np.any(embeddings != 0, axis=1))
+    utterance_ids = [metadata["utterances"][i]["id"] for i in keep]
+    return _normalize(embeddings[keep]), utterance_ids
+
+def _write_segment(processed_dir, manifest, conversation_ids, vectors, utterance_ids, centroids):
+    """Write vectors as a new segment file and register it in the manifest"""
+    name = f"segment_{manifest['next_segment']:06d}.npz"
+    manifest["next_segment"] += 1
+
+    path = os.path.join(_index_dir(processed_dir), name)
+    temp_path = path + ".tmp.npz"
+    np.savez(
+        temp_path,
+        vectors=vectors.astype(np.float16),
+        lists=_assign(vectors, centroids),
+        conversation_ids=np.array(conversation_ids),
+        utterance_ids=np.array(utterance_ids)
+    )
+    os.replace(temp_path, path)
+
+    manifest["segments"].append(name)
+    for conversation_id in set(conversation_ids):
+        manifest["conversations"][conversation_id] = name
+    return name
+
+def _load_segments(processed_dir, manifest):
+    """Load the live rows of every segment with their inverted list assignments"""
+    vectors, lists, conversation_ids, utterance_ids = [], [], [], []
+    for name in manifest["segments"]:
+        with np.load(os.path.join(_index_dir(processed_dir), name)) as segment:
+            conversations = segment["conversation_ids"]
+            # Rows of deleted or re-added conversations are dead
+            unique, inverse = np.unique(conversations, return_inverse=True)
+            live = np.array([manifest["conversations"].get(c) == name for c in unique], dtype=bool)[inverse]
+            vectors.append(segment["vectors"][live])
+            lists.append(segment["lists"][live])
+            conversation_ids.append(conversations[live])
+            utterance_ids.append(segment["utterance_ids"][live])
+
+    if not vectors:
+        return (np.zeros((0, EMBEDDING_DIM), dtype=np.float16), np.zeros(0, dtype=np.int32),
+                np.array([]), np.array([]))
+    return np.concatenate(vectors), np.concatenate(lists), np.concatenate(conversation_ids), np.concatenate(utterance_ids)
+
+def rebuild_segments(processed_dir, manifest):
+    """
+    Retrain the centroids on all live vectors and merge them into one segment
+
+    The caller holds the write lock. The new centroids get a new file name
+    and the replaced files are retired, so readers of the previous manifest
+    can keep loading it.
+    """
+    vectors, _, conversation_ids, utterance_ids = _load_segments(processed_dir, manifest)
+    vectors = vectors.astype(np.float32)
+
+    centroids = train_centroids(vectors, _nlist_for(len(vectors))) if len(vectors) else \
+        np.zeros((1, EMBEDDING_DIM), dtype=np.float32)
+    centroids_name = f"centroids_{manifest.get('next_centroids', 0):06d}.npy"
+    manifest["next_centroids"] = manifest.get("next_centroids", 0) + 1
+    centroids_path = os.path.join(_index_dir(processed_dir), centroids_name)
+    with open(centroids_path + ".tmp", "wb") as f:
+        np.save(f, centroids)
+    os.replace(centroids_path + ".tmp", centroids_path)
+
+    old_centroids = manifest.get("centroids", CENTROIDS_FILE)
+    _retire(manifest, manifest["segments"] + ([old_centroids] if old_centroids else []))
+    manifest["centroids"] = centroids_name
+    manifest["segments"] = []
+    manifest["conversations"] = {}
+    manifest["trained_rows"] = len(vectors)
+    if len(vectors):
+        _write_segment(processed_dir, manifest, list(conversation_ids), vectors, list(utterance_ids), centroids)
+
+    atomic_write_json(os.path.join(_index_dir(processed_dir), MANIFEST_FILE), manifest)
+
+def sync_voice_index(processed_dir=PROCESSED_DIR):
+    """
+    Bring the voice index up to date with the archive
+
+    Conversations added since the last sync are written as one new segment,
+    and deleted conversations are dropped. Only new conversations are read.
+
+    Returns:
+        dict: Number of added and removed conversations and total live rows
+    """
+    with _index_lock, _WriteLock(processed_dir):
+        manifest = _load_manifest(processed_dir)
+        archive = load_index(processed_dir)["conversations"]
+        manifest_path = os.path.join(_index_dir(processed_dir), MANIFEST_FILE)
+        changed = _remove_retired(processed_dir, manifest) or not os.path.exists(manifest_path)
+
+        removed = [c for c in manifest["conversations"] if c not in archive]
+        for conversation_id in removed:
+            del manifest["conversations"][conversation_id]
+
+        added_conversations, added_vectors, added_utterances = [], [], []
+        for conversation_id in sorted(archive):
+            if conversation_id in manifest["conversations"]:
+                continue
+            try:
+                vectors, utterance_ids = _read_conversation_vectors(processed_dir, conversation_id)
+            except (OSError, ValueError) as e:
+                print(f"Skipping {conversation_id} in voice index: {e}")
+                continue
+            if vectors is None or not len(vectors):
+                continue
+            added_vectors.append(vectors)
+            added_conversations.extend([conversation_id] * len(vectors))
+            added_utterances.extend(utterance_ids)
+
+        summary = {"added": len(set(added_conversations)), "removed": len(removed)}
+        if not added_vectors and not removed:
+            if changed:
+                atomic_write_json(manifest_path, manifest)
+            summary["rows"] = _load_index(processed_dir)["size"]
+            return summary
+
+        if added_vectors:
+            vectors = np.concatenate(added_vectors)
+            centroids = _load_centroids(processed_dir, manifest)
+            _write_segment(processed_dir, manifest, added_conversations, vectors, added_utterances, centroids)
+        atomic_write_json(manifest_path, manifest)
+
+        # Retrain once the index has outgrown its centroids
+        live_rows = _load_index(processed_dir)["size"]
+        trained_rows = manifest["trained_rows"]
+        if _nlist_for(live_rows) > 1 and (trained_rows == 0 or live_rows >= RETRAIN_GROWTH * trained_rows):
+            print(f"Retraining voice index centroids on {live_rows} vectors...")
+            rebuild_segments(processed_dir, manifest)
+            live_rows = _load_index(processed_dir)["size"]
+
+        summary["rows"] = live_rows
+        return summary
+
+def rebuild_voice_index(processed_dir=PROCESSED_DIR):
+    """Retrain the centroids and merge the segments of an up-to-date index"""
+    with _index_lock, _WriteLock(processed_dir):
+        rebuild_segments(processed_dir, _load_manifest(processed_dir))
+
+def request_voice_index_sync(processed_dir=PROCESSED_DIR):
+    """
+    Sync the voice index in a background thread (never blocks)
+
+    Requests made while a sync is running are coalesced into one more sync.
+    """
+    processed_dir = os.path.abspath(processed_dir)
+    with _background_lock:
+        state = _background_syncs.setdefault(processed_dir, {"running": False, "requested": False})
+        if state["running"]:
+            state["requested"] = True
+            return
+        state["running"] = True
+    threading.Thread(target=_run_background_syncs, args=(processed_dir, state), name="voice-index-sync",
+                     daemon=True).start()
+
+def _run_background_syncs(processed_dir, state):
+    while True:
+        try:
+            sync_voice_index(processed_dir)
+        except Exception as e:
+            print(f"Voice index sync failed: {e}")
+        with _background_lock:
+            if not state["requested"]:
+                state["running"] = False
+                return
+            state["requested"] = False
+
+def _load_index(processed_dir):
+    """
+    Load the index into memory, grouped by inverted list
+
+    The loaded index is cached until the manifest changes.
+    """
+    with _loaded_lock:
+        manifest_path = os.path.join(_index_dir(processed_dir), MANIFEST_FILE)
+        key = (os.path.abspath(processed_dir), os.stat(manifest_path).st_mtime_ns if os.path.exists(manifest_path) else None)
+        if _loaded["key"] == key:
+            return _loaded["index"]
+
+        manifest = _load_manifest(processed_dir)
+        vectors, lists, conversation_ids, utterance_ids = _load_segments(processed_dir, manifest)
+
+        centroids = _load_centroids(processed_dir, manifest)
+
+        # Sort rows by list so each list is a contiguous block
+        order = np.argsort(lists, kind="stable")
+        offsets = np.searchsorted(lists[order], np.arange(len(centroids) + 1))
+
+        index = {
+            "centroids": centroids,
+            "vectors": vectors[order],
+            "conversation_ids": conversation_ids[order],
+            "utterance_ids": utterance_ids[order],
+            "offsets": offsets,
+            "size": len(vectors)
+        }
+        _loaded["key"] = key
+        _loaded["index"] = index
+        return index
+
+def search_by_embedding(embedding, processed_dir=PROCESSED_DIR, top_k=DEFAULT_TOP_K, nprobe=DEFAULT_NPROBE,
+                        min_similarity=None):
+    """
+    Find the processed utterances closest to an embedding
+
+    Args:
+        embedding: Query voice embedding
+        processed_dir: Path to the processed conversations folder
+        top_k: Number of results
+        nprobe: Number of inverted lists scanned
+        min_similarity: Drop results below this cosine similarity
+
+    Returns:
+        list: Results with conversation_id, utterance_id and similarity, best first
+    """
+    index = _load_index(processed_dir)
+    if index["size"] == 0:
+        return []
+
+    query = _normalize(embedding_to_numpy(embedding).reshape(1, -1))[0]
+
+    # Scan only the lists whose centroids are closest to the query
+    nprobe = min(nprobe, len(index["centroids"]))
+    probed = np.argpartition(-(index["centroids"] @ query), nprobe - 1)[:nprobe]
+    rows = np.concatenate([
+        np.arange(index["offsets"][l], index["offsets"][l + 1]) for l in probed
+    ])
+    if not len(rows):
+        return []
+
+    scores = index["vectors"][rows].astype(np.float32) @ query
+    k = min(top_k, len(rows))
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best])]
+
+    results = []
+    for i in best:
+        if min_similarity is not None and scores[i] < min_similarity:
+            break
+        row = rows[i]
+        results.append({
+            "conversation_id": str(index["conversation_ids"][row]),
+            "utterance_id": str(index["utterance_ids"][row]),
+            "similarity": float(scores[i])
+        })
+    return results
+
+def describe_results(results, processed_dir=PROCESSED_DIR):
+    """Add the current speaker, text and timestamps from each conversation's metadata"""
+    by_conversation = {}
+    for result in results:
+        by_conversation.setdefault(result["conversation_id"], []).append(result)
+
+    for conversation_id, conversation_results in by_conversation.items():
+        try:
+            with open(os.path.join(processed_dir, conversation_id, "metadata.json"), 'r') as f:
+                utterances = {u["id"]: u for u in json.load(f).get("utterances", [])}
+        except (OSError, ValueError):
+            utterances = {}
+        for result in conversation_results:
+            utterance = utterances.get(result["utterance_id"], {})
+            result["speaker"] = utterance.get("speaker")
+            result["text"] = utterance.get("text", "")
+            result["start_ms"] = utterance.get("start_ms", 0)
+            result["end_ms"] = utterance.get("end_ms", 0)
+    return results
+
+def search_by_clip(audio_segment, processed_dir=PROCESSED_DIR, top_k=DEFAULT_TOP_K, nprobe=DEFAULT_NPROBE,
+                   min_similarity=None, speaker_model=None):
+    """
+    Find the processed utterances that sound like an audio clip
+
+    Args:
+        audio_segment: Query clip (pydub AudioSegment)
+        speaker_model: Loaded speaker recognition model (loaded if not given)
+
+    Returns:
+        list: Described results, best first
+    """
+    if speaker_model is None:
+        speaker_model = load_speaker_model()
+    # Only a missing index is built here; otherwise it's kept up to date by syncs
+    if not os.path.exists(os.path.join(_index_dir(processed_dir), MANIFEST_FILE)):
+        sync_voice_index(processed_dir)
+
+    embedding = get_segment_embedding(audio_segment, speaker_model)
+    results = search_by_embedding(embedding, processed_dir, top_k, nprobe, min_similarity)
+    return describe_results(results, processed_dir)
+
+def main():
+    """Process command line arguments and search the archive by voice"""
+    parser = argparse.ArgumentParser(description="Find processed utterances that sound like an audio clip.")
+    parser.add_argument("audio_file", nargs="?", help="Query audio clip")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K, help="Number of results")
+    parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE,
+                        help="Inverted lists scanned per query (higher is slower but more exact)")
+    parser.add_argument("--min-similarity", type=float, help="Drop results below this similarity")
+    parser.add_argument("--sync", action="store_true", help="Only bring the voice index up to date")
+    parser.add_argument("--rebuild", action="store_true", help="Retrain the index centroids and merge segments")
+
+    args = parser.parse_args()
+
+    if args.sync or args.rebuild:
+        summary = sync_voice_index()
+        if args.rebuild:
+            rebuild_voice_index()
+        print(f"Voice index: {summary['added']} conversation(s) added, {summary['removed']} removed")
+        if not args.audio_file:
+            return
+
+    if not args.audio_file:
+        parser.print_help()
+        sys.exit(1)
+
+    results = search_by_clip(
+        AudioSegment.from_file(args.audio_file),
+        top_k=args.top_k,
+        nprobe=args.nprobe,
+        min_similarity=args.min_similarity
+    )
+
+    print(f"\nUtterances that sound like {args.audio_file}:")
+    print("=" * 50)
+    for result in results:
+        start = result["start_ms"] // 1000
+        print(f"{result['similarity']:.4f}  {result['conversation_id']} {result['utterance_id']} "
+              f"[{start // 60:02d}:{start % 60:02d}] {result['speaker']}: {result['text']}")
+
+if __name__ == "__main__":
+    main()